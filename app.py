@@ -40,4 +40,8 @@ st.markdown("---")
 st.info("👈 Use the sidebar to navigate between pages")
 
 st.markdown("---")
-st.caption("Developed with Streamlit | Powered by Machine Learning")
\ No newline at end of file
+st.caption("Developed with Streamlit | Powered by Machine Learning")
+
+# The page is on screen: load the models in the background before the first prediction
+from utils.warmup import start_warmup
+start_warmup()
@@ -0,0 +1,60 @@
+"""
+Benchmark: cost of calibration and risk banding against the prediction
+
+Times the fast-path prediction and DecisionPolicy.decide per applicant
+at several batch sizes, for each calibration method. The isotonic and
+Platt maps are fitted on synthetic outcomes, so the numbers measure cost
+only, not calibration quality.
+"""
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+
+# Add parent directory to path to import utils
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.calibration import Calibrator, DecisionPolicy, fit_calibrator
+from utils.fast_path import build_fast_predictor
+from utils.model_files import MODEL_DIR, load_pickles
+from utils.synthetic import synthetic_records
+
+BATCH_SIZES = [1, 100, 10_000, 1_000_000]
+PREDICT_ROWS = 10_000
+REPEATS = 5
+
+
+def per_row_us(fn, rows):
+    fn()
+    best = float('inf')
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best / rows * 1e6
+
+
+def main():
+    warnings.filterwarnings('ignore')
+    fast = build_fast_predictor(*load_pickles(MODEL_DIR))
+    X = fast.scaled_rows(synthetic_records(PREDICT_ROWS, seed=0))
+    proba = fast.predict_scaled(X)[1][:, 1]
+    labels = np.random.default_rng(0).random(len(proba)) < np.sqrt(proba)
+    policies = {
+        'identity': DecisionPolicy(Calibrator()),
+        'isotonic': DecisionPolicy(fit_calibrator(proba, labels, 'isotonic')),
+        'platt': DecisionPolicy(fit_calibrator(proba, labels, 'platt')),
+    }
+
+    predict = {n: per_row_us(lambda: fast.predict_scaled(X[:n]), n) for n in BATCH_SIZES if n <= PREDICT_ROWS}
+    print(f"{'rows':>8} {'predict (us/row)':>17} " + ' '.join(f"{name + ' (us/row)':>19}" for name in policies))
+    for n in BATCH_SIZES:
+        p = np.resize(proba, n)
+        decide = [per_row_us(lambda: policy.decide(p), n) for policy in policies.values()]
+        predicted = f"{predict[n]:>17.3f}" if n in predict else f"{'-':>17}"
+        print(f"{n:>8} {predicted} " + ' '.join(f"{us:>19.4f}" for us in decide))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Benchmark: cost of inline drift monitoring against the prediction
+
+Times the fast-path prediction and DriftMonitor.observe per applicant at
+several batch sizes, and the cost of building a drift report, which does
+not grow with the rows observed.
+"""
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+
+# Add parent directory to path to import utils
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.drift import DriftMonitor, DriftSketch
+from utils.fast_path import build_fast_predictor
+from utils.model_files import MODEL_DIR, load_pickles
+from utils.synthetic import synthetic_records
+
+BATCH_SIZES = [1, 100, 10_000]
+REPEATS = 5
+
+
+def per_row_us(fn, rows):
+    fn()
+    best = float('inf')
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best / rows * 1e6
+
+
+def main():
+    warnings.filterwarnings('ignore')
+    fast = build_fast_predictor(*load_pickles(MODEL_DIR))
+    X = fast.scaled_rows(synthetic_records(max(BATCH_SIZES), seed=0))
+    classes, proba, emi = fast.predict_scaled(X)
+    reference = DriftSketch(len(fast.classes))
+    reference.observe(X, np.searchsorted(fast.classes, classes), proba[:, 1], emi)
+    monitor = DriftMonitor(fast.mean, fast.scale, fast.classes, reference)
+
+    print(f"{'rows':>8} {'predict (us/row)':>17} {'observe (us/row)':>17} {'overhead':>9}")
+    for n in BATCH_SIZES:
+        predict = per_row_us(lambda: fast.predict_scaled(X[:n]), n)
+        observe = per_row_us(lambda: monitor.observe(X[:n], classes[:n], proba[:n, 1], emi[:n]), n)
+        print(f"{n:>8} {predict:>17.3f} {observe:>17.3f} {observe / predict:>9.1%}")
+    start = time.perf_counter()
+    report = monitor.report()
+    print(f"report of {report['rows']:,} rows: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+Benchmark: cost of TreeSHAP explanations against the prediction itself
+
+Times explain_scaled and the fast-path prediction at several batch sizes,
+per applicant, to size the background explanation worker.
+"""
+import os
+import sys
+import time
+import warnings
+
+# Add parent directory to path to import utils
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.explain import explain_scaled
+from utils.fast_path import build_fast_predictor
+from utils.model_files import MODEL_DIR, load_pickles
+from utils.synthetic import synthetic_records
+
+BATCH_SIZES = [1, 10, 100, 1000]
+REPEATS = 5
+
+
+def per_row_ms(fn, rows):
+    fn()
+    best = float('inf')
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best / rows * 1000
+
+
+def main():
+    warnings.filterwarnings('ignore')
+    classification_model, regression_model, scaler = load_pickles(MODEL_DIR)
+    fast = build_fast_predictor(classification_model, regression_model, scaler)
+    X_all = fast.scaled_rows(synthetic_records(BATCH_SIZES[-1], seed=0))
+    classes_all = fast.predict_scaled(X_all)[0]
+
+    print(f"{'rows':>6} {'predict (ms/row)':>17} {'explain (ms/row)':>17} {'ratio':>7}")
+    for n in BATCH_SIZES:
+        X, classes = X_all[:n], classes_all[:n]
+        predict = per_row_ms(lambda: fast.predict_scaled(X), n)
+        explain = per_row_ms(lambda: explain_scaled(X, classes, classification_model, regression_model), n)
+        print(f"{n:>6} {predict:>17.3f} {explain:>17.3f} {explain / predict:>7.1f}")
+
+
+if __name__ == '__main__':
+    main()
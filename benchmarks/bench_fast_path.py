@@ -0,0 +1,76 @@
+"""
+Per-request latency of single-applicant scoring: pandas path vs FastPredictor
+
+The pandas path is what the Prediction page did: DataFrame ->
+engineer_features -> prepare_features_for_prediction -> scaler.transform
+-> predict / predict_proba, then the regressor on its input sliced with
+the predicted class (SCHEMA.regression_input). Outputs of both paths are
+compared for exact equality; the script exits 1 if they differ.
+
+Usage: python benchmarks/bench_fast_path.py [requests]
+"""
+import sys
+import os
+import time
+import warnings
+import numpy as np
+import pandas as pd
+
+# Add parent directory to path to import utils
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.fast_path import build_fast_predictor
+from utils.feature_engineering import engineer_features, prepare_features_for_prediction
+from utils.feature_schema import SCHEMA
+from utils.model_files import load_model_files
+from utils.synthetic import synthetic_records
+
+
+def pandas_path(record, classification_model, regression_model, scaler):
+    df = engineer_features(pd.DataFrame([record]))
+    X_scaled = scaler.transform(prepare_features_for_prediction(df))
+    classes = classification_model.predict(X_scaled)
+    return (
+        classes[0],
+        classification_model.predict_proba(X_scaled)[0],
+        regression_model.predict(SCHEMA.regression_input(X_scaled, classes))[0],
+    )
+
+
+def measure(fn, records):
+    latencies = np.empty(len(records))
+    results = []
+    for i, record in enumerate(records):
+        start = time.perf_counter()
+        results.append(fn(record))
+        latencies[i] = time.perf_counter() - start
+    return latencies * 1e6, results
+
+
+def main():
+    warnings.filterwarnings('ignore')
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    models = load_model_files()
+    fast = build_fast_predictor(*models)
+    if fast is None:
+        sys.exit("FastPredictor is not supported for these models")
+
+    records = synthetic_records(n, seed=1)
+
+    slow_us, slow = measure(lambda r: pandas_path(r, *models), records)
+    fast_us, quick = measure(fast.predict_one, records)
+
+    identical = all(
+        a[0] == b[0] and np.array_equal(a[1], b[1]) and a[2] == b[2]
+        for a, b in zip(slow, quick)
+    )
+    print(f"{n:,} single-applicant requests; outputs identical: {identical}")
+    print(f"{'path':<10} {'mean us':>9} {'p50 us':>9} {'p99 us':>9}")
+    for name, us in (('pandas', slow_us), ('fast', fast_us)):
+        print(f"{name:<10} {us.mean():>9.1f} {np.percentile(us, 50):>9.1f} {np.percentile(us, 99):>9.1f}")
+    print(f"speedup (p50): {np.percentile(slow_us, 50) / np.percentile(fast_us, 50):.1f}x")
+    if not identical:
+        sys.exit("FastPredictor outputs differ from the pandas path")
+
+
+if __name__ == '__main__':
+    main()
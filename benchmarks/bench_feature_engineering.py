@@ -0,0 +1,40 @@
+"""
+Throughput of batch feature engineering at 1k, 100k and 1M rows
+
+Usage: python benchmarks/bench_feature_engineering.py
+"""
+import sys
+import os
+import time
+import pandas as pd
+
+# Add parent directory to path to import utils
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.feature_engineering import engineer_features, engineer_feature_arrays
+from utils.synthetic import synthetic_applicants
+
+SIZES = [1_000, 100_000, 1_000_000]
+REPEATS = 3
+
+
+def best_of(fn, arg):
+    best = float('inf')
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn(arg)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    print(f"{'rows':>10} {'DataFrame rows/s':>18} {'arrays rows/s':>16}")
+    for n in SIZES:
+        columns = synthetic_applicants(n)
+        df = pd.DataFrame(columns)
+        df_time = best_of(engineer_features, df)
+        arr_time = best_of(engineer_feature_arrays, columns)
+        print(f"{n:>10,} {n / df_time:>18,.0f} {n / arr_time:>16,.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Benchmark: full versus incremental feature recomputation for one applicant
+
+A form resubmission usually changes one field. Compares rebuilding the
+scaled row from scratch (engineer_features + scaler, and the pandas-free
+FastPredictor.scaled_row) with IncrementalFeatures updating only the
+features downstream of the changed field.
+"""
+import os
+import sys
+import time
+import warnings
+
+import pandas as pd
+
+# Add parent directory to path to import utils
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.fast_path import build_fast_predictor
+from utils.feature_engineering import engineer_features, prepare_features_for_prediction
+from utils.feature_graph import IncrementalFeatures
+from utils.model_files import MODEL_DIR, load_pickles
+from utils.synthetic import synthetic_records
+
+REPEATS = 2000
+
+
+def per_call_us(fn, repeats=REPEATS):
+    fn(0)
+    start = time.perf_counter()
+    for i in range(repeats):
+        fn(i)
+    return (time.perf_counter() - start) / repeats * 1e6
+
+
+def main():
+    warnings.filterwarnings('ignore')
+    classification_model, regression_model, scaler = load_pickles(MODEL_DIR)
+    fast = build_fast_predictor(classification_model, regression_model, scaler)
+    base = synthetic_records(1, seed=0)[0]
+    salaries = [record['monthly_salary'] for record in synthetic_records(REPEATS, seed=1)]
+    # Each edit changes one field, like a resubmission or a keystroke
+    edits = {
+        'monthly_rent': [dict(base, monthly_rent=1000 + i) for i in range(REPEATS)],
+        'monthly_salary': [dict(base, monthly_salary=s) for s in salaries],
+        'company_type': [dict(base, company_type=("MNC", "Startup")[i % 2]) for i in range(REPEATS)],
+        'credit_score': [dict(base, credit_score=300 + i % 600) for i in range(REPEATS)],
+    }
+
+    print(f"{'changed field':>16} {'pandas (us)':>12} {'fast (us)':>10} {'incremental (us)':>17} {'columns':>8}")
+    for field, records in edits.items():
+        def pandas_full(i):
+            X = prepare_features_for_prediction(engineer_features(pd.DataFrame([records[i]])))
+            return scaler.transform(X)
+
+        def fast_full(i):
+            return fast.scaled_row(records[i])
+
+        state = IncrementalFeatures(base)
+
+        def incremental(i):
+            state.update(records[i])
+            return state.scaled_row(fast.mean, fast.scale)
+
+        columns = len(IncrementalFeatures(base).update(records[1]))
+        print(f"{field:>16} {per_call_us(pandas_full, 200):>12.1f} {per_call_us(fast_full):>10.1f} "
+              f"{per_call_us(incremental):>17.1f} {columns:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Benchmark: cold-start import time per page
+
+Runs every page script in a fresh interpreter under python -X importtime,
+in Streamlit's bare mode (no server, no session data) with the
+background warm-up off (utils.warmup), and reports
+wall time, total import time and the slowest imports. With
+--first-prediction it also times a cold process up to the models being
+loaded and the fast path built, as the Prediction page does on first use.
+
+Usage: python benchmarks/bench_import_time.py [--top N] [--repeats N]
+                                              [--first-prediction] [--output results.json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGES = ['app.py'] + sorted(os.path.join('pages', name) for name in os.listdir(os.path.join(ROOT, 'pages'))
+                            if name.endswith('.py'))
+
+# Pages start the background warm-up after painting; keep it out of the measurement
+ENV = dict(os.environ, EMI_WARMUP='off')
+
+RUN_PAGE = """
+import runpy, sys, warnings
+warnings.filterwarnings('ignore')
+sys.path.insert(0, {root!r})
+runpy.run_path({path!r}, run_name='__main__')
+"""
+FIRST_PREDICTION = """
+import sys, warnings
+warnings.filterwarnings('ignore')
+sys.path.insert(0, {root!r})
+from utils.model_loader import load_fast_predictor, load_models
+load_models()
+load_fast_predictor()
+"""
+
+
+def parse_importtime(stderr):
+    """
+    {module: (self us, cumulative us, nesting depth)} from -X importtime output
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        # One space after the bar, then two per nesting level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        modules[name.strip()] = (int(self_us), int(cumulative_us), depth)
+    return modules
+
+
+def profile(code, repeats):
+    """
+    Fastest of repeats cold runs: (wall seconds, {module: (self, cumulative)})
+    """
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT,
+                                capture_output=True, text=True, env=ENV)
+        wall = time.perf_counter() - start
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr[-2000:])
+        if best is None or wall < best[0]:
+            best = (wall, parse_importtime(result.stderr))
+    return best
+
+
+def summarize(wall, modules, top):
+    top_level = {name: cumulative for name, (_, cumulative, depth) in modules.items() if depth == 0}
+    return {
+        'wall_s': wall,
+        'import_s': sum(top_level.values()) / 1e6,
+        'modules': len(modules),
+        'slowest_top_level': sorted(((name, us / 1e6) for name, us in top_level.items()),
+                                    key=lambda item: item[1], reverse=True)[:top],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start import time per page")
+    parser.add_argument('--top', type=int, default=8, help="slowest top-level imports listed per page")
+    parser.add_argument('--repeats', type=int, default=3, help="cold runs per page, the fastest is kept")
+    parser.add_argument('--first-prediction', action='store_true',
+                        help="also time a cold process up to loaded models")
+    parser.add_argument('--output', help="JSON results file")
+    args = parser.parse_args()
+
+    cases = {page: RUN_PAGE.format(root=ROOT, path=os.path.join(ROOT, page)) for page in PAGES}
+    if args.first_prediction:
+        cases['first prediction'] = FIRST_PREDICTION.format(root=ROOT)
+    results = {}
+    for name, code in cases.items():
+        results[name] = summarize(*profile(code, args.repeats), args.top)
+        result = results[name]
+        print(f"{name:<24} wall {result['wall_s']:6.2f} s  imports {result['import_s']:6.2f} s  "
+              f"({result['modules']} modules)")
+        for module, seconds in result['slowest_top_level']:
+            print(f"    {module:<40} {seconds * 1000:8.1f} ms")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
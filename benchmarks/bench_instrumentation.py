@@ -0,0 +1,50 @@
+"""
+Cost of the per-stage instrumentation on single-applicant predictions
+
+Usage: python benchmarks/bench_instrumentation.py
+"""
+import sys
+import os
+import time
+import warnings
+
+# Add parent directory to path to import utils
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import instrumentation
+from utils.fast_path import TEMPLATE_RECORD, build_fast_predictor
+from utils.model_files import load_model_files
+from utils.scoring import score_records
+
+REPEATS = 500
+
+
+def per_call_us(fn):
+    fn()
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        fn()
+    return (time.perf_counter() - start) / REPEATS * 1e6
+
+
+def main():
+    warnings.filterwarnings('ignore')
+    models = load_model_files()
+    fast = build_fast_predictor(*models)
+    paths = [('pandas path', lambda: score_records([TEMPLATE_RECORD], *models))]
+    if fast is not None:
+        paths.append(('fast path', lambda: fast.predict_one(TEMPLATE_RECORD)))
+
+    print(f"{'':>12} {'disabled us':>12} {'enabled us':>11} {'+allocations us':>16}")
+    for label, fn in paths:
+        instrumentation.disable()
+        disabled = per_call_us(fn)
+        instrumentation.enable()
+        enabled = per_call_us(fn)
+        instrumentation.enable(track_allocations=True)
+        allocations = per_call_us(fn)
+        instrumentation.disable()
+        print(f"{label:>12} {disabled:>12.1f} {enabled:>11.1f} {allocations:>16.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Cold start of loading the models: the original loader vs the current ones
+
+Every measurement runs in a fresh interpreter, as on a new replica, and
+reports the imports each path needs separately from the deserialisation
+of the artifacts. The baseline is the original load_models(), which
+imported Streamlit and wrote an st.info banner per file.
+
+Every path takes about the same: the imports (xgboost, sklearn, pandas,
+Streamlit) cost seconds and the artifacts tens of milliseconds. The
+bundle deserialises no faster than the pickles; it is there for its
+checksums and versioning, not for speed. model_loader defers its imports
+to the first call of each loader: that moves the cost (into the
+background warm-up, when it runs) rather than removing it.
+Run python -m utils.model_bundle export first for the bundle rows.
+
+Usage: python benchmarks/bench_model_load.py [repeats]
+"""
+import sys
+import os
+import json
+import subprocess
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SNIPPET = """
+import json, logging, time, warnings
+warnings.filterwarnings('ignore')
+logging.disable(logging.WARNING)
+start = time.perf_counter()
+{imports}
+imported = time.perf_counter()
+{call}
+done = time.perf_counter()
+print(json.dumps({{'import': imported - start, 'load': done - imported}}))
+"""
+
+# The original utils/model_loader.py, minus its fallbacks to pickle/numpy
+BASELINE_IMPORTS = "import streamlit as st, joblib, xgboost, sklearn.preprocessing"
+BASELINE_CALL = """
+for name in ('EMI_classification_Best_Model.pkl', 'EMI_regression_Best_Model.pkl', 'scaler.pkl'):
+    model = joblib.load(name)
+    st.info(f"Model loaded with joblib - Type: {type(model)}")
+"""
+
+PATHS = {
+    'original load_models': (BASELINE_IMPORTS, BASELINE_CALL),
+    'model_loader': ("from utils.model_loader import load_models", "load_models()"),
+    'pickles': ("from utils.model_files import load_pickles\nimport xgboost, sklearn.preprocessing",
+                "load_pickles()"),
+    'bundle (verified)': ("from utils.model_bundle import load_bundle\nimport xgboost, sklearn.preprocessing",
+                          "load_bundle(%r)" % ROOT),
+    'bundle (no verify)': ("from utils.model_bundle import load_bundle\nimport xgboost, sklearn.preprocessing",
+                           "load_bundle(%r, verify=False)" % ROOT),
+}
+
+
+def run(imports, call):
+    out = subprocess.run(
+        [sys.executable, '-c', SNIPPET.format(imports=imports, call=call)],
+        cwd=ROOT, capture_output=True, text=True, check=True, env=dict(os.environ, EMI_WARMUP='off'),
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"{'path':<22} {'import ms':>10} {'load ms':>8} {'total ms':>9}")
+    for name, (imports, call) in PATHS.items():
+        runs = [run(imports, call) for _ in range(repeats)]
+        imported = np.median([r['import'] for r in runs]) * 1000
+        load = np.median([r['load'] for r in runs]) * 1000
+        total = np.median([r['import'] + r['load'] for r in runs]) * 1000
+        print(f"{name:<22} {imported:>10.1f} {load:>8.1f} {total:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark: per-process memory of loading the models versus attaching
+to the shared model store
+
+Starts N worker processes that each either load the models themselves
+(load_model_files) or attach to a freshly published store, score the
+same applicants, and report their RSS and PSS (RSS with shared pages
+divided among the processes sharing them) from /proc/<pid>/smaps_rollup.
+
+Usage: python benchmarks/bench_model_store.py [--workers N]
+Linux only.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
+# Add parent directory to path to import utils
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from utils.model_files import load_versioned_models
+from utils.model_store import publish
+
+WORKER = """
+import json, sys, warnings
+warnings.filterwarnings('ignore')
+sys.path.insert(0, {root!r})
+from utils.synthetic import synthetic_records
+records = synthetic_records(100, seed=0)
+if {mode!r} == 'load':
+    from utils.model_files import load_model_files
+    from utils.scoring import score_records
+    models = load_model_files()
+    results = score_records(records, *models)
+else:
+    from utils.model_store import ModelStore
+    results = ModelStore({store!r}).score_records(records)
+print(json.dumps(results[0]), flush=True)
+sys.stdin.read()
+"""
+
+
+def memory(pid):
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if key in ('Rss', 'Pss'):
+                values[key] = int(value.split()[0]) * 1024
+    return values
+
+
+def run(mode, workers, store):
+    processes = [
+        subprocess.Popen([sys.executable, '-c', WORKER.format(root=ROOT, mode=mode, store=store)],
+                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        for _ in range(workers)
+    ]
+    start = time.perf_counter()
+    first = [json.loads(p.stdout.readline()) for p in processes]
+    ready = time.perf_counter() - start
+    # Every worker is alive and loaded: PSS now splits shared pages between them
+    usage = [memory(p.pid) for p in processes]
+    for p in processes:
+        p.stdin.close()
+        p.wait()
+    return first[0], ready, usage
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare loaded and store-attached worker memory")
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+    warnings.filterwarnings('ignore')
+
+    with tempfile.TemporaryDirectory(dir='/dev/shm' if os.path.isdir('/dev/shm') else None) as store:
+        models, version = load_versioned_models()
+        publish(models, version, store)
+        print(f"{'mode':>8} {'startup (s)':>12} {'RSS/worker (MB)':>16} {'PSS/worker (MB)':>16} {'total PSS (MB)':>15}")
+        results = {}
+        for mode in ('load', 'attach'):
+            result, ready, usage = run(mode, args.workers, store)
+            results[mode] = result
+            rss = sum(u['Rss'] for u in usage) / len(usage) / 2**20
+            pss = sum(u['Pss'] for u in usage) / 2**20
+            print(f"{mode:>8} {ready:>12.2f} {rss:>16.1f} {pss / len(usage):>16.1f} {pss:>15.1f}")
+        print(f"First applicant: loaded {results['load']}, attached {results['attach']}")
+        if results['load'] != results['attach']:
+            sys.exit("Store-attached workers disagree with the loaded models")
+
+
+if __name__ == '__main__':
+    main()
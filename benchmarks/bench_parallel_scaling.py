@@ -0,0 +1,38 @@
+"""
+Scaling curve of process-pool scoring from 1 worker up to the number of
+physical cores
+
+Usage: python benchmarks/bench_parallel_scaling.py [rows]
+"""
+import sys
+import os
+import time
+
+# Add parent directory to path to import utils
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.parallel_score import ParallelScorer, physical_cores
+from utils.synthetic import synthetic_frame
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    df = synthetic_frame(rows)
+    cores = physical_cores()
+    print(f"{rows:,} rows, {cores} physical cores")
+    print(f"{'workers':>8} {'seconds':>9} {'rows/s':>12} {'speedup':>8} {'efficiency':>11}")
+
+    baseline = None
+    for workers in range(1, cores + 1):
+        with ParallelScorer(workers) as scorer:
+            # Warm-up: let every worker finish loading its models
+            scorer.score(df.iloc[:workers * 100])
+            start = time.perf_counter()
+            scorer.score(df)
+            elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        speedup = baseline / elapsed
+        print(f"{workers:>8} {elapsed:>9.2f} {rows / elapsed:>12,.0f} {speedup:>8.2f} {speedup / workers:>11.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Latency of the what-if affordability sweep at several grid sizes
+
+Usage: python benchmarks/bench_scenario_sweep.py
+"""
+import sys
+import os
+import time
+import warnings
+import numpy as np
+
+# Add parent directory to path to import utils
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.fast_path import TEMPLATE_RECORD, build_fast_predictor
+from utils.model_files import load_model_files
+from utils.scenario_sweep import sweep
+
+GRIDS = [(10, 6, 5), (50, 12, 5), (100, 24, 5)]
+REPEATS = 5
+
+
+def best_ms(fn):
+    fn()
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+def main():
+    warnings.filterwarnings('ignore')
+    models = load_model_files()
+    fast = build_fast_predictor(*models)
+    print(f"{'grid':>12} {'points':>7} {'sklearn API ms':>15} {'booster ms':>11}")
+    for n_amounts, n_tenures, n_scenarios in GRIDS:
+        amounts = np.linspace(0.25, 3.0, n_amounts) * TEMPLATE_RECORD['monthly_salary'] * 12
+        tenures = np.linspace(6, 72, n_tenures).round()
+        scenarios = np.arange(1, n_scenarios + 1)
+        grid = dict(amounts=amounts, tenures=tenures, scenarios=scenarios)
+        generic = best_ms(lambda: sweep(TEMPLATE_RECORD, *models, **grid))
+        booster = best_ms(lambda: sweep(TEMPLATE_RECORD, *models, predict_fn=fast.predict_scaled, **grid)) \
+            if fast is not None else float('nan')
+        points = n_amounts * n_tenures * n_scenarios
+        label = f"{n_amounts}x{n_tenures}x{n_scenarios}"
+        print(f"{label:>12} {points:>7,} {generic:>15.1f} {booster:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Booster inplace_predict vs the compiled flat-array evaluator by batch size
+
+Also reports the largest difference between the two, which should be
+float32 rounding only.
+
+Usage: python benchmarks/bench_tree_ensemble.py
+"""
+import sys
+import os
+import time
+import warnings
+import numpy as np
+
+# Add parent directory to path to import utils
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.fast_path import build_fast_predictor
+from utils.model_files import load_model_files
+from utils.synthetic import synthetic_records
+from utils.tree_ensemble import compile_models
+
+BATCH_SIZES = [1, 8, 32, 128, 1_000, 10_000]
+REPEATS = 5
+
+
+def best_ms(fn, X):
+    fn(X)
+    number = max(1, 1_000 // len(X))
+    best = float('inf')
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn(X)
+        best = min(best, (time.perf_counter() - start) / number)
+    return best * 1000
+
+
+def main():
+    warnings.filterwarnings('ignore')
+    models = load_model_files()
+    fast = build_fast_predictor(*models)
+    if fast is None:
+        sys.exit("FastPredictor is not supported for these models")
+    start = time.perf_counter()
+    trees = compile_models(*models[:2])
+    print(f"compiled {trees.classifier.n_trees} + {trees.regressor.n_trees} trees "
+          f"in {time.perf_counter() - start:.2f} s")
+
+    X = fast.scaled_rows(synthetic_records(BATCH_SIZES[-1], seed=3))
+    booster, flat = fast.predict_scaled(X), trees.predict_scaled(X)
+    print(f"classes identical: {np.array_equal(booster[0], flat[0])}, "
+          f"max probability diff {np.abs(booster[1] - flat[1]).max():.2e}, "
+          f"max EMI diff {np.abs(booster[2] - flat[2]).max():.2e}")
+
+    print(f"{'rows':>8} {'booster ms':>11} {'flat ms':>9} {'speedup':>8}")
+    for n in BATCH_SIZES:
+        booster_ms = best_ms(fast.predict_scaled, X[:n])
+        flat_ms = best_ms(trees.predict_scaled, X[:n])
+        print(f"{n:>8,} {booster_ms:>11.3f} {flat_ms:>9.3f} {booster_ms / flat_ms:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
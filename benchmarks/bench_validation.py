@@ -0,0 +1,65 @@
+"""
+Benchmark: throughput of bulk input validation
+
+Validates synthetic applicants as clean typed columns, as text columns
+(as read from a CSV with stray values) and with a share of bad rows
+whose rejects and messages are built too. Reports rows per minute.
+
+Usage: python benchmarks/bench_validation.py [--rows N] [--bad-fraction F]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add parent directory to path to import utils
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.synthetic import synthetic_frame
+from utils.validation import validate_frame
+
+REPEATS = 3
+
+
+def best_seconds(fn):
+    best = float('inf')
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--bad-fraction', type=float, default=0.05)
+    args = parser.parse_args()
+
+    clean = synthetic_frame(args.rows, seed=0)
+    text = clean.astype({name: str for name in ('age', 'monthly_salary', 'credit_score')})
+    dirty = clean.astype({'age': object, 'education': object})
+    rng = np.random.default_rng(0)
+    bad = rng.random(args.rows) < args.bad_fraction
+    dirty.loc[bad & (rng.random(args.rows) < 0.5), 'age'] = 'unknown'
+    dirty.loc[bad, 'education'] = 'PhD'
+
+    def dirty_with_rejects():
+        result = validate_frame(dirty)
+        result.valid_frame()
+        result.rejects_frame()
+
+    cases = {
+        'clean': lambda: validate_frame(clean).valid_frame(),
+        'text columns': lambda: validate_frame(text).valid_frame(),
+        f'{args.bad_fraction:.0%} bad + rejects': dirty_with_rejects,
+    }
+    print(f"{'case':<22} {'seconds':>8} {'M rows/min':>11}")
+    for name, fn in cases.items():
+        seconds = best_seconds(fn)
+        print(f"{name:<22} {seconds:>8.3f} {args.rows / seconds * 60 / 1e6:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Local load test for the HTTP scoring service
+
+Start the service first (python -m utils.scoring_service), then run:
+  python benchmarks/load_test_service.py [--concurrency 16] [--requests 2000] [--batch-size 0]
+
+Each simulated client keeps one HTTP/1.1 connection open and sends
+requests back to back. --batch-size 0 hits /score with one applicant,
+any other value posts that many applicants to /score/batch. Applicants
+are all distinct unless --distinct is set, so the prediction cache only
+helps when asked to.
+Reports throughput and p50/p95/p99 latency.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import os
+import time
+import numpy as np
+
+# Add parent directory to path to import utils
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.synthetic import synthetic_records
+
+
+async def client(host, port, payloads, latencies):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for path, body in payloads:
+            request = (
+                f"POST {path} HTTP/1.1\r\nHost: {host}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+            ).encode() + body
+            start = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            status = await reader.readline()
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                if line.lower().startswith(b'content-length:'):
+                    length = int(line.split(b':')[1])
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+            if b' 200 ' not in status:
+                raise RuntimeError(f"Unexpected response: {status.decode().strip()}")
+    finally:
+        writer.close()
+
+
+async def run(args):
+    distinct = args.distinct or args.requests
+    records = synthetic_records(max(args.batch_size, 1) * distinct)
+    payloads = []
+    for i in range(args.requests):
+        if args.batch_size:
+            start = (i * args.batch_size) % (len(records) - args.batch_size + 1)
+            body = {'applicants': records[start:start + args.batch_size]}
+            payloads.append(('/score/batch', json.dumps(body).encode()))
+        else:
+            payloads.append(('/score', json.dumps(records[i % len(records)]).encode()))
+
+    latencies = []
+    per_client = [payloads[i::args.concurrency] for i in range(args.concurrency)]
+    start = time.perf_counter()
+    await asyncio.gather(*(client(args.host, args.port, p, latencies) for p in per_client if p))
+    elapsed = time.perf_counter() - start
+
+    ms = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    print(f"{len(ms):,} requests, concurrency {args.concurrency}, batch size {args.batch_size or 1}")
+    print(f"throughput {len(ms) / elapsed:,.0f} req/s")
+    print(f"latency ms  p50 {p50:.2f}  p95 {p95:.2f}  p99 {p99:.2f}  max {ms.max():.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=0)
+    parser.add_argument('--distinct', type=int, default=0,
+                        help="distinct applicants to cycle through (default: one per request)")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+"""
+End-to-end benchmark suite with JSON results
+
+Measures, on seeded synthetic applicants (utils.synthetic):
+  - model load time, from the pickles and from the bundle when exported
+  - engineer_features and prepare_features_for_prediction throughput
+  - scaling cost
+  - predict latency at batch sizes from 1 to 1M rows, through the
+    sklearn API and, when supported, the booster fast path and the
+    compiled flat-array trees
+
+Usage: python benchmarks/run_suite.py [--output results.json] [--max-rows N]
+                                      [--repeats N] [--seed N]
+                                      [--compare baseline.json] [--threshold 0.1]
+                                      [--min-rows N] [--report-only]
+
+Every measurement is the median of --repeats timed runs; small batches
+are looped inside each run so timer resolution does not dominate.
+--compare reports benchmarks whose median got slower than the baseline
+file by more than --threshold, and exits 1 if there are any unless
+--report-only is given. --min-rows N compares only batches of at least N
+rows: smaller ones run in microseconds and are too noisy to gate on.
+Medians only compare across like machines. CI reports against
+benchmarks/baseline.json without failing, because that file was recorded
+on a dev machine, not on a CI runner; replace it with the
+benchmark-results artifact of a CI run on main before dropping
+--report-only there, and again when a change is meant to move the numbers.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import warnings
+from datetime import datetime, timezone
+
+import numpy as np
+
+# Add parent directory to path to import utils
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.fast_path import build_fast_predictor
+from utils.feature_engineering import engineer_features, prepare_features_for_prediction
+from utils.model_bundle import current_version, load_bundle
+from utils.model_files import MODEL_DIR, load_pickles
+from utils.scoring import predict_scaled, scale_features
+from utils.synthetic import synthetic_frame
+from utils.tree_ensemble import compile_models
+
+BATCH_SIZES = [1, 10, 100, 1_000, 10_000, 100_000, 1_000_000]
+# Smallest amount of work per timed run, in rows
+MIN_ROWS_PER_RUN = 1_000
+
+
+def time_runs(fn, repeats, number=1):
+    """
+    Seconds per call of fn, one entry per timed run of number calls
+    """
+    fn()
+    runs = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        runs.append((time.perf_counter() - start) / number)
+    return runs
+
+
+def summarize(runs, rows=None):
+    result = {
+        'median_s': float(np.median(runs)),
+        'min_s': float(np.min(runs)),
+        'max_s': float(np.max(runs)),
+        'runs': len(runs),
+    }
+    if rows is not None:
+        result['rows'] = rows
+        result['rows_per_s'] = rows / result['median_s']
+    return result
+
+
+def bench_model_load(repeats):
+    results = {'model_load.pickles': summarize(time_runs(lambda: load_pickles(MODEL_DIR), repeats))}
+    if current_version(MODEL_DIR) is not None:
+        results['model_load.bundle'] = summarize(time_runs(lambda: load_bundle(MODEL_DIR), repeats))
+    return results
+
+
+def bench_pipeline(models, sizes, repeats, seed):
+    classification_model, regression_model, scaler = models
+    fast = build_fast_predictor(*models)
+    try:
+        trees = compile_models(classification_model, regression_model)
+    except ValueError:
+        trees = None
+    results = {}
+    for n in sizes:
+        raw = synthetic_frame(n, seed)
+        engineered = engineer_features(raw)
+        X = prepare_features_for_prediction(engineered)
+        X_scaled = scale_features(X, scaler)
+        number = max(1, MIN_ROWS_PER_RUN // n)
+        # Large batches take seconds each; fewer runs keep the suite bounded
+        runs = repeats if n <= 100_000 else max(1, repeats // 3)
+
+        def run(name, fn):
+            results[f"{name}.{n}"] = summarize(time_runs(fn, runs, number), n)
+            print(f"{name:>24} {n:>10,} {results[f'{name}.{n}']['median_s'] * 1000:>12.3f} ms", file=sys.stderr)
+
+        run('engineer_features', lambda: engineer_features(raw))
+        run('prepare_features', lambda: prepare_features_for_prediction(engineered))
+        run('scale', lambda: scale_features(X, scaler))
+        run('predict', lambda: predict_scaled(X_scaled, classification_model, regression_model))
+        if fast is not None:
+            X_fast = np.asarray(X_scaled, dtype=np.float32)
+            run('predict_fast', lambda: fast.predict_scaled(X_fast))
+        if trees is not None:
+            run('predict_flat', lambda: trees.predict_scaled(X_scaled))
+    return results
+
+
+def environment():
+    import pandas
+    import sklearn
+    import xgboost
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=MODEL_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pandas.__version__,
+        'sklearn': sklearn.__version__,
+        'xgboost': xgboost.__version__,
+    }
+
+
+def compare(results, baseline, threshold, min_rows=0):
+    """
+    Benchmarks present in both runs whose median slowed down by more than
+    threshold, as (name, baseline seconds, current seconds) tuples
+    min_rows: only batches of at least that many rows are compared, so
+    model loads are skipped when it is above 0
+    """
+    regressions = []
+    for name, current in sorted(results.items()):
+        if min_rows and current.get('rows', 0) < min_rows:
+            continue
+        previous = baseline.get(name)
+        if previous and current['median_s'] > previous['median_s'] * (1 + threshold):
+            regressions.append((name, previous['median_s'], current['median_s']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the EMI benchmark suite")
+    parser.add_argument('--output', help="JSON results file (default: print to stdout)")
+    parser.add_argument('--max-rows', type=int, default=BATCH_SIZES[-1], help="largest batch size")
+    parser.add_argument('--repeats', type=int, default=7, help="timed runs per benchmark (default 7)")
+    parser.add_argument('--seed', type=int, default=0, help="synthetic applicant seed (default 0)")
+    parser.add_argument('--compare', help="baseline JSON results to check for regressions")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="allowed slowdown against the baseline (default 0.1 = 10%%)")
+    parser.add_argument('--min-rows', type=int, default=0,
+                        help="compare only batches of at least this many rows (default 0: everything)")
+    parser.add_argument('--report-only', action='store_true',
+                        help="print regressions without failing")
+    args = parser.parse_args(argv)
+    warnings.filterwarnings('ignore')
+
+    sizes = [n for n in BATCH_SIZES if n <= args.max_rows]
+    results = bench_model_load(args.repeats)
+    results.update(bench_pipeline(load_pickles(MODEL_DIR), sizes, args.repeats, args.seed))
+    report = {
+        'environment': environment(),
+        'config': {'sizes': sizes, 'repeats': args.repeats, 'seed': args.seed},
+        'results': results,
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        machine = {key: baseline['environment'].get(key) for key in ('platform', 'cpus')}
+        if machine != {key: report['environment'][key] for key in machine}:
+            print(f"Baseline recorded on another machine ({machine}); expect differences", file=sys.stderr)
+        regressions = compare(results, baseline['results'], args.threshold, args.min_rows)
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: {before * 1000:.3f} ms -> {after * 1000:.3f} ms "
+                  f"({after / before - 1:+.0%})", file=sys.stderr)
+        if regressions and not args.report_only:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,11 +1,10 @@
 import streamlit as st
-import pandas as pd
 import sys
 import os
 
 # Add parent directory to path to import utils
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from utils.feature_engineering import engineer_features
+from utils.feature_graph import IncrementalFeatures
 
 st.set_page_config(page_title="Data Input", page_icon="📝", layout="wide")
 
@@ -69,9 +68,16 @@ with st.form("user_input_form"):
             'emergency_fund': emergency_fund
         }
         
-        df = pd.DataFrame([user_input])
-        df_engineered = engineer_features(df)
+        # Resubmissions only recompute the features downstream of changed fields
+        features = st.session_state.get('features')
+        if features is None:
+            features = IncrementalFeatures(user_input)
+        else:
+            features.update(user_input)
+        df_engineered = features.frame()
+        st.session_state.features = features
         st.session_state.user_data = df_engineered
+        st.session_state.user_input = user_input
         
         st.success("Data submitted successfully! Navigate to 'Prediction' page to see results.")
         
@@ -1,15 +1,51 @@
 import streamlit as st
 import sys
 import os
+import time
 import numpy as np
+import pandas as pd
+import altair as alt
 
 # Add parent directory to path to import utils
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from utils.model_loader import load_models
+from utils.model_loader import (load_audit_log, load_decision_policy, load_drift_monitor, load_explainer, load_models,
+                                load_fast_predictor, load_predict_fn, load_prediction_batcher, load_prediction_cache,
+                                served_model_version, served_scorer)
+from utils.calibration import class_label
+from utils.explain import REFERENCE_NOTE, explained_with, top_contributions
 from utils.feature_engineering import prepare_features_for_prediction
+from utils.instrumentation import REGISTRY, SamplingProfiler, is_enabled, profiling_allowed, stage
+from utils.prediction_cache import record_key
+from utils.scenario_sweep import sweep
 
 st.set_page_config(page_title="Prediction", page_icon="🎯", layout="wide")
 
+def show_explanation(explanation):
+    top = top_contributions(explanation['margin_contributions'], 8)
+    chart_data = pd.DataFrame(top, columns=['feature', 'contribution'])
+    st.altair_chart(alt.Chart(chart_data).mark_bar().encode(
+        x=alt.X('contribution:Q', title="Contribution to the decision (log-odds)"),
+        y=alt.Y('feature:N', title=None, sort=None),
+        color=alt.condition(alt.datum.contribution > 0, alt.value('#2e7d32'), alt.value('#c62828')),
+        tooltip=['feature', alt.Tooltip('contribution:Q', format='+.3f')],
+    ), use_container_width=True)
+    st.caption("Green features pushed towards this decision, red ones against it")
+    if explained_with(served_scorer()) == 'reference model':
+        st.caption(REFERENCE_NOTE)
+    emi_factors = ", ".join(f"{name} ({value:+,.0f} ₹)"
+                            for name, value in top_contributions(explanation['emi_contributions'], 3))
+    st.markdown(f"EMI estimate driven mostly by: {emi_factors}")
+
+@st.fragment(run_every=0.5)
+def wait_for_explanation(future):
+    # Polls until the background explanation is ready, then reruns the page to show it
+    if not future.done():
+        st.caption("Working out which features drove this decision...")
+    elif future.exception() is not None:
+        st.warning(f"Explanation unavailable: {future.exception()}")
+    else:
+        st.rerun()
+
 st.title(" EMI Prediction Results")
 st.markdown("---")
 
@@ -22,37 +58,9 @@ else:
         st.error("Models not loaded. Please check model files.")
     else:
         df = st.session_state.user_data
-        X = prepare_features_for_prediction(df)
-        
-        # Handle different scaler types
-        try:
-            # Convert to numpy array first
-            X_array = X.values if hasattr(X, 'values') else np.array(X)
-            
-            # If scaler has transform method (StandardScaler, MinMaxScaler, etc.)
-            if hasattr(scaler, 'transform'):
-                X_scaled = scaler.transform(X)
-            # If scaler is a numpy array (manual scaling parameters)
-            elif isinstance(scaler, np.ndarray):
-                st.info(f"Scaler is numpy array with shape: {scaler.shape}")
-                # Check if it's a 2D array with mean and std
-                if scaler.shape[0] == 2:
-                    mean = scaler[0]
-                    std = scaler[1]
-                    X_scaled = (X_array - mean) / std
-                else:
-                    st.warning("Unknown scaler array format, using raw features")
-                    X_scaled = X_array
-            # If scaler is a dict with mean and std
-            elif isinstance(scaler, dict):
-                X_scaled = (X_array - scaler['mean']) / scaler['std']
-            else:
-                st.warning(f"Unknown scaler type: {type(scaler)}, using raw features")
-                X_scaled = X_array
-        except Exception as e:
-            st.error(f"Error during scaling: {e}")
-            st.info("Proceeding without scaling...")
-            X_scaled = X.values if hasattr(X, 'values') else np.array(X)
+        fast = load_fast_predictor()
+        user_input = st.session_state.get('user_input')
+        features = st.session_state.get('features')
         
         # Verify models are loaded correctly
         if not hasattr(classification_model, 'predict'):
@@ -63,10 +71,93 @@ else:
             st.error(f"Regression model is not a valid model object. Type: {type(regression_model)}")
             st.stop()
         
-        with st.spinner("Making predictions..."):
-            classification_pred = classification_model.predict(X_scaled)[0]
-            classification_proba = classification_model.predict_proba(X_scaled)[0]
-            regression_pred = regression_model.predict(X_scaled)[0]
+        # ?profile=1 samples the stacks of this run's prediction, where EMI_PROFILE=1 allows it
+        profiler = SamplingProfiler().start() \
+            if st.query_params.get('profile') == '1' and profiling_allowed() else None
+        
+        try:
+            # Identical inputs on reruns and resubmissions reuse the last prediction
+            cache = load_prediction_cache()
+            # The version these models were loaded as; predictions are cached under it
+            version = cache.version
+            cached = cache.get(user_input, version) if user_input is not None else None
+            
+            if cached is not None:
+                classification_pred, classification_proba, regression_pred = cached
+            else:
+                start = time.perf_counter()
+                if fast is not None and features is not None:
+                    # Pandas-free path; only entries changed since the last run are rescaled
+                    X_scaled = features.scaled_row(fast.mean, fast.scale)
+                elif fast is not None and user_input is not None:
+                    # Pandas-free path: raw fields straight into a scaled row
+                    X_scaled = fast.scaled_row(user_input)
+                else:
+                    X = prepare_features_for_prediction(df)
+            
+                    with stage('scale'):
+                        # Handle different scaler types
+                        try:
+                            # Convert to numpy array first
+                            X_array = X.values if hasattr(X, 'values') else np.array(X)
+                
+                            # If scaler has transform method (StandardScaler, MinMaxScaler, etc.)
+                            if hasattr(scaler, 'transform'):
+                                X_scaled = scaler.transform(X)
+                            # If scaler is a numpy array (manual scaling parameters)
+                            elif isinstance(scaler, np.ndarray):
+                                st.info(f"Scaler is numpy array with shape: {scaler.shape}")
+                                # Check if it's a 2D array with mean and std
+                                if scaler.shape[0] == 2:
+                                    mean = scaler[0]
+                                    std = scaler[1]
+                                    X_scaled = (X_array - mean) / std
+                                else:
+                                    st.warning("Unknown scaler array format, using raw features")
+                                    X_scaled = X_array
+                            # If scaler is a dict with mean and std
+                            elif isinstance(scaler, dict):
+                                X_scaled = (X_array - scaler['mean']) / scaler['std']
+                            else:
+                                st.warning(f"Unknown scaler type: {type(scaler)}, using raw features")
+                                X_scaled = X_array
+                        except Exception as e:
+                            st.error(f"Error during scaling: {e}")
+                            st.info("Proceeding without scaling...")
+                            X_scaled = X.values if hasattr(X, 'values') else np.array(X)
+            
+                with st.spinner("Making predictions..."):
+                    # Shared micro-batcher: concurrent sessions share one predict call
+                    batcher = load_prediction_batcher()
+                    with stage('batched_predict'):
+                        classification_pred, classification_proba, regression_pred = batcher(np.asarray(X_scaled)[0])
+                
+                # Fresh predictions only, like the audit log
+                monitor = load_drift_monitor()
+                if monitor is not None:
+                    monitor.observe(X_scaled, [classification_pred], [classification_proba[1]], [regression_pred])
+                
+                if user_input is not None:
+                    cache.put(user_input, (classification_pred, np.array(classification_proba), regression_pred),
+                              version)
+                    # Fresh predictions only: cache hits were logged when first served
+                    audit = load_audit_log()
+                    if audit is not None:
+                        result = {
+                            'eligibility_class': classification_pred,
+                            'approval_probability': classification_proba[1],
+                            'predicted_emi': regression_pred,
+                        }
+                        audit.record([user_input], [result], X_scaled, served_model_version(),
+                                     (time.perf_counter() - start) * 1000, source='streamlit')
+        finally:
+            # st.stop() and errors too: the sampling thread must not outlive the run
+            if profiler is not None:
+                profiler.stop()
+        
+        # Calibrated approval probability and its risk band (Approved / High Risk / Rejected)
+        policy = load_decision_policy()
+        approval_probability, risk_band = policy.decide_one(classification_proba[1])
         
         st.subheader("Prediction Results")
         
@@ -74,12 +165,23 @@ else:
         
         with col1:
             st.markdown("### Classification Result")
-            if classification_pred == 1:
-                st.success("EMI APPROVED")
-                st.metric("Approval Probability", f"{classification_proba[1]*100:.2f}%")
+            # Bands on an uncalibrated probability are only thresholds, not likelihoods
+            provisional = "" if policy.calibrated else " (PROVISIONAL)"
+            if risk_band == 'Approved':
+                st.success(f"EMI APPROVED{provisional}")
+                st.metric("Approval Probability", f"{approval_probability*100:.2f}%")
+            elif risk_band == 'High Risk':
+                st.warning(f"HIGH RISK{provisional}")
+                st.metric("Approval Probability", f"{approval_probability*100:.2f}%")
             else:
-                st.error("EMI REJECTED")
-                st.metric("Rejection Probability", f"{classification_proba[0]*100:.2f}%")
+                st.error(f"EMI REJECTED{provisional}")
+                # Every class but the approved one, so class 2 too; the breakdown is below
+                st.metric("Not-Approved Probability", f"{(1 - approval_probability)*100:.2f}%")
+            if not policy.calibrated:
+                st.caption("Provisional: no calibration has been fitted for these models, so this band is a "
+                           "threshold on the model's raw approval probability, not a calibrated likelihood")
+            st.caption("Model class probabilities: " + ", ".join(
+                f"{class_label(c)} {p:.1%}" for c, p in enumerate(classification_proba)))
         
         with col2:
             st.markdown("Predicted EMI Amount")
@@ -122,19 +224,99 @@ else:
         with ratio_col4:
             st.metric("Affordability", f"{df['affordability_ratio'].iloc[0]:.2%}")
         
+        st.markdown("---")
+        
+        st.subheader("What-if: Loan Amount × Tenure")
+        
+        if user_input is None:
+            st.info("Resubmit your data on the 'Data Input' page to explore other loan amounts and tenures.")
+        else:
+            # One batched scoring call over the whole grid, kept for reruns
+            sweep_key = record_key(user_input, cache.version)
+            if st.session_state.get('sweep_key') != sweep_key:
+                with stage('what_if_sweep'):
+                    st.session_state.sweep_result = sweep(
+                        user_input, classification_model, regression_model, scaler,
+                        predict_fn=load_predict_fn(),
+                    )
+                st.session_state.sweep_key = sweep_key
+            sweep_result = st.session_state.sweep_result
+            
+            scenario = st.selectbox("EMI Scenario", sweep_result.scenarios.tolist())
+            grid = sweep_result.to_frame(scenario)
+            grid = grid.assign(approval_probability=policy.calibrator(grid['approval_probability'].to_numpy()))
+            
+            heat_col1, heat_col2 = st.columns(2)
+            
+            with heat_col1:
+                st.markdown("Approval Probability")
+                st.altair_chart(alt.Chart(grid).mark_rect().encode(
+                    x=alt.X('requested_tenure:O', title="Tenure (months)"),
+                    y=alt.Y('requested_amount:O', title="Requested Amount (₹)", sort='descending',
+                            axis=alt.Axis(format=',.0f')),
+                    color=alt.Color('approval_probability:Q', title="Probability",
+                                    scale=alt.Scale(domain=[0, 1], scheme='redyellowgreen')),
+                    tooltip=['requested_amount', 'requested_tenure',
+                             alt.Tooltip('approval_probability:Q', format='.2%')],
+                ), use_container_width=True)
+            
+            with heat_col2:
+                st.markdown("Predicted EMI")
+                st.altair_chart(alt.Chart(grid).mark_rect().encode(
+                    x=alt.X('requested_tenure:O', title="Tenure (months)"),
+                    y=alt.Y('requested_amount:O', title="Requested Amount (₹)", sort='descending',
+                            axis=alt.Axis(format=',.0f')),
+                    color=alt.Color('predicted_emi:Q', title="EMI (₹)", scale=alt.Scale(scheme='blues')),
+                    tooltip=['requested_amount', 'requested_tenure',
+                             alt.Tooltip('predicted_emi:Q', format=',.2f')],
+                ), use_container_width=True)
+        
+        st.markdown("---")
+        st.subheader("What Drove This Decision")
+        
+        explainer = load_explainer()
+        if explainer is None or fast is None or user_input is None:
+            st.info("Feature attributions are available for the XGBoost models after submitting on the "
+                    "'Data Input' page.")
+        else:
+            explanation = explainer.get(user_input)
+            if explanation is not None:
+                show_explanation(explanation)
+            else:
+                # Computed off the critical path; the prediction above is already shown
+                if features is not None:
+                    X_row = features.scaled_row(fast.mean, fast.scale)
+                else:
+                    X_row = fast.scaled_row(user_input).copy()
+                wait_for_explanation(explainer.submit(user_input, X_row, classification_pred))
+        
         st.markdown("---")
         st.subheader("Recommendations")
         
-        if classification_pred == 1:
+        if risk_band == 'Approved':
             st.success("""
             - Your EMI application is likely to be approved
             - Ensure timely repayment to maintain good credit score
             - Consider building emergency fund to 6 months of expenses
             """)
+        elif risk_band == 'High Risk':
+            st.warning("""
+            - Your application is borderline and may need manual review
+            - Paying down existing loans would lower your debt-to-income ratio
+            - A lower loan amount or a longer tenure reduces the monthly EMI
+            """)
         else:
             st.warning("""
             - Consider improving your credit score
             - Reduce monthly expenses to increase savings capacity
             - Build a stronger emergency fund before applying
             - Consider requesting a lower loan amount
-            """)
\ No newline at end of file
+            """)
+        
+        if is_enabled() or profiler is not None:
+            with st.expander("Pipeline Timings"):
+                if is_enabled():
+                    st.json(REGISTRY.to_dict())
+                if profiler is not None:
+                    st.markdown(f"Profile: {profiler.samples} samples")
+                    st.table([{'frame': frame, 'samples': count} for frame, count in profiler.top()])
@@ -0,0 +1,67 @@
+"""
+The audit log reads back every scored applicant, and its scaled features
+reproduce the logged predictions
+"""
+import sqlite3
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.audit_log import SCALED_PREFIX, AuditLog, read_audit_log
+from utils.feature_schema import RAW_INPUT_COLUMNS, SCHEMA
+from utils.model_files import MODEL_DIR, load_pickles
+from utils.scoring import predict_scaled, result_dicts, scale_records
+from utils.synthetic import synthetic_records
+
+
+@pytest.fixture(scope='module')
+def models():
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return load_pickles(MODEL_DIR)
+
+
+def test_round_trip_and_replay(tmp_path, models):
+    path = str(tmp_path / 'audit.sqlite3')
+    records = synthetic_records(30, seed=6)
+    X = scale_records(records, models[2])
+    results = result_dicts(*predict_scaled(X, *models[:2]))
+    audit = AuditLog(path, flush_interval=0.01)
+    try:
+        assert audit.record(records[:10], results[:10], X[:10], 'test', 1.5, source='/score')
+        assert audit.record(records[10:], results[10:], X[10:], 'test', 2.5, source='/score/batch')
+        assert audit.flush(timeout=10)
+    finally:
+        audit.close()
+    assert audit.stats()['written'] == 30
+
+    chunks = list(read_audit_log(path, chunk_size=12))
+    assert [len(chunk) for chunk in chunks] == [12, 12, 6]
+    log = pd.concat(chunks, ignore_index=True)
+    assert log['id'].tolist() == list(range(1, 31))
+    assert log['source'].tolist() == ['/score'] * 10 + ['/score/batch'] * 20
+    assert (log['model_version'] == 'test').all()
+    assert log[list(RAW_INPUT_COLUMNS)].to_dict('records') == records
+
+    # Replay: the logged model input gives the logged predictions
+    classes, proba, emi = predict_scaled(log[[SCALED_PREFIX + name for name in SCHEMA.columns]].to_numpy(),
+                                         *models[:2])
+    np.testing.assert_array_equal(classes, log['eligibility_class'])
+    np.testing.assert_array_equal(proba[:, 1], log['approval_probability'])
+    np.testing.assert_array_equal(emi, log['predicted_emi'])
+    assert list(read_audit_log(path, since_id=30)) == []
+
+
+def test_rows_cannot_be_updated(tmp_path):
+    path = str(tmp_path / 'audit.sqlite3')
+    records = synthetic_records(1, seed=6)
+    audit = AuditLog(path)
+    audit.record(records, [{'eligibility_class': 2, 'approval_probability': 0.1, 'predicted_emi': 1.0}],
+                 np.zeros((1, SCHEMA.n_features)))
+    audit.close()
+    conn = sqlite3.connect(path)
+    with pytest.raises(sqlite3.DatabaseError):
+        conn.execute("UPDATE predictions SET predicted_emi = 0")
+    conn.close()
@@ -0,0 +1,56 @@
+"""
+The engineered features agree on every path that derives them: columns
+(engineer_features), one applicant (derive_record), the incremental graph
+and the scenario sweep
+"""
+import numpy as np
+import pytest
+
+from utils.fast_path import derive_record
+from utils.feature_engineering import engineer_features
+from utils.feature_graph import ENGINEERED_COLUMNS, IncrementalFeatures
+from utils.feature_schema import SCHEMA
+from utils.scenario_sweep import sweep_features
+from utils.synthetic import synthetic_frame
+
+
+@pytest.fixture(scope='module')
+def frame():
+    df = synthetic_frame(400, seed=3)
+    # Zero salaries and rents exercise the divide-by-one guard
+    df.loc[:9, 'monthly_salary'] = 0
+    df.loc[10:19, 'monthly_rent'] = 0
+    return df
+
+
+def test_record_matches_columns(frame):
+    engineered = engineer_features(frame)
+    for i, record in enumerate(frame.to_dict('records')):
+        features = derive_record(record)
+        expected = engineered.iloc[i]
+        for name in ENGINEERED_COLUMNS:
+            assert features[name] == expected[name], (i, name)
+
+
+def test_incremental_update_matches_full_evaluation(frame):
+    records = frame.to_dict('records')
+    incremental = IncrementalFeatures(records[0])
+    for record in records[1:50]:
+        incremental.update(record)
+        full = derive_record(record)
+        assert {name: incremental.features[name] for name in ENGINEERED_COLUMNS} == \
+            {name: full[name] for name in ENGINEERED_COLUMNS}
+
+
+def test_sweep_matches_columns(frame):
+    record = frame.to_dict('records')[0]
+    amounts, tenures, scenarios = [50_000, 400_000], [12, 60], [1, 3]
+    X = sweep_features(record, amounts, tenures, scenarios)
+    grid = frame.iloc[[0] * 8].reset_index(drop=True)
+    expected = engineer_features(grid)
+    expected['requested_amount'] = np.repeat(amounts, 4)
+    expected['requested_tenure'] = np.tile(np.repeat(tenures, 2), 2)
+    expected['emi_scenario'] = np.tile(scenarios, 4)
+    salary = record['monthly_salary'] or 1
+    expected['loan_to_income_ratio'] = expected['requested_amount'] / (salary * 12)
+    np.testing.assert_array_equal(X, expected[list(SCHEMA.columns)].to_numpy(dtype=np.float64))
@@ -0,0 +1,100 @@
+"""
+Exported bundles load back the models they were exported from, and are
+refused once a file was modified or the trees come from another compiler
+"""
+import json
+import os
+import shutil
+import warnings
+
+import numpy as np
+import pytest
+
+from utils.model_bundle import (MANIFEST_FILE, BundleError, current_version, export_bundle, file_sha256,
+                                load_bundle, load_bundle_trees, verify_bundle)
+from utils.model_files import CLASSIFICATION_MODEL_FILE, MODEL_DIR, REGRESSION_MODEL_FILE, SCALER_FILE, load_pickles
+from utils.scoring import predict_scaled, scale_records
+from utils.synthetic import synthetic_records
+
+
+@pytest.fixture(scope='module')
+def models():
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return load_pickles(MODEL_DIR)
+
+
+@pytest.fixture
+def bundle(tmp_path, models):
+    for name in (CLASSIFICATION_MODEL_FILE, REGRESSION_MODEL_FILE, SCALER_FILE):
+        shutil.copy(os.path.join(MODEL_DIR, name), tmp_path)
+    os.makedirs(tmp_path / 'models')
+    directory = export_bundle(str(tmp_path), models, version='test')
+    return str(tmp_path), directory
+
+
+def rewrite_manifest(directory, **changes):
+    path = os.path.join(directory, MANIFEST_FILE)
+    with open(path) as f:
+        manifest = json.load(f)
+    manifest.update(changes)
+    with open(path, 'w') as f:
+        json.dump(manifest, f)
+    return manifest
+
+
+def test_round_trip(bundle, models):
+    model_dir, directory = bundle
+    assert current_version(model_dir) == 'test'
+    verify_bundle(directory)
+    *loaded, manifest = load_bundle(model_dir)
+    assert manifest['version'] == 'test'
+    records = synthetic_records(50, seed=9)
+    X = scale_records(records, models[2])
+    np.testing.assert_array_equal(scale_records(records, loaded[2]), X)
+    for expected, got in zip(predict_scaled(X, *models[:2]), predict_scaled(X, *loaded[:2])):
+        np.testing.assert_allclose(got, expected, rtol=1e-6)
+    assert load_bundle_trees(model_dir, models=models) is not None
+
+
+def test_modified_file_is_refused(bundle, models):
+    model_dir, directory = bundle
+    name = next(name for name in os.listdir(directory) if name.startswith('trees'))
+    with open(os.path.join(directory, name), 'r+b') as f:
+        f.seek(-1, os.SEEK_END)
+        last = f.read(1)
+        f.seek(-1, os.SEEK_END)
+        f.write(bytes([last[0] ^ 0xFF]))
+    with pytest.raises(BundleError, match='Checksum mismatch'):
+        verify_bundle(directory)
+    with pytest.raises(BundleError, match='Checksum mismatch'):
+        load_bundle(model_dir)
+    with pytest.raises(BundleError, match='Checksum mismatch'):
+        load_bundle_trees(model_dir, models=models)
+
+
+def test_trees_disagreeing_with_the_models_are_refused(bundle, models):
+    model_dir, directory = bundle
+    # Checksums updated along, so only the comparison with the boosters can tell
+    name = 'trees_regressor_bias.npy'
+    path = os.path.join(directory, name)
+    np.save(path, np.load(path) + 1000)
+    manifest = rewrite_manifest(directory)
+    rewrite_manifest(directory, checksums=dict(manifest['checksums'], **{name: file_sha256(path)}))
+    with pytest.raises(BundleError, match='do not match the models'):
+        load_bundle_trees(model_dir, models=models)
+
+
+def test_trees_of_another_compiler_are_refused(bundle, models):
+    model_dir, directory = bundle
+    manifest = rewrite_manifest(directory)
+    rewrite_manifest(directory, trees=dict(manifest['trees'], compiler=0))
+    with pytest.raises(BundleError, match='tree compiler'):
+        load_bundle_trees(model_dir, models=models)
+
+
+def test_unsupported_format_is_refused(bundle):
+    model_dir, directory = bundle
+    rewrite_manifest(directory, format=1)
+    with pytest.raises(BundleError, match='Unsupported bundle format'):
+        load_bundle(model_dir)
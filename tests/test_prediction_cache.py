@@ -0,0 +1,39 @@
+"""
+PredictionCache keys results by model version: a result scored by models
+replaced while it was computed is never served
+"""
+from utils.prediction_cache import PredictionCache
+from utils.synthetic import synthetic_records
+
+
+def test_hit_after_put():
+    record = synthetic_records(1, seed=3)[0]
+    cache = PredictionCache(version='v1')
+    assert cache.get(record) is None
+    cache.put(record, {'predicted_emi': 1.0})
+    assert cache.get(dict(record)) == {'predicted_emi': 1.0}
+    assert cache.get(record, 'v2') is None
+
+
+def test_put_from_replaced_version_is_dropped():
+    record = synthetic_records(1, seed=3)[0]
+    cache = PredictionCache(version='v1')
+    version = cache.version
+    # A new version is published while the old one scores the record
+    cache.invalidate('v2')
+    cache.put(record, {'predicted_emi': 1.0}, version)
+    assert cache.stale_puts == 1
+    assert cache.get(record) is None
+    assert cache.get(record, 'v1') is None
+    cache.put(record, {'predicted_emi': 2.0}, 'v2')
+    assert cache.get(record) == {'predicted_emi': 2.0}
+
+
+def test_lru_eviction():
+    records = synthetic_records(3, seed=3)
+    cache = PredictionCache(max_size=2)
+    for i, record in enumerate(records):
+        cache.put(record, i)
+    assert cache.get(records[0]) is None
+    assert [cache.get(record) for record in records[1:]] == [1, 2]
+    assert cache.evictions == 1
@@ -0,0 +1,77 @@
+"""
+Every scoring path gives the pandas path's outputs: whole batches against
+one row at a time (engineer_features), the pandas-free fast path and the
+compiled flat-array trees
+"""
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.fast_path import build_fast_predictor
+from utils.feature_engineering import engineer_features, prepare_features_for_prediction
+from utils.model_files import MODEL_DIR, load_pickles
+from utils.scoring import predict_scaled, scale_features, score_features, score_records
+from utils.synthetic import synthetic_frame
+from utils.tree_ensemble import SMALL_BATCH_ROWS, compile_models, small_batch_predict_fn
+
+
+@pytest.fixture(scope='module')
+def models():
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return load_pickles(MODEL_DIR)
+
+
+@pytest.fixture(scope='module')
+def frame():
+    return synthetic_frame(200, seed=5)
+
+
+def test_batch_features_match_single_rows(frame):
+    batch = engineer_features(frame)
+    rows = pd.concat([engineer_features(frame.iloc[[i]]) for i in range(len(frame))])
+    pd.testing.assert_frame_equal(batch, rows)
+
+
+def test_batch_scores_match_single_rows(models, frame):
+    engineered = engineer_features(frame)
+    batch = score_features(engineered, *models)
+    rows = pd.concat([score_features(engineered.iloc[[i]], *models) for i in range(len(frame))])
+    pd.testing.assert_frame_equal(batch, rows)
+
+
+def test_fast_path_matches_pandas(models, frame):
+    fast = build_fast_predictor(*models)
+    assert fast is not None
+    records = frame.to_dict('records')
+    assert fast.score_records(records) == score_records(records, *models)
+    for record, expected in zip(records[:20], score_records(records[:20], *models)):
+        cls, proba, emi = fast.predict_one(record)
+        assert (cls, proba[1], emi) == (expected['eligibility_class'], expected['approval_probability'],
+                                        expected['predicted_emi'])
+
+
+def test_compiled_trees_match_boosters(models, frame):
+    classification_model, regression_model, scaler = models
+    trees = compile_models(classification_model, regression_model)
+    X_scaled = scale_features(prepare_features_for_prediction(engineer_features(frame)), scaler)
+    expected_classes, expected_proba, expected_emi = predict_scaled(X_scaled, classification_model,
+                                                                    regression_model)
+    classes, proba, emi = trees.predict_scaled(X_scaled)
+    np.testing.assert_array_equal(classes, expected_classes)
+    np.testing.assert_allclose(proba, expected_proba, rtol=0, atol=1e-5)
+    np.testing.assert_allclose(emi, expected_emi, rtol=1e-4, atol=1e-4)
+
+
+def test_small_batch_cutoff():
+    class Trees:
+        def predict_scaled(self, X):
+            return 'trees'
+
+    predict = small_batch_predict_fn(Trees(), lambda X: 'boosters', max_rows=4)
+    assert predict(np.zeros((4, 1))) == 'trees'
+    assert predict(np.zeros((5, 1))) == 'boosters'
+    with pytest.raises(ValueError):
+        small_batch_predict_fn(Trees(), lambda X: 'boosters', max_rows=SMALL_BATCH_ROWS + 1)
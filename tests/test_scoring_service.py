@@ -0,0 +1,81 @@
+"""
+ScoringService.dispatch answers malformed and invalid requests with 400,
+profiling without --allow-profile with 403, and scores the valid
+applicants of a batch next to the errors of the others
+"""
+import asyncio
+import json
+import warnings
+from http import HTTPStatus
+
+import pytest
+
+from utils.model_files import MODEL_DIR, load_pickles
+from utils.scoring import score_records
+from utils.scoring_service import HTTPError, ScoringService
+from utils.synthetic import synthetic_records
+
+
+@pytest.fixture(scope='module')
+def models():
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return load_pickles(MODEL_DIR)
+
+
+@pytest.fixture(scope='module')
+def service(models):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        service = ScoringService(models, workers=2, version='test', allow_profile=False)
+    yield service
+    service.close()
+
+
+def dispatch(service, method, path, body=b''):
+    if not isinstance(body, bytes):
+        body = json.dumps(body).encode()
+    return asyncio.run(service.dispatch(method, path, body))
+
+
+def status_of(service, method, path, body=b''):
+    with pytest.raises(HTTPError) as raised:
+        dispatch(service, method, path, body)
+    return raised.value.status, raised.value.message
+
+
+def test_score_matches_the_pipeline(service, models):
+    record = synthetic_records(1, seed=4)[0]
+    status, result = dispatch(service, 'POST', '/score', record)
+    assert status == HTTPStatus.OK
+    expected = score_records([record], *models)[0]
+    assert {key: result[key] for key in expected} == expected
+    assert result['risk_band'] in ('Approved', 'High Risk', 'Rejected')
+
+
+def test_bad_requests(service):
+    record = synthetic_records(1, seed=4)[0]
+    assert status_of(service, 'POST', '/score', b'{not json')[0] == HTTPStatus.BAD_REQUEST
+    assert status_of(service, 'POST', '/score', [record])[0] == HTTPStatus.BAD_REQUEST
+    assert status_of(service, 'POST', '/score/batch', {'applicants': [1, 2]})[0] == HTTPStatus.BAD_REQUEST
+    status, message = status_of(service, 'POST', '/score', dict(record, age='old'))
+    assert status == HTTPStatus.BAD_REQUEST and message.startswith('Invalid applicant: age')
+    assert status_of(service, 'GET', '/score')[0] == HTTPStatus.METHOD_NOT_ALLOWED
+    assert status_of(service, 'GET', '/nowhere')[0] == HTTPStatus.NOT_FOUND
+
+
+def test_profiling_is_forbidden_unless_allowed(service):
+    record = synthetic_records(1, seed=4)[0]
+    status, message = status_of(service, 'POST', '/score?profile=1', record)
+    assert status == HTTPStatus.FORBIDDEN and '--allow-profile' in message
+
+
+def test_batch_keeps_rejects_in_place(service, models):
+    records = synthetic_records(3, seed=4)
+    bad = dict(records[1], credit_score=5000)
+    status, response = dispatch(service, 'POST', '/score/batch', [records[0], bad, records[2]])
+    assert status == HTTPStatus.OK
+    results = response['results']
+    assert results[1]['error'].startswith('credit_score: out of range')
+    expected = score_records([records[0], records[2]], *models)
+    assert [{key: r[key] for key in expected[0]} for r in (results[0], results[2])] == expected
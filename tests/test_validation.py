@@ -0,0 +1,72 @@
+"""
+validate_frame coerces raw input to the Data Input page's domains and
+rejects what the page could not have produced
+"""
+import numpy as np
+import pandas as pd
+
+from utils.feature_schema import RAW_INPUT_COLUMNS
+from utils.synthetic import synthetic_frame
+from utils.validation import (MISSING, NOT_A_NUMBER, NOT_AN_INTEGER, OUT_OF_RANGE, UNKNOWN_CATEGORY,
+                              validate_frame, validate_records)
+
+
+def field_error(result, row, name):
+    return result.field_errors[row, RAW_INPUT_COLUMNS.index(name)]
+
+
+def test_clean_input_passes_unchanged():
+    frame = synthetic_frame(100, seed=7)
+    result = validate_frame(frame)
+    assert result.n_rejected == 0
+    pd.testing.assert_frame_equal(result.valid_frame(), frame[list(RAW_INPUT_COLUMNS)], check_dtype=False)
+
+
+def test_strings_are_coerced_to_canonical_values():
+    record = synthetic_frame(1, seed=7).to_dict('records')[0]
+    record.update(age='42', monthly_salary=' 55000.5 ', credit_score=710.0, gender='1',
+                  education=' post graduate', employment_type='PRIVATE', house_type='rented ')
+    result = validate_records([record])
+    assert result.n_valid == 1
+    coerced = result.valid_records()[0]
+    assert coerced['age'] == 42 and isinstance(coerced['age'], int)
+    assert coerced['monthly_salary'] == 55000.5
+    assert coerced['credit_score'] == 710 and isinstance(coerced['credit_score'], int)
+    assert coerced['gender'] == 1
+    assert coerced['education'] == 'Post Graduate'
+    assert coerced['employment_type'] == 'Private'
+    assert coerced['house_type'] == 'Rented'
+
+
+def test_bad_fields_are_rejected_with_their_codes():
+    frame = synthetic_frame(6, seed=7).astype(object)
+    frame.loc[0, 'age'] = None
+    frame.loc[1, 'monthly_salary'] = 'lots'
+    frame.loc[2, 'age'] = 30.5
+    frame.loc[3, 'credit_score'] = 950
+    frame.loc[4, 'company_type'] = 'Conglomerate'
+    frame.loc[4, 'gender'] = 2
+    result = validate_frame(frame)
+    assert result.valid.tolist() == [False, False, False, False, False, True]
+    assert field_error(result, 0, 'age') == MISSING
+    assert field_error(result, 1, 'monthly_salary') == NOT_A_NUMBER
+    assert field_error(result, 2, 'age') == NOT_AN_INTEGER
+    assert field_error(result, 3, 'credit_score') == OUT_OF_RANGE
+    assert field_error(result, 4, 'company_type') == UNKNOWN_CATEGORY
+    assert field_error(result, 4, 'gender') == UNKNOWN_CATEGORY
+    assert result.error_code[4] == UNKNOWN_CATEGORY
+    fields = [RAW_INPUT_COLUMNS.index('company_type'), RAW_INPUT_COLUMNS.index('gender')]
+    assert result.error_fields[4] == sum(1 << j for j in fields)
+
+    rejects = result.rejects_frame()
+    assert list(rejects.index) == [0, 1, 2, 3, 4]
+    assert rejects.loc[3, 'error'] == "credit_score: out of range (950, expected 300 to 900)"
+    assert 'company_type: unknown category (Conglomerate' in rejects.loc[4, 'error']
+    assert result.summary()['age'] == {'missing': 1, 'not a whole number': 1}
+
+
+def test_absent_columns_are_missing_in_every_row():
+    frame = synthetic_frame(3, seed=7).drop(columns=['bank_balance'])
+    result = validate_frame(frame)
+    assert result.n_valid == 0
+    assert np.all(result.field_errors[:, RAW_INPUT_COLUMNS.index('bank_balance')] == MISSING)
@@ -0,0 +1,377 @@
+"""
+Append-only audit log of served predictions
+
+Usage: python -m utils.audit_log replay LOG [--output FILE] [--chunk-size N] [--since-id N]
+       python -m utils.audit_log prune LOG [--retention-days N]
+
+AuditLog.record() captures one scoring call: the raw inputs, the scaled
+feature matrix the models were given, the results (class, approval
+probability, EMI), the model version and the latency. It only puts them
+on a bounded queue and returns. A background thread drains the queue and
+appends whatever arrived within flush_interval seconds (at most
+flush_rows applicants) to SQLite in one transaction. The request path
+never waits on the disk.
+
+The log holds applicants' personal data, so nothing is logged unless a
+path is given: EMI_AUDIT_LOG for the Prediction page, --audit-log for
+the scoring service. Rows are kept for retention_days (90 by default,
+EMI_AUDIT_RETENTION_DAYS or --audit-retention-days): the writer deletes
+older ones when it starts and then every hour, and `prune` does the same
+for a log no process is writing.
+
+When the writer falls behind and the queue is full, record() waits at
+most block_timeout seconds (0 by default), then drops the entry and
+counts it in stats()['dropped']. Serving is never slowed down by
+auditing.
+
+Apart from that retention, the predictions table only accepts INSERTs:
+triggers reject UPDATE, and DELETE of rows younger than the last
+retention cutoff. read_audit_log() streams it back in id order as
+DataFrames of chunk_size rows. Each row holds the metadata, the raw
+inputs and the scaled model input as scored (SCALED_PREFIX columns in
+schema order), so a replayed chunk reproduces its predictions through
+scoring.predict_scaled with the logged model version.
+"""
+import argparse
+import atexit
+import json
+import logging
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.feature_schema import RAW_INPUT_COLUMNS, SCHEMA
+from utils.micro_batcher import Histogram
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_PENDING = 10_000
+DEFAULT_FLUSH_ROWS = 1_000
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_CHUNK_SIZE = 10_000
+RETENTION_ENV = 'EMI_AUDIT_RETENTION_DAYS'
+DEFAULT_RETENTION_DAYS = 90
+PRUNE_INTERVAL = 3600.0
+# Seconds close() waits for the writer to take the stop signal and finish
+CLOSE_TIMEOUT = 30.0
+# Replayed model input columns: the schema columns, scaled as scored
+SCALED_PREFIX = 'scaled_'
+
+META_COLUMNS = ['id', 'ts', 'source', 'model_version', 'latency_ms',
+                'eligibility_class', 'approval_probability', 'predicted_emi']
+
+_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS predictions (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    source TEXT,
+    model_version TEXT,
+    latency_ms REAL,
+    eligibility_class INTEGER,
+    approval_probability REAL,
+    predicted_emi REAL,
+    inputs TEXT NOT NULL,
+    features TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS retention (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    cutoff REAL NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS predictions_no_update BEFORE UPDATE ON predictions
+BEGIN SELECT RAISE(ABORT, 'audit log is append-only'); END;
+CREATE TRIGGER IF NOT EXISTS predictions_retention_only BEFORE DELETE ON predictions
+WHEN OLD.ts >= COALESCE((SELECT cutoff FROM retention), 0)
+BEGIN SELECT RAISE(ABORT, 'audit log rows are only deleted past their retention'); END;
+"""
+_INSERT_SQL = """
+INSERT INTO predictions (ts, source, model_version, latency_ms, eligibility_class,
+                         approval_probability, predicted_emi, inputs, features)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+def _connect(path):
+    conn = sqlite3.connect(path)
+    # WAL lets replay readers run while the writer appends
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(_SCHEMA_SQL)
+    return conn
+
+def _plain(value):
+    # NumPy scalars from the models and DataFrames are not JSON serialisable
+    return value.item() if isinstance(value, np.generic) else value
+
+def default_retention_days():
+    return float(os.environ.get(RETENTION_ENV) or DEFAULT_RETENTION_DAYS)
+
+def prune(conn, retention_days):
+    """
+    Delete the rows older than retention_days from an open audit log
+    Returns the number of rows deleted
+    """
+    cutoff = time.time() - retention_days * 86400
+    with conn:
+        conn.execute("INSERT INTO retention (id, cutoff) VALUES (1, ?) "
+                     "ON CONFLICT (id) DO UPDATE SET cutoff = MAX(cutoff, excluded.cutoff)", (cutoff,))
+        return conn.execute("DELETE FROM predictions WHERE ts < (SELECT cutoff FROM retention)").rowcount
+
+class AuditLog:
+    """
+    Prediction audit sink with a background SQLite writer
+    max_pending: scoring calls queued before record() starts dropping
+    block_timeout: seconds record() may wait for queue space
+    retention_days: age past which rows are deleted; EMI_AUDIT_RETENTION_DAYS
+    or 90 by default
+    """
+    def __init__(self, path, max_pending=DEFAULT_MAX_PENDING, flush_rows=DEFAULT_FLUSH_ROWS,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, block_timeout=0.0, retention_days=None):
+        self.path = path
+        self.retention_days = default_retention_days() if retention_days is None else retention_days
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.block_timeout = block_timeout
+        # Fail here, not in the writer thread, when the log cannot be opened
+        _connect(path).close()
+        self._queue = queue.Queue(max_pending)
+        self._lock = threading.Lock()
+        self.flush_sizes = Histogram(flush_rows)
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.flushes = 0
+        self.pruned = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='audit-log', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def record(self, records, results, features, model_version=None, latency_ms=None, source=None):
+        """
+        Queue one scoring call: raw applicant dicts, the scaled
+        (n, n_features) matrix the models scored for them and their result
+        dicts (eligibility_class, approval_probability, predicted_emi)
+        Returns False when the entry was dropped because the queue is full
+        """
+        if self._closed:
+            return False
+        # Copied: callers may reuse their buffers once this returns
+        features = np.array(features, dtype=np.float64).reshape(len(records), SCHEMA.n_features)
+        entry = (time.time(), source, model_version, latency_ms, records, results, features)
+        try:
+            self._queue.put(entry, block=self.block_timeout > 0, timeout=self.block_timeout or None)
+        except queue.Full:
+            with self._lock:
+                self.dropped += len(records)
+            return False
+        with self._lock:
+            self.recorded += len(records)
+        return True
+
+    def flush(self, timeout=None):
+        """
+        Wait until everything recorded so far is written
+        Returns False on timeout
+        """
+        if self._closed:
+            return True
+        if not self._thread.is_alive():
+            return False
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self, timeout=CLOSE_TIMEOUT):
+        """
+        Write what is queued and stop the writer, waiting at most timeout
+        seconds for each; runs at exit
+        """
+        if self._closed:
+            return
+        self._closed = True
+        if not self._thread.is_alive():
+            # The writer died: nothing would ever take the stop signal off a full queue
+            logger.warning("Audit log writer is not running; %d queued entries lost", self._queue.qsize())
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            logger.warning("Audit log writer did not drain its queue in %g s; closing without it", timeout)
+            return
+        self._thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'path': self.path,
+                'recorded': self.recorded,
+                'written': self.written,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'flushes': self.flushes,
+                'pruned': self.pruned,
+                'retention_days': self.retention_days,
+                'pending': self._queue.qsize(),
+                'flush_rows': self.flush_sizes.to_dict(),
+            }
+
+    def _rows(self, entry):
+        ts, source, model_version, latency_ms, records, results, features = entry
+        for record, result, row in zip(records, results, features.tolist()):
+            inputs = {name: _plain(record[name]) for name in RAW_INPUT_COLUMNS}
+            yield (ts, source, model_version, latency_ms, int(result['eligibility_class']),
+                   float(result['approval_probability']), float(result['predicted_emi']),
+                   json.dumps(inputs), json.dumps(row))
+
+    def _prune(self, conn):
+        try:
+            deleted = prune(conn, self.retention_days)
+        except sqlite3.Error:
+            logger.exception("Audit log retention pruning failed")
+            return
+        if deleted:
+            logger.info("Pruned %d audit log rows older than %g days", deleted, self.retention_days)
+        with self._lock:
+            self.pruned += deleted
+
+    def _write(self, conn, entries):
+        if not entries:
+            return
+        try:
+            rows = [row for entry in entries for row in self._rows(entry)]
+            with conn:
+                conn.executemany(_INSERT_SQL, rows)
+        except (sqlite3.Error, KeyError, TypeError, ValueError):
+            failed = sum(len(entry[4]) for entry in entries)
+            logger.exception("Audit log write of %d predictions failed", failed)
+            with self._lock:
+                self.failed += failed
+            return
+        with self._lock:
+            self.written += len(rows)
+            self.flushes += 1
+            self.flush_sizes.observe(len(rows))
+
+    def _run(self):
+        conn = _connect(self.path)
+        self._prune(conn)
+        next_prune = time.monotonic() + PRUNE_INTERVAL
+        pending, rows, waiters = [], 0, []
+        deadline = None
+        while True:
+            if time.monotonic() >= next_prune:
+                self._prune(conn)
+                next_prune = time.monotonic() + PRUNE_INTERVAL
+            timeout = PRUNE_INTERVAL if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                entry = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                entry = False
+            if isinstance(entry, tuple):
+                pending.append(entry)
+                rows += len(entry[4])
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if rows < self.flush_rows:
+                    continue
+            elif isinstance(entry, threading.Event):
+                waiters.append(entry)
+            # Flush: batch full, interval over, flush() or close()
+            self._write(conn, pending)
+            pending, rows, deadline = [], 0, None
+            for waiter in waiters:
+                waiter.set()
+            waiters = []
+            if entry is None:
+                conn.close()
+                return
+
+def read_audit_log(path, chunk_size=DEFAULT_CHUNK_SIZE, since_id=0):
+    """
+    Yield the audit log in id order as DataFrames of at most chunk_size
+    rows: META_COLUMNS, the raw input columns and the scaled model input
+    as scored, one SCALED_PREFIX column per schema column
+    since_id: only rows with a larger id, to resume a previous replay
+    """
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    columns = ', '.join(META_COLUMNS)
+    feature_columns = [SCALED_PREFIX + name for name in SCHEMA.columns]
+    try:
+        last = since_id
+        while True:
+            rows = conn.execute(
+                f"SELECT {columns}, inputs, features FROM predictions WHERE id > ? ORDER BY id LIMIT ?",
+                (last, chunk_size),
+            ).fetchall()
+            if not rows:
+                return
+            meta = pd.DataFrame([row[:len(META_COLUMNS)] for row in rows], columns=META_COLUMNS)
+            inputs = pd.DataFrame([json.loads(row[-2]) for row in rows], columns=list(RAW_INPUT_COLUMNS))
+            features = np.array([json.loads(row[-1]) for row in rows], dtype=np.float64)
+            yield pd.concat([meta, inputs, pd.DataFrame(features, columns=feature_columns)], axis=1)
+            last = rows[-1][0]
+    finally:
+        conn.close()
+
+def main(argv=None):
+    from utils.batch_score import ChunkWriter
+
+    parser = argparse.ArgumentParser(description="Replay or prune the prediction audit log")
+    parser.add_argument('command', choices=['replay', 'prune'])
+    parser.add_argument('log', help="SQLite audit log")
+    parser.add_argument('--output', help="CSV or Parquet file to write the log to (default: print a summary)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f"rows per chunk (default {DEFAULT_CHUNK_SIZE})")
+    parser.add_argument('--since-id', type=int, default=0, help="only rows after this id")
+    parser.add_argument('--retention-days', type=float, default=default_retention_days(),
+                        help=f"prune: delete rows older than this (default {DEFAULT_RETENTION_DAYS}, "
+                             f"or {RETENTION_ENV})")
+    args = parser.parse_args(argv)
+
+    if args.command == 'prune':
+        conn = _connect(args.log)
+        try:
+            deleted = prune(conn, args.retention_days)
+        finally:
+            conn.close()
+        print(f"{deleted:,} predictions older than {args.retention_days:g} days deleted", file=sys.stderr)
+        return 0
+
+    rows, last = 0, args.since_id
+    counts, latencies = {}, []
+    writer = ChunkWriter(args.output) if args.output else None
+    try:
+        for chunk in read_audit_log(args.log, args.chunk_size, args.since_id):
+            rows += len(chunk)
+            last = int(chunk['id'].iloc[-1])
+            if writer is not None:
+                writer.write(chunk)
+                continue
+            for key, n in chunk.groupby(['model_version', 'eligibility_class'], dropna=False).size().items():
+                counts[key] = counts.get(key, 0) + n
+            latencies.append(chunk['latency_ms'].dropna().to_numpy())
+    finally:
+        if writer is not None:
+            writer.close()
+
+    print(f"{rows:,} predictions replayed, last id {last}", file=sys.stderr)
+    if writer is None and rows:
+        for (version, eligibility_class), n in sorted(counts.items(), key=str):
+            print(f"{version}  class {eligibility_class}: {n:,}")
+        latency = np.concatenate(latencies)
+        if len(latency):
+            print(f"latency ms: p50 {np.percentile(latency, 50):.2f}, p95 {np.percentile(latency, 95):.2f}, "
+                  f"p99 {np.percentile(latency, 99):.2f}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,217 @@
+"""
+Offline bulk scoring of applicant files
+
+Usage: python -m utils.batch_score input.parquet output.parquet [--chunk-size N] [--workers N] [--processes]
+                                  [--model-store [ROOT]] [--risk-bands LOW,HIGH] [--no-decisions]
+                                  [--rejects FILE]
+
+The input (CSV or Parquet) holds the 13 raw fields collected on the Data
+Input page. It is streamed in fixed-size chunks through feature
+engineering, scaling and both models, and every chunk is appended to the
+output as soon as it is scored, so memory stays bounded by
+chunk_size * workers rows regardless of file size. With --processes the
+chunks are scored on a process pool (see utils.parallel_score) instead of
+threads, one worker per chunk in flight. --model-store makes those
+workers attach to the shared model store (utils.model_store) instead of
+each loading the models.
+
+Each chunk is validated and coerced first (utils.validation). Only its
+valid rows are scored and written, with the input fields in canonical
+form. Rejected rows are counted per field and error, and with --rejects
+they are written to FILE with error_code, error_fields and error columns.
+
+Unless --no-decisions is given, each scored chunk also gets
+calibrated_probability and risk_band columns (utils.calibration). They
+come from one vectorized pass over the chunk's probabilities.
+"""
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from utils.calibration import RiskBands, load_policy
+from utils.feature_engineering import engineer_features
+from utils.feature_schema import RAW_INPUT_COLUMNS
+from utils.model_bundle import current_version, pickle_version
+from utils.model_files import MODEL_DIR, load_model_files, load_versioned_models
+from utils.model_store import default_root, published_version
+from utils.parallel_score import ParallelScorer
+from utils.scoring import score_features
+from utils.validation import validate_frame
+
+DEFAULT_CHUNK_SIZE = 50_000
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+
+def _is_parquet(path):
+    return os.path.splitext(path)[1].lower() in PARQUET_EXTENSIONS
+
+def read_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield the rows of a CSV or Parquet file as DataFrames of at most chunk_size rows
+    """
+    if _is_parquet(path):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+class ChunkWriter:
+    """
+    Append scored chunks to a CSV or Parquet file
+    """
+    def __init__(self, path):
+        self.path = path
+        self.parquet = _is_parquet(path)
+        self._writer = None
+        self._header = True
+
+    def write(self, df):
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            self._writer.write_table(table.cast(self._writer.schema))
+        else:
+            df.to_csv(self.path, mode='w' if self._header else 'a', header=self._header, index=False)
+            self._header = False
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def score_chunk(chunk, models):
+    """
+    Score one chunk of raw applicant rows
+    Returns eligibility_class, approval_probability and predicted_emi
+    aligned to the index of chunk
+    """
+    return score_features(engineer_features(chunk), *models)
+
+def score_file(input_path, output_path, chunk_size=DEFAULT_CHUNK_SIZE, workers=1, models=None,
+               processes=False, model_store=None, policy=None, rejects_path=None):
+    """
+    Stream input_path through the models into output_path
+    workers: number of chunks scored concurrently; the model libraries
+    release the GIL during prediction, so threads overlap usefully
+    processes: score chunks on a pool of `workers` processes instead
+    model_store: with processes, the shared model store root the workers
+    attach to
+    policy: a DecisionPolicy adding calibrated_probability and risk_band
+    rejects_path: CSV or Parquet file the rows failing validation go to
+    Returns (rows written, rows rejected, {field: {error: rows}})
+    """
+    if processes:
+        executor = ParallelScorer(workers, model_store=model_store)
+        submit = executor.submit
+    else:
+        if models is None:
+            models = load_model_files()
+        executor = ThreadPoolExecutor(max_workers=workers)
+        submit = lambda chunk: executor.submit(score_chunk, chunk, models)
+
+    rows = rejected = 0
+    errors = {}
+    rejects = ChunkWriter(rejects_path) if rejects_path else None
+    with ChunkWriter(output_path) as writer, executor:
+        # At most `workers` chunks in flight; results are written in input order
+        pending = deque()
+        for chunk in read_chunks(input_path, chunk_size):
+            validation = validate_frame(chunk)
+            if validation.n_rejected:
+                rejected += validation.n_rejected
+                for field, counts in validation.summary().items():
+                    for error, n in counts.items():
+                        errors.setdefault(field, {})[error] = errors.get(field, {}).get(error, 0) + n
+                if rejects is not None:
+                    # Input fields as received, as text, so every chunk has the same schema
+                    raw = [name for name in RAW_INPUT_COLUMNS if name in chunk.columns]
+                    rejects.write(validation.rejects_frame().astype(dict.fromkeys(raw, str)))
+            if not validation.n_valid:
+                continue
+            inputs = validation.valid_frame()
+            pending.append((chunk[validation.valid].assign(**inputs), submit(inputs)))
+            if len(pending) >= workers:
+                rows += _write_next(writer, pending, policy)
+        while pending:
+            rows += _write_next(writer, pending, policy)
+    if rejects is not None:
+        rejects.close()
+    return rows, rejected, errors
+
+def _write_next(writer, pending, policy=None):
+    chunk, future = pending.popleft()
+    scores = future.result()
+    if policy is not None:
+        scores = policy.decide_frame(scores)
+    writer.write(pd.concat([chunk, scores], axis=1))
+    return len(chunk)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score an applicant CSV/Parquet file in chunks")
+    parser.add_argument('input', help="CSV or Parquet file with the raw applicant fields")
+    parser.add_argument('output', help="CSV or Parquet file to write scores to")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f"rows per chunk (default {DEFAULT_CHUNK_SIZE})")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="chunks scored concurrently (default 1)")
+    parser.add_argument('--processes', action='store_true',
+                        help="score chunks on a process pool of --workers processes")
+    parser.add_argument('--model-store', nargs='?', const=default_root(), metavar='ROOT',
+                        help=f"with --processes, attach the workers to a shared model store "
+                             f"(default {default_root()})")
+    parser.add_argument('--risk-bands', type=RiskBands.parse, metavar='LOW,HIGH',
+                        help="approval probabilities below LOW are Rejected, above HIGH Approved "
+                             "(default 0.4,0.6, or EMI_RISK_BANDS)")
+    parser.add_argument('--rejects', metavar='FILE',
+                        help="CSV or Parquet file to write rows failing validation to, with their errors")
+    parser.add_argument('--no-decisions', action='store_true',
+                        help="leave out the calibrated_probability and risk_band columns")
+    args = parser.parse_args(argv)
+    if args.model_store and not args.processes:
+        parser.error("--model-store needs --processes")
+    if args.chunk_size < 1 or args.workers < 1:
+        parser.error("--chunk-size and --workers must be positive")
+
+    start = time.perf_counter()
+    if args.processes:
+        # Loaded by the workers; the version is looked up the same way
+        models = None
+        if args.model_store:
+            version = published_version(args.model_store)
+        else:
+            version = current_version(MODEL_DIR) or pickle_version(MODEL_DIR)
+    else:
+        models, version = load_versioned_models()
+    policy = None if args.no_decisions else load_policy(MODEL_DIR, version, args.risk_bands)
+    load_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    rows, rejected, errors = score_file(args.input, args.output, args.chunk_size, args.workers, models,
+                                       args.processes, args.model_store, policy, args.rejects)
+    elapsed = time.perf_counter() - start
+
+    print(f"Scored {rows:,} rows in {elapsed:.2f}s ({rows / elapsed:,.0f} rows/sec); "
+          f"models loaded in {load_time:.2f}s", file=sys.stderr)
+    if rejected:
+        print(f"Rejected {rejected:,} invalid rows" + (f", written to {args.rejects}" if args.rejects else ""),
+              file=sys.stderr)
+        for field, counts in errors.items():
+            print(f"  {field}: " + ', '.join(f"{error} {n:,}" for error, n in counts.items()), file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,372 @@
+"""
+Probability calibration and risk bands
+
+Usage: python -m utils.calibration fit LABELLED_FILE [--label-column NAME] [--positive-label VALUE]
+                                       [--method isotonic|platt] [--chunk-size N] [--seed N]
+       python -m utils.calibration show
+
+The app advertises three bands on the approval probability: Approved
+above 60%, High Risk from 40% to 60%, Rejected below 40%. Those
+thresholds only mean something if the probability is calibrated, and
+boosted trees usually are not.
+
+DecisionPolicy is a post-processing stage that runs after the models. It
+takes a whole array of approval probabilities, maps them through a
+fitted Calibrator and assigns each one a risk band, all in one
+vectorized pass. The cost per row is the same for one applicant or a
+million.
+
+Calibrators are stored as compact arrays in
+models/calibration/<model version>/, next to a report of Brier score and
+expected calibration error before and after calibration on held-out
+applicants:
+  isotonic  the breakpoints of the fitted step function, interpolated
+  platt     slope and intercept of a logistic fit on the logit
+Without a calibrator for the loaded version the probabilities are used
+as they are. The band thresholds default to 40% and 60%. EMI_RISK_BANDS
+("0.4,0.6") overrides them.
+
+fit needs a CSV or Parquet file with the 13 raw Data Input fields and an
+observed outcome column. An applicant counts as approved when the
+outcome equals --positive-label.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from utils.model_bundle import bundle_root
+
+logger = logging.getLogger(__name__)
+
+CALIBRATION_METHODS = ('identity', 'isotonic', 'platt')
+CALIBRATION_FILE = 'calibration.npz'
+REPORT_FILE = 'report.json'
+RISK_BANDS_ENV = 'EMI_RISK_BANDS'
+# (rejected below, approved above), as advertised on the landing page
+DEFAULT_RISK_BANDS = (0.40, 0.60)
+BAND_LABELS = ('Rejected', 'High Risk', 'Approved')
+# Eligibility classes of the classifier with a known meaning: only the
+# approved one, whose probability the original app showed. The others
+# are shown by number until checked against the training label encoder
+APPROVED_CLASS = 1
+CLASS_LABELS = {APPROVED_CLASS: 'Approved'}
+DECISION_COLUMNS = ['calibrated_probability', 'risk_band']
+HOLDOUT_FRACTION = 0.25
+ECE_BINS = 10
+# Keeps the logit finite for probabilities of exactly 0 or 1
+_EPSILON = 1e-7
+
+def calibration_dir(model_dir, version):
+    return os.path.join(bundle_root(model_dir), 'calibration', str(version))
+
+def _logit(p):
+    p = np.clip(p, _EPSILON, 1 - _EPSILON)
+    return np.log(p) - np.log1p(-p)
+
+class Calibrator:
+    """
+    Monotone map from model probabilities to calibrated ones
+    method: 'identity', 'isotonic' (x, y breakpoints) or 'platt' (slope, intercept)
+    """
+    def __init__(self, method='identity', x=None, y=None, slope=1.0, intercept=0.0):
+        if method not in CALIBRATION_METHODS:
+            raise ValueError(f"Calibration method must be one of {', '.join(CALIBRATION_METHODS)}, not {method!r}")
+        if method == 'isotonic' and (x is None or y is None or len(x) != len(y) or len(x) == 0):
+            raise ValueError("Isotonic calibration needs equal-length, non-empty breakpoints")
+        self.method = method
+        self.x = None if x is None else np.ascontiguousarray(x, dtype=np.float64)
+        self.y = None if y is None else np.ascontiguousarray(y, dtype=np.float64)
+        self.slope = float(slope)
+        self.intercept = float(intercept)
+
+    def __call__(self, probabilities):
+        """
+        Calibrated float64 copy of an array of probabilities
+        """
+        p = np.array(probabilities, dtype=np.float64)
+        if self.method == 'isotonic':
+            # Clamped to the end values outside the fitted range, as IsotonicRegression(out_of_bounds='clip')
+            return np.interp(p, self.x, self.y)
+        if self.method == 'platt':
+            return 1 / (1 + np.exp(-(self.slope * _logit(p) + self.intercept)))
+        return p
+
+    def arrays(self):
+        arrays = {'method': np.array(self.method), 'platt': np.array([self.slope, self.intercept])}
+        if self.method == 'isotonic':
+            arrays.update(x=self.x, y=self.y)
+        return arrays
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        np.savez(os.path.join(directory, CALIBRATION_FILE), **self.arrays())
+
+    @classmethod
+    def load(cls, directory):
+        with np.load(os.path.join(directory, CALIBRATION_FILE)) as arrays:
+            slope, intercept = arrays['platt'].tolist()
+            return cls(str(arrays['method']), arrays.get('x'), arrays.get('y'), slope, intercept)
+
+    def describe(self):
+        if self.method == 'isotonic':
+            return {'method': self.method, 'breakpoints': len(self.x)}
+        if self.method == 'platt':
+            return {'method': self.method, 'slope': self.slope, 'intercept': self.intercept}
+        return {'method': self.method}
+
+def fit_calibrator(probabilities, labels, method='isotonic'):
+    """
+    Calibrator mapping approval probabilities to the observed approval
+    rate of labels (1 approved, 0 not)
+    """
+    from sklearn.isotonic import IsotonicRegression
+    from sklearn.linear_model import LogisticRegression
+
+    p = np.asarray(probabilities, dtype=np.float64)
+    labels = np.asarray(labels, dtype=np.float64)
+    if len(np.unique(labels)) < 2:
+        raise ValueError("Calibration needs both approved and not approved outcomes")
+    if method == 'isotonic':
+        isotonic = IsotonicRegression(y_min=0.0, y_max=1.0, out_of_bounds='clip').fit(p, labels)
+        # Only the breakpoints of the step function are kept
+        return Calibrator('isotonic', isotonic.X_thresholds_, isotonic.y_thresholds_)
+    if method == 'platt':
+        logistic = LogisticRegression(C=1e6).fit(_logit(p).reshape(-1, 1), labels)
+        return Calibrator('platt', slope=logistic.coef_[0, 0], intercept=logistic.intercept_[0])
+    raise ValueError(f"Cannot fit a {method!r} calibrator")
+
+class RiskBands:
+    """
+    Approval probability thresholds: Rejected below rejected_below,
+    Approved above approved_above, High Risk in between (inclusive)
+    """
+    def __init__(self, rejected_below=DEFAULT_RISK_BANDS[0], approved_above=DEFAULT_RISK_BANDS[1]):
+        if not 0.0 <= rejected_below <= approved_above <= 1.0:
+            raise ValueError(f"Risk band thresholds must satisfy 0 <= {rejected_below} <= {approved_above} <= 1")
+        self.rejected_below = float(rejected_below)
+        self.approved_above = float(approved_above)
+
+    @classmethod
+    def parse(cls, text):
+        """
+        RiskBands from "LOW,HIGH"
+        """
+        try:
+            low, high = (float(value) for value in text.split(','))
+        except ValueError:
+            raise ValueError(f"Risk bands must be two probabilities LOW,HIGH, not {text!r}")
+        return cls(low, high)
+
+    def assign(self, probabilities):
+        """
+        int8 band codes indexing BAND_LABELS: 0 Rejected, 1 High Risk, 2 Approved
+        """
+        p = np.asarray(probabilities)
+        return (p >= self.rejected_below).astype(np.int8) + (p > self.approved_above)
+
+    def describe(self):
+        return {'rejected_below': self.rejected_below, 'approved_above': self.approved_above}
+
+def default_risk_bands():
+    """
+    RiskBands from EMI_RISK_BANDS, else the advertised 40% / 60%
+    """
+    text = os.environ.get(RISK_BANDS_ENV)
+    return RiskBands.parse(text) if text else RiskBands()
+
+class DecisionPolicy:
+    """
+    Calibration followed by risk banding of approval probabilities
+    version: model version the calibrator was fitted for
+    """
+    def __init__(self, calibrator=None, bands=None, version=None):
+        self.calibrator = calibrator or Calibrator()
+        self.bands = bands or RiskBands()
+        self.version = version
+
+    @property
+    def calibrated(self):
+        """
+        False when probabilities pass through unchanged (no calibration fitted)
+        """
+        return self.calibrator.method != 'identity'
+
+    def decide(self, approval_probability):
+        """
+        (calibrated probabilities, band codes) for an array of approval probabilities
+        """
+        calibrated = self.calibrator(approval_probability)
+        return calibrated, self.bands.assign(calibrated)
+
+    def decide_one(self, approval_probability):
+        """
+        (calibrated probability, band label) for one applicant
+        """
+        calibrated, codes = self.decide([approval_probability])
+        return float(calibrated[0]), BAND_LABELS[codes[0]]
+
+    def decide_frame(self, scores):
+        """
+        scores (a frame with approval_probability) with DECISION_COLUMNS added
+        """
+        calibrated, codes = self.decide(scores['approval_probability'].to_numpy())
+        return scores.assign(calibrated_probability=calibrated,
+                             risk_band=pd.Categorical.from_codes(codes, BAND_LABELS))
+
+    def decide_records(self, results):
+        """
+        Result dicts (as from score_records) with DECISION_COLUMNS added
+        """
+        if not results:
+            return results
+        calibrated, codes = self.decide([result['approval_probability'] for result in results])
+        return [
+            dict(result, calibrated_probability=p, risk_band=BAND_LABELS[code])
+            for result, p, code in zip(results, calibrated.tolist(), codes.tolist())
+        ]
+
+    def describe(self):
+        return {'version': self.version, 'calibrated': self.calibrated, 'calibration': self.calibrator.describe(),
+                'bands': self.bands.describe()}
+
+def class_label(eligibility_class):
+    """
+    Display name of an eligibility class: 'Approved (class 1)', else
+    e.g. 'Class 2'
+    """
+    label = CLASS_LABELS.get(eligibility_class)
+    return f"{label} (class {eligibility_class})" if label else f"Class {eligibility_class}"
+
+def load_calibrator(model_dir, version):
+    """
+    Calibrator fitted for the models of this version, or None
+    """
+    directory = calibration_dir(model_dir, version)
+    try:
+        return Calibrator.load(directory)
+    except FileNotFoundError:
+        logger.warning("No calibration fitted for model version %s; the risk bands apply to uncalibrated "
+                       "probabilities (fit one with python -m utils.calibration fit)", version)
+    except (OSError, KeyError, ValueError) as e:
+        logger.warning("Calibration for model version %s unusable, using raw probabilities: %s", version, e)
+    return None
+
+def load_policy(model_dir, version, bands=None):
+    """
+    DecisionPolicy for the models of this version
+    bands: defaults to EMI_RISK_BANDS or the advertised thresholds
+    """
+    calibrator = None
+    if version is not None:
+        calibrator = load_calibrator(model_dir, version)
+    else:
+        logger.warning("Unknown model version, no calibration loaded; the risk bands apply to uncalibrated "
+                       "probabilities")
+    return DecisionPolicy(calibrator, bands or default_risk_bands(), version)
+
+def calibration_metrics(probabilities, labels, bands=None, bins=ECE_BINS):
+    """
+    Brier score, expected calibration error and band counts with their
+    observed approval rates
+    """
+    p = np.asarray(probabilities, dtype=np.float64)
+    labels = np.asarray(labels, dtype=np.float64)
+    bins_of = np.minimum((p * bins).astype(np.int64), bins - 1)
+    counts = np.bincount(bins_of, minlength=bins)
+    gaps = np.abs(np.bincount(bins_of, p - labels, minlength=bins))
+    codes = (bands or RiskBands()).assign(p)
+    return {
+        'rows': len(p),
+        'brier': float(np.mean((p - labels) ** 2)),
+        'ece': float(gaps.sum() / max(len(p), 1)),
+        'mean_probability': float(p.mean()),
+        'approval_rate': float(labels.mean()),
+        'bands': {
+            label: {'count': int((codes == code).sum()),
+                    'approval_rate': float(labels[codes == code].mean()) if (codes == code).any() else None}
+            for code, label in enumerate(BAND_LABELS)
+        },
+        'bin_counts': counts.tolist(),
+    }
+
+def score_labelled(path, label_column, positive_label, chunk_size, models=None):
+    """
+    Approval probabilities and 0/1 outcomes of a labelled applicant file
+    """
+    from utils.batch_score import read_chunks, score_chunk
+    from utils.model_files import load_model_files
+
+    models = models or load_model_files()
+    probabilities, labels = [], []
+    for chunk in read_chunks(path, chunk_size):
+        if label_column not in chunk:
+            raise ValueError(f"{path} has no {label_column!r} column")
+        probabilities.append(score_chunk(chunk, models)['approval_probability'].to_numpy())
+        labels.append((chunk[label_column].astype(str) == str(positive_label)).to_numpy())
+    return np.concatenate(probabilities), np.concatenate(labels).astype(np.int8)
+
+def main(argv=None):
+    from utils.batch_score import DEFAULT_CHUNK_SIZE
+    from utils.model_files import MODEL_DIR, load_versioned_models
+
+    parser = argparse.ArgumentParser(description="Fit or show the probability calibration of the models")
+    parser.add_argument('command', choices=['fit', 'show'])
+    parser.add_argument('labelled', nargs='?', help="fit: CSV or Parquet file of applicants with outcomes")
+    parser.add_argument('--model-dir', default=MODEL_DIR)
+    parser.add_argument('--label-column', default='emi_eligibility', help="observed outcome column")
+    parser.add_argument('--positive-label', default='1', help="outcome value meaning approved (default 1)")
+    parser.add_argument('--method', choices=CALIBRATION_METHODS[1:], default='isotonic')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--seed', type=int, default=0, help="seed of the held-out split")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    models, version = load_versioned_models(args.model_dir)
+    if args.command == 'show':
+        directory = calibration_dir(args.model_dir, version)
+        report = None
+        if os.path.exists(os.path.join(directory, REPORT_FILE)):
+            with open(os.path.join(directory, REPORT_FILE)) as f:
+                report = json.load(f)
+        print(json.dumps({'policy': load_policy(args.model_dir, version).describe(), 'report': report}, indent=2))
+        return 0
+    if args.labelled is None:
+        parser.error("fit needs a labelled applicant file")
+
+    start = time.perf_counter()
+    try:
+        probabilities, labels = score_labelled(args.labelled, args.label_column, args.positive_label,
+                                               args.chunk_size, models)
+        order = np.random.default_rng(args.seed).permutation(len(labels))
+        holdout, train = order[:int(len(order) * HOLDOUT_FRACTION)], order[int(len(order) * HOLDOUT_FRACTION):]
+        calibrator = fit_calibrator(probabilities[train], labels[train], args.method)
+    except ValueError as e:
+        logger.error("%s", e)
+        return 1
+    bands = default_risk_bands()
+    report = {
+        'version': version,
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'source': os.path.abspath(args.labelled),
+        'calibration': calibrator.describe(),
+        'holdout_before': calibration_metrics(probabilities[holdout], labels[holdout], bands),
+        'holdout_after': calibration_metrics(calibrator(probabilities[holdout]), labels[holdout], bands),
+        'fit_seconds': time.perf_counter() - start,
+    }
+    directory = calibration_dir(args.model_dir, version)
+    calibrator.save(directory)
+    with open(os.path.join(directory, REPORT_FILE), 'w') as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps({key: report[key] for key in ('calibration', 'holdout_before', 'holdout_after')}, indent=2))
+    print(f"Calibration for {version} written to {directory}", file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,236 @@
+"""
+Distillation of the models into compact surrogate scorers
+
+Usage: python -m utils.distill [--samples N] [--trees N] [--depth N] [--seed N]
+
+The loaded models act as teachers. They are run over seeded synthetic
+applicants (utils.synthetic), and two small depth-limited XGBoost
+ensembles are fitted to their outputs:
+  - the classifier's raw margins, one output per class, with samples
+    weighted by inverse class frequency so the rare classes are learned
+  - the regression EMI, from the same regression input layout
+Each ensemble is then compiled to flat NumPy arrays with
+utils.tree_ensemble. Evaluating it takes one vectorized step per tree
+level and does not touch XGBoost.
+
+A report on held-out applicants compares surrogate and teacher. It
+covers class agreement overall and per class, probability error, EMI
+error, size and latency. The surrogate is only served when the report
+passes its guardrails and was made for the models currently loaded.
+Arrays and report are stored in models/surrogates/<model version>/.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from utils.feature_engineering import engineer_features, prepare_features_for_prediction
+from utils.feature_schema import SCHEMA
+from utils.model_bundle import bundle_root
+from utils.scoring import predict_scaled, scale_features
+from utils.synthetic import synthetic_frame
+from utils.tree_ensemble import CompiledTrees, TreePredictor
+
+logger = logging.getLogger(__name__)
+
+SURROGATE_FILE = 'surrogate.npz'
+REPORT_FILE = 'report.json'
+
+DEFAULT_SAMPLES = 300_000
+DEFAULT_TREES = 50
+DEFAULT_DEPTH = 6
+DEFAULT_LEARNING_RATE = 0.25
+HOLDOUT_FRACTION = 0.25
+
+# The surrogate is rejected unless all of these hold on held-out applicants
+GUARDRAILS = {
+    'min_agreement': 0.99,
+    'min_class_agreement': 0.9,
+    'max_emi_relative_mae': 0.05,
+}
+
+def surrogate_dir(model_dir, version):
+    return os.path.join(bundle_root(model_dir), 'surrogates', str(version))
+
+class SurrogatePredictor(TreePredictor):
+    """
+    Compiled surrogate pair, stored as one .npz file
+    """
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        np.savez(os.path.join(directory, SURROGATE_FILE), **self.arrays())
+
+    @classmethod
+    def load(cls, directory):
+        with np.load(os.path.join(directory, SURROGATE_FILE)) as arrays:
+            return cls.from_arrays(arrays)
+
+def teacher_dataset(models, n, seed):
+    """
+    Scaled float32 features of n synthetic applicants and the teachers'
+    (classes, probabilities, emi, classification margins) on them
+    """
+    classification_model, regression_model, scaler = models
+    X = prepare_features_for_prediction(engineer_features(synthetic_frame(n, seed)))
+    X_scaled = np.asarray(scale_features(X, scaler), dtype=np.float32)
+    classes, proba, emi = predict_scaled(X_scaled, classification_model, regression_model)
+    margins = classification_model.get_booster().inplace_predict(X_scaled, predict_type='margin')
+    return X_scaled, classes, proba, emi, np.asarray(margins).reshape(n, -1)
+
+def distill(models, samples=DEFAULT_SAMPLES, trees=DEFAULT_TREES, depth=DEFAULT_DEPTH,
+            learning_rate=DEFAULT_LEARNING_RATE, seed=0):
+    """
+    Fit and compile surrogates of models on synthetic applicants
+    Returns (SurrogatePredictor, held-out teacher dataset)
+    """
+    from xgboost import XGBRegressor
+
+    classification_model = models[0]
+    holdout = int(samples * HOLDOUT_FRACTION)
+    X, classes, proba, emi, margins = teacher_dataset(models, samples, seed)
+    train = slice(holdout, None)
+    teacher_classes = np.asarray(classification_model.classes_)
+
+    # Inverse class frequency weights keep the rare classes from being ignored
+    counts = np.array([(classes[train] == c).sum() for c in teacher_classes], dtype=np.float64)
+    weights = 1 / np.maximum(counts, 1)[np.searchsorted(teacher_classes, classes[train])]
+    weights *= len(weights) / weights.sum()
+
+    params = dict(n_estimators=trees, max_depth=depth, learning_rate=learning_rate,
+                  tree_method='hist', random_state=seed)
+    student_classifier = XGBRegressor(multi_strategy='one_output_per_tree', **params)
+    student_classifier.fit(X[train], margins[train], sample_weight=weights)
+    student_regressor = XGBRegressor(**params)
+    X_regression = SCHEMA.regression_input(X, classes)
+    student_regressor.fit(X_regression[train], emi[train])
+
+    classifier = CompiledTrees.from_booster(student_classifier.get_booster(), depth, margins.shape[1])
+    classifier.check(student_classifier.get_booster(), X[train][:4096])
+    regressor = CompiledTrees.from_booster(student_regressor.get_booster(), depth)
+    regressor.check(student_regressor.get_booster(), X_regression[train][:4096])
+
+    surrogate = SurrogatePredictor(classifier, regressor, teacher_classes)
+    return surrogate, (X[:holdout], classes[:holdout], proba[:holdout], emi[:holdout])
+
+def _latency_ms(fn, X, repeats=20):
+    fn(X)
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(X)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def evaluate(surrogate, models, holdout, guardrails=GUARDRAILS):
+    """
+    Agreement, error, size and latency of surrogate against the teachers
+    on the held-out applicants, with the guardrail verdict
+    """
+    classification_model, regression_model, _ = models
+    X, classes, proba, emi = holdout
+    s_classes, s_proba, s_emi = surrogate.predict_scaled(X)
+
+    class_agreement = {
+        str(c): float((s_classes[classes == c] == c).mean()) if (classes == c).any() else None
+        for c in surrogate.classes.tolist()
+    }
+    emi_error = np.abs(s_emi - emi)
+    metrics = {
+        'rows': len(X),
+        'agreement': float((s_classes == classes).mean()),
+        'class_agreement': class_agreement,
+        'class_counts': {str(c): int((classes == c).sum()) for c in surrogate.classes.tolist()},
+        'probability_mae': float(np.abs(s_proba - proba).mean()),
+        'probability_max_error': float(np.abs(s_proba - proba).max()),
+        'emi_mae': float(emi_error.mean()),
+        'emi_relative_mae': float(emi_error.mean() / max(np.abs(emi).mean(), 1e-9)),
+        'emi_p99_error': float(np.percentile(emi_error, 99)),
+    }
+
+    def teacher(rows):
+        return predict_scaled(rows, classification_model, regression_model)
+
+    latency = {}
+    for rows in (1, 1000):
+        latency[f'teacher_ms_{rows}'] = _latency_ms(teacher, X[:rows])
+        latency[f'surrogate_ms_{rows}'] = _latency_ms(surrogate.predict_scaled, X[:rows])
+
+    failures = []
+    if metrics['agreement'] < guardrails['min_agreement']:
+        failures.append(f"agreement {metrics['agreement']:.4f} < {guardrails['min_agreement']}")
+    for c, agreement in class_agreement.items():
+        if agreement is not None and agreement < guardrails['min_class_agreement']:
+            failures.append(f"class {c} agreement {agreement:.4f} < {guardrails['min_class_agreement']}")
+    if metrics['emi_relative_mae'] > guardrails['max_emi_relative_mae']:
+        failures.append(f"EMI relative MAE {metrics['emi_relative_mae']:.4f} > {guardrails['max_emi_relative_mae']}")
+    return {
+        'metrics': metrics,
+        'latency': latency,
+        'guardrails': dict(guardrails),
+        'failures': failures,
+        'passed': not failures,
+    }
+
+def save_surrogate(surrogate, report, model_dir, version):
+    directory = surrogate_dir(model_dir, version)
+    surrogate.save(directory)
+    report = dict(report, version=version,
+                  surrogate_bytes=os.path.getsize(os.path.join(directory, SURROGATE_FILE)))
+    with open(os.path.join(directory, REPORT_FILE), 'w') as f:
+        json.dump(report, f, indent=2)
+    return directory
+
+def load_surrogate(model_dir, version):
+    """
+    SurrogatePredictor distilled from the models of this version, or None
+    when there is none or its report did not pass the guardrails
+    """
+    directory = surrogate_dir(model_dir, version)
+    try:
+        with open(os.path.join(directory, REPORT_FILE)) as f:
+            report = json.load(f)
+        if not report.get('passed'):
+            logger.warning("Surrogate for %s failed its guardrails: %s", version, '; '.join(report['failures']))
+            return None
+        return SurrogatePredictor.load(directory)
+    except FileNotFoundError:
+        logger.warning("No surrogate distilled for model version %s", version)
+        return None
+
+def main(argv=None):
+    from utils.model_files import MODEL_DIR, load_versioned_models
+
+    parser = argparse.ArgumentParser(description="Distill the models into compact surrogates")
+    parser.add_argument('--model-dir', default=MODEL_DIR)
+    parser.add_argument('--samples', type=int, default=DEFAULT_SAMPLES,
+                        help=f"synthetic applicants, a quarter held out (default {DEFAULT_SAMPLES:,})")
+    parser.add_argument('--trees', type=int, default=DEFAULT_TREES,
+                        help=f"boosting rounds per surrogate (default {DEFAULT_TREES})")
+    parser.add_argument('--depth', type=int, default=DEFAULT_DEPTH, help=f"tree depth (default {DEFAULT_DEPTH})")
+    parser.add_argument('--learning-rate', type=float, default=DEFAULT_LEARNING_RATE)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    models, version = load_versioned_models(args.model_dir)
+    start = time.perf_counter()
+    surrogate, holdout = distill(models, args.samples, args.trees, args.depth, args.learning_rate, args.seed)
+    report = evaluate(surrogate, models, holdout)
+    report.update({
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'config': {'samples': args.samples, 'trees': args.trees, 'depth': args.depth,
+                   'learning_rate': args.learning_rate, 'seed': args.seed},
+        'distill_seconds': time.perf_counter() - start,
+    })
+    directory = save_surrogate(surrogate, report, args.model_dir, version)
+    print(json.dumps({key: report[key] for key in ('metrics', 'latency', 'failures', 'passed')}, indent=2))
+    print(f"Surrogate for {version} written to {directory}", file=sys.stderr)
+    return 0 if report['passed'] else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
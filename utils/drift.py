@@ -0,0 +1,509 @@
+"""
+Drift and data-quality monitoring of scored traffic
+
+Usage: python -m utils.drift reference INPUT [--chunk-size N]
+       python -m utils.drift report (INPUT | --audit-log LOG) [--chunk-size N]
+
+A DriftSketch summarises any number of scored applicants in constant
+memory. Every scaled feature (z = (x - mean) / scale) is counted in
+a histogram on one fixed grid (82 bins, 0.125 standard deviations wide
+within +-5, and two tails), with running sums of z and z squared. The
+model outputs get the same treatment: class counts and histograms of the
+approval probability and of log(1 + EMI). The grid is uniform and shared
+by all 43 features, so observing a batch is a little arithmetic and one
+bincount over the whole matrix. Sketches add and subtract, so the traffic
+of a time window is the difference of two snapshots.
+
+drift_report() compares a sketch with
+  - the scaler: mean shift and std ratio in training standard
+    deviations, and category proportions against the one-hot means
+  - a reference sketch, when one was taken for the model version: PSI
+    over the reference's deciles and the KS distance of the histograms,
+    for every feature and output
+and lists the features past the alert thresholds. Approximate quantiles
+are read back off the histograms.
+
+DriftMonitor observes scored batches inline (a few tens of microseconds
+per call). With report_path, a daemon thread writes the report of the
+last window to that file as JSON every report_interval seconds.
+"""
+import argparse
+import atexit
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from utils.feature_schema import CATEGORY_DOMAINS, SCHEMA
+from utils.model_bundle import bundle_root
+
+logger = logging.getLogger(__name__)
+
+# Histogram grid of the scaled features, shared by all of them
+Z_EDGES = np.linspace(-5.0, 5.0, 81)
+Z_STEP = Z_EDGES[1] - Z_EDGES[0]
+N_BINS = len(Z_EDGES) + 1
+PROBABILITY_EDGES = np.linspace(0.0, 1.0, 51)[1:-1]
+EMI_EDGES = np.linspace(0.0, np.log1p(1e6), 65)[1:-1]
+PSI_BINS = 10
+QUANTILES = (0.05, 0.5, 0.95)
+REFERENCE_FILE = 'reference.npz'
+DEFAULT_REPORT_INTERVAL = 60.0
+
+# Alert thresholds; PSI above 0.2 is the usual "significant shift"
+ALERTS = {
+    'psi': 0.2,
+    'ks': 0.1,
+    'mean_shift': 0.5,
+    'std_ratio': (0.5, 2.0),
+    'category_psi': 0.2,
+    'nonfinite_rate': 0.0,
+    # Fewer rows only raise non-finite alerts
+    'min_rows': 100,
+}
+# Not collected: engineer_features sets them to defaults, so they always
+# differ from training; only a reference comparison applies to them
+FIXED_FEATURES = ('family_size', 'dependents', 'existing_loans', 'current_emi_amount', 'emi_scenario',
+                  'requested_tenure', 'debt_to_income_ratio')
+# Keeps PSI finite where one side has no mass
+_EPSILON = 1e-4
+
+def drift_dir(model_dir, version):
+    return os.path.join(bundle_root(model_dir), 'drift', str(version))
+
+class DriftSketch:
+    """
+    Constant-memory summary of scored applicants
+    """
+    ARRAYS = ('counts', 'sums', 'squares', 'nonfinite', 'class_counts', 'probability_counts', 'emi_counts')
+
+    def __init__(self, n_classes, n_features=SCHEMA.n_features):
+        self.n = 0
+        self.counts = np.zeros((n_features, N_BINS), dtype=np.int64)
+        self.sums = np.zeros(n_features)
+        self.squares = np.zeros(n_features)
+        self.nonfinite = np.zeros(n_features, dtype=np.int64)
+        self.class_counts = np.zeros(n_classes, dtype=np.int64)
+        self.probability_counts = np.zeros(len(PROBABILITY_EDGES) + 1, dtype=np.int64)
+        self.emi_counts = np.zeros(len(EMI_EDGES) + 1, dtype=np.int64)
+        # Row offsets that make every feature's bins one flat bincount
+        self._offsets = np.arange(n_features) * N_BINS
+
+    def observe(self, Z, class_index, probability, emi):
+        """
+        Add scaled rows Z (n, n_features), the index of their predicted
+        class, their approval probability and EMI
+        """
+        Z = np.asarray(Z).reshape(-1, len(self.sums))
+        finite = np.isfinite(Z)
+        clean = bool(finite.all())
+        values = Z.astype(np.float64) if clean else np.where(finite, Z, 0.0)
+        # The grid is uniform: the bin is arithmetic, no search needed
+        # (same bins as np.searchsorted(Z_EDGES, values))
+        position = (values - Z_EDGES[0]) * (1 / Z_STEP)
+        np.ceil(position, out=position)
+        np.clip(position, 0, N_BINS - 1, out=position)
+        bins = position.astype(np.intp)
+        bins += self._offsets
+        self.counts += np.bincount(bins.ravel() if clean else bins[finite],
+                                   minlength=self.counts.size).reshape(self.counts.shape)
+        self.sums += values.sum(axis=0)
+        self.squares += np.einsum('ij,ij->j', values, values)
+        if not clean:
+            self.nonfinite += len(Z) - finite.sum(axis=0)
+        self.class_counts += np.bincount(class_index, minlength=len(self.class_counts))
+        self.probability_counts += np.bincount(np.searchsorted(PROBABILITY_EDGES, probability, side='right'),
+                                               minlength=len(self.probability_counts))
+        emi = np.log1p(np.maximum(np.asarray(emi, dtype=np.float64), 0.0))
+        self.emi_counts += np.bincount(np.searchsorted(EMI_EDGES, emi, side='right'),
+                                       minlength=len(self.emi_counts))
+        self.n += len(Z)
+
+    def arrays(self):
+        return dict({name: getattr(self, name) for name in self.ARRAYS}, n=np.array(self.n))
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        sketch = cls(len(arrays['class_counts']), len(arrays['sums']))
+        for name in cls.ARRAYS:
+            setattr(sketch, name, np.array(arrays[name]))
+        sketch.n = int(arrays['n'])
+        return sketch
+
+    def copy(self):
+        return self.from_arrays(self.arrays())
+
+    def __sub__(self, other):
+        # Only meaningful for an earlier snapshot of the same sketch
+        return self.from_arrays({name: value - other.arrays()[name] for name, value in self.arrays().items()})
+
+    def __add__(self, other):
+        return self.from_arrays({name: value + other.arrays()[name] for name, value in self.arrays().items()})
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        np.savez(os.path.join(directory, REFERENCE_FILE), **self.arrays())
+
+    @classmethod
+    def load(cls, directory):
+        with np.load(os.path.join(directory, REFERENCE_FILE)) as arrays:
+            return cls.from_arrays(arrays)
+
+def _proportions(counts):
+    totals = counts.sum(axis=-1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return counts / totals
+
+def psi(current, reference, bins=PSI_BINS):
+    """
+    Population stability index of histograms (..., B) sharing one grid,
+    after merging the grid into the reference's `bins` quantile groups
+    NaN where either side is empty
+    """
+    current, reference = np.atleast_2d(_proportions(current)), np.atleast_2d(_proportions(reference))
+    # Group of every bin: the reference decile its left edge falls in
+    groups = np.minimum((np.cumsum(reference, axis=1) - reference) * bins, bins - 1).astype(np.int64)
+    groups += np.arange(len(groups))[:, None] * bins
+    grouped = [
+        np.bincount(groups.ravel(), np.nan_to_num(p).ravel(), minlength=len(groups) * bins).reshape(-1, bins)
+        for p in (current, reference)
+    ]
+    current_groups, reference_groups = (np.maximum(g, _EPSILON) for g in grouped)
+    value = ((current_groups - reference_groups) * np.log(current_groups / reference_groups)).sum(axis=1)
+    empty = np.isnan(current).all(axis=1) | np.isnan(reference).all(axis=1)
+    return np.where(empty, np.nan, value)
+
+def ks(current, reference):
+    """
+    Kolmogorov-Smirnov distance of histograms (..., B) sharing one grid
+    """
+    current, reference = np.atleast_2d(_proportions(current)), np.atleast_2d(_proportions(reference))
+    return np.abs(np.cumsum(current, axis=1) - np.cumsum(reference, axis=1)).max(axis=1)
+
+def sketch_quantiles(counts, qs=QUANTILES):
+    """
+    Approximate quantiles in z units, (n_features, len(qs)), interpolated
+    within the histogram bins; tails report the grid's end
+    """
+    cdf = np.cumsum(_proportions(counts), axis=1)
+    lower = np.concatenate([[Z_EDGES[0]], Z_EDGES])
+    upper = np.concatenate([Z_EDGES, [Z_EDGES[-1]]])
+    out = np.empty((len(counts), len(qs)))
+    rows = np.arange(len(counts))
+    for j, q in enumerate(qs):
+        idx = np.minimum((cdf < q).sum(axis=1), N_BINS - 1)
+        before = np.where(idx > 0, cdf[rows, np.maximum(idx - 1, 0)], 0.0)
+        width = cdf[rows, idx] - before
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fraction = np.clip(np.where(width > 0, (q - before) / width, 0.0), 0.0, 1.0)
+        out[:, j] = lower[idx] + fraction * (upper[idx] - lower[idx])
+    return out
+
+def _category_proportions(means):
+    # One-hot means in raw units are category proportions; the baseline is the rest
+    return {
+        field: np.array([1 - sum(means[SCHEMA.index[c]] for c in mapping.values())]
+                        + [means[SCHEMA.index[c]] for c in mapping.values()])
+        for field, mapping in SCHEMA.one_hot.items()
+    }
+
+def _category_names(field):
+    mapping = SCHEMA.one_hot[field]
+    baseline = [c for c in CATEGORY_DOMAINS.get(field, []) if c not in mapping]
+    return [baseline[0] if baseline else 'other'] + list(mapping)
+
+def _category_psi(current, expected):
+    # PSI over categories, which need no binning
+    current, expected = np.maximum(current, _EPSILON), np.maximum(expected, _EPSILON)
+    return float(((current - expected) * np.log(current / expected)).sum())
+
+def _number(value):
+    value = float(value)
+    return None if np.isnan(value) else round(value, 6)
+
+def drift_report(sketch, mean, scale, classes, reference=None, thresholds=ALERTS):
+    """
+    Drift of a sketch against the scaler statistics (mean, scale) and an
+    optional reference sketch, as a JSON-serialisable dict
+    """
+    rows = np.maximum(sketch.n - sketch.nonfinite, 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_shift = sketch.sums / rows
+        std_ratio = np.sqrt(np.maximum(sketch.squares / rows - mean_shift ** 2, 0.0))
+    quantiles = sketch_quantiles(sketch.counts) * scale[:, None] + mean[:, None]
+    feature_psi = feature_ks = None
+    if reference is not None:
+        feature_psi, feature_ks = psi(sketch.counts, reference.counts), ks(sketch.counts, reference.counts)
+
+    features, alerts = {}, []
+    sampled = sketch.n >= thresholds['min_rows']
+    for i, name in enumerate(SCHEMA.columns):
+        entry = {
+            'mean_shift': _number(mean_shift[i]),
+            'std_ratio': _number(std_ratio[i]),
+            'nonfinite': int(sketch.nonfinite[i]),
+            **{f"p{round(q * 100):02d}": _number(quantiles[i, j]) for j, q in enumerate(QUANTILES)},
+        }
+        if reference is not None:
+            entry.update(psi=_number(feature_psi[i]), ks=_number(feature_ks[i]))
+        features[name] = entry
+        if sketch.n and sketch.nonfinite[i] / sketch.n > thresholds['nonfinite_rate']:
+            alerts.append(f"{name}: {sketch.nonfinite[i]} non-finite values")
+        if not sampled:
+            continue
+        if name not in FIXED_FEATURES and rows[i]:
+            if abs(mean_shift[i]) > thresholds['mean_shift']:
+                alerts.append(f"{name}: mean shifted {mean_shift[i]:+.2f} training std")
+            if not thresholds['std_ratio'][0] <= std_ratio[i] <= thresholds['std_ratio'][1]:
+                alerts.append(f"{name}: std ratio {std_ratio[i]:.2f}")
+        if reference is not None and feature_psi[i] > thresholds['psi']:
+            alerts.append(f"{name}: PSI {feature_psi[i]:.3f}")
+        if reference is not None and feature_ks[i] > thresholds['ks']:
+            alerts.append(f"{name}: KS {feature_ks[i]:.3f}")
+
+    categories = {}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        current = _category_proportions(sketch.sums / sketch.n * scale + mean)
+    training = _category_proportions(mean)
+    for field, proportions in current.items():
+        names = _category_names(field)
+        entry = {'proportions': dict(zip(names, map(_number, proportions))),
+                 'training': dict(zip(names, map(_number, training[field])))}
+        if sketch.n:
+            entry['psi'] = _category_psi(proportions, training[field])
+            if sampled and entry['psi'] > thresholds['category_psi']:
+                alerts.append(f"{field}: category mix PSI {entry['psi']:.3f} against training")
+        categories[field] = entry
+
+    # Bin midpoints of the approval probability histogram
+    midpoints = (np.arange(len(sketch.probability_counts)) + 0.5) / len(sketch.probability_counts)
+    outputs = {
+        'class_proportions': dict(zip(map(str, classes.tolist()), map(_number, _proportions(sketch.class_counts)))),
+        'mean_approval_probability': _number((_proportions(sketch.probability_counts) * midpoints).sum())
+                                     if sketch.n else None,
+    }
+    if reference is not None:
+        outputs['reference_class_proportions'] = dict(zip(map(str, classes.tolist()),
+                                                          map(_number, _proportions(reference.class_counts))))
+        outputs['class_psi'] = _category_psi(_proportions(sketch.class_counts), _proportions(reference.class_counts)) \
+            if sketch.n and reference.n else None
+        for output in ('probability', 'emi'):
+            current_counts, reference_counts = (getattr(s, f"{output}_counts") for s in (sketch, reference))
+            outputs[f"{output}_psi"] = _number(psi(current_counts, reference_counts)[0])
+            outputs[f"{output}_ks"] = _number(ks(current_counts, reference_counts)[0])
+        for output in ('class', 'probability', 'emi'):
+            if sampled and (outputs[f"{output}_psi"] or 0) > thresholds['psi']:
+                alerts.append(f"model output {output}: PSI {outputs[f'{output}_psi']:.3f}")
+    return {
+        'rows': int(sketch.n),
+        'reference_rows': int(reference.n) if reference is not None else None,
+        'features': features,
+        'categories': categories,
+        'outputs': outputs,
+        'alerts': alerts,
+    }
+
+class DriftMonitor:
+    """
+    Thread-safe inline drift monitor of one model version
+    mean, scale: the scaler statistics; classes: the classifier's classes
+    reference: DriftSketch to compare with
+    report_path: JSON file the report of the last window is written to
+    every report_interval seconds
+    """
+    def __init__(self, mean, scale, classes, reference=None, version=None, report_path=None,
+                 report_interval=DEFAULT_REPORT_INTERVAL):
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.classes = np.asarray(classes)
+        self.reference = reference
+        self.version = version
+        self.report_path = report_path
+        self.report_interval = report_interval
+        self.sketch = DriftSketch(len(self.classes), len(self.mean))
+        self.exports = 0
+        self.last_report = None
+        self._window = self.sketch.copy()
+        self._window_start = time.time()
+        # _lock guards the sketch and the window; _export_lock orders exports
+        self._lock = threading.Lock()
+        self._export_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        if report_path is not None:
+            self._thread = threading.Thread(target=self._run, name='drift-report', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def observe(self, X_scaled, classes, approval_probability, emi):
+        """
+        Add a scored batch: scaled rows, predicted classes, approval
+        probabilities and EMIs
+        """
+        class_index = np.searchsorted(self.classes, np.asarray(classes).ravel())
+        with self._lock:
+            self.sketch.observe(X_scaled, class_index, np.asarray(approval_probability).ravel(),
+                                np.asarray(emi).ravel())
+
+    def report(self, window=False):
+        """
+        Drift report of everything observed, or with window of the rows
+        observed since the last export
+        """
+        with self._lock:
+            snapshot, previous, start = self.sketch.copy(), self._window, self._window_start
+        return self._report(snapshot, previous if window else None, start)
+
+    def _report(self, snapshot, previous, start):
+        # previous: the sketch at the start of the window, None for everything observed
+        report = drift_report(snapshot - previous if previous is not None else snapshot, self.mean, self.scale,
+                              self.classes, self.reference)
+        return {
+            'version': self.version,
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'window': {'start': datetime.fromtimestamp(start, timezone.utc).isoformat(timespec='seconds'),
+                       'seconds': round(time.time() - start, 3)} if previous is not None else None,
+            'rows_total': int(snapshot.n),
+            **report,
+        }
+
+    def export(self, path=None):
+        """
+        Write the report of the window since the last export to path
+        (default report_path) and start a new window
+        """
+        path = path or self.report_path
+        with self._export_lock:
+            with self._lock:
+                snapshot, previous, start = self.sketch.copy(), self._window, self._window_start
+                taken = time.time()
+            report = self._report(snapshot, previous, start)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, 'w') as f:
+                json.dump(report, f, indent=2)
+            os.replace(tmp, path)
+            # The next window starts where this snapshot ended
+            with self._lock:
+                self._window, self._window_start = snapshot, taken
+                self.exports += 1
+                self.last_report = report
+        if report['alerts']:
+            logger.warning("Drift alerts for model version %s: %s", self.version, '; '.join(report['alerts'][:5]))
+        return report
+
+    def _run(self):
+        while not self._stop.wait(self.report_interval):
+            try:
+                self.export()
+            except OSError:
+                logger.exception("Drift report export to %s failed", self.report_path)
+
+    def close(self):
+        if self._thread is None or self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join()
+        try:
+            self.export()
+        except OSError:
+            logger.exception("Drift report export to %s failed", self.report_path)
+
+    def stats(self):
+        report = self.last_report
+        return {
+            'rows': int(self.sketch.n),
+            'reference_rows': int(self.reference.n) if self.reference is not None else None,
+            'report_path': self.report_path,
+            'exports': self.exports,
+            'last_alerts': report['alerts'] if report else None,
+        }
+
+def load_reference(model_dir, version):
+    """
+    Reference DriftSketch taken for the models of this version, or None
+    """
+    try:
+        return DriftSketch.load(drift_dir(model_dir, version))
+    except FileNotFoundError:
+        logger.info("No drift reference for model version %s; comparing with the scaler only", version)
+    except (OSError, KeyError, ValueError) as e:
+        logger.warning("Drift reference for model version %s unusable: %s", version, e)
+    return None
+
+def build_monitor(fast, model_dir, version, report_path=None, report_interval=DEFAULT_REPORT_INTERVAL):
+    """
+    DriftMonitor for models served through a FastPredictor (or anything
+    with mean, scale and classes), with the version's reference
+    """
+    return DriftMonitor(fast.mean, fast.scale, fast.classes, load_reference(model_dir, version) if version else None,
+                        version, report_path, report_interval)
+
+def _observe_file(monitor, path, chunk_size, models):
+    from utils.batch_score import read_chunks
+    from utils.feature_engineering import engineer_features, prepare_features_for_prediction
+    from utils.scoring import predict_scaled, scale_features
+    from utils.validation import validate_frame
+
+    for chunk in read_chunks(path, chunk_size):
+        validation = validate_frame(chunk)
+        if not validation.n_valid:
+            continue
+        X = scale_features(prepare_features_for_prediction(engineer_features(validation.valid_frame())), models[2])
+        classes, proba, emi = predict_scaled(X, *models[:2])
+        monitor.observe(X, classes, proba[:, 1], emi)
+
+def _observe_audit_log(monitor, path, chunk_size):
+    from utils.audit_log import SCALED_PREFIX, read_audit_log
+
+    for chunk in read_audit_log(path, chunk_size):
+        # Logged as the models scored it, already scaled
+        X = chunk[[SCALED_PREFIX + name for name in SCHEMA.columns]].to_numpy(dtype=np.float64)
+        monitor.observe(X, chunk['eligibility_class'].to_numpy(), chunk['approval_probability'].to_numpy(),
+                        chunk['predicted_emi'].to_numpy())
+
+def main(argv=None):
+    from utils.batch_score import DEFAULT_CHUNK_SIZE
+    from utils.fast_path import FastPredictor
+    from utils.model_files import MODEL_DIR, load_versioned_models
+
+    parser = argparse.ArgumentParser(description="Take a drift reference or report drift of scored applicants")
+    parser.add_argument('command', choices=['reference', 'report'])
+    parser.add_argument('input', nargs='?', help="CSV or Parquet file of raw applicants")
+    parser.add_argument('--audit-log', help="report: read the applicants and scores from this audit log")
+    parser.add_argument('--model-dir', default=MODEL_DIR)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if (args.input is None) == (args.audit_log is None) or (args.command == 'reference' and args.audit_log):
+        parser.error("give an input file, or for report either an input file or --audit-log")
+
+    models, version = load_versioned_models(args.model_dir)
+    try:
+        fast = FastPredictor(*models)
+    except (AttributeError, ValueError) as e:
+        logger.error("Drift monitoring needs XGBoost models and a StandardScaler: %s", e)
+        return 1
+    reference = None if args.command == 'reference' else load_reference(args.model_dir, version)
+    monitor = DriftMonitor(fast.mean, fast.scale, fast.classes, reference, version)
+    if args.audit_log:
+        _observe_audit_log(monitor, args.audit_log, args.chunk_size)
+    else:
+        _observe_file(monitor, args.input, args.chunk_size, models)
+
+    if args.command == 'reference':
+        directory = drift_dir(args.model_dir, version)
+        monitor.sketch.save(directory)
+        print(f"Drift reference of {monitor.sketch.n:,} applicants for {version} written to {directory}",
+              file=sys.stderr)
+        return 0
+    report = monitor.report()
+    print(json.dumps(report, indent=2))
+    return 1 if report['alerts'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
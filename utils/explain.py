@@ -0,0 +1,176 @@
+"""
+Per-applicant feature attributions from the tree models
+
+explain_scaled() computes exact TreeSHAP contributions for a whole batch
+of scaled rows in one XGBoost call (pred_contribs). For every applicant
+it reports how much each feature moved the predicted class's margin
+(log-odds) and the EMI estimate away from the models' average output.
+Contributions of one-hot columns are summed into their raw field
+(education, company_type, ...), so attributions name what the applicant
+entered, next to the engineered ratios.
+
+Attributions always come from the original (teacher) XGBoost models:
+TreeSHAP needs their boosters. They describe the 'flat' scorer as well,
+which is the same trees compiled to arrays, but not the distilled
+surrogate; explained_with() says which a served prediction gets, and
+callers show REFERENCE_NOTE with the surrogate's predictions.
+
+TreeSHAP costs several predictions per row, so it stays off the critical
+path. ExplanationWorker queues requests to a background MicroBatcher and
+keeps results in a PredictionCache keyed like the predictions. A page
+can then show the prediction at once and fill in the explanation when it
+is ready.
+"""
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+
+from utils.feature_schema import SCHEMA
+from utils.micro_batcher import MicroBatcher
+from utils.prediction_cache import DEFAULT_MAX_SIZE, PredictionCache, record_key
+
+DEFAULT_MAX_BATCH_SIZE = 64
+# Explanations are not latency-critical; a longer window batches more
+DEFAULT_MAX_WAIT_MS = 20.0
+# Scorers serving the teacher's trees, whose attributions describe them
+EXPLAINED_SCORERS = ('teacher', 'flat')
+REFERENCE_NOTE = ("Attributions of the reference (original) models: this prediction came from the "
+                  "distilled surrogate, which may weigh the features differently")
+
+def _group_matrix(columns):
+    """
+    Feature names, with one-hot columns folded into their raw field, and
+    the (columns, names) 0/1 matrix summing column values into them
+    """
+    owner = {column: field for field, mapping in SCHEMA.one_hot.items() for column in mapping.values()}
+    names = list(dict.fromkeys(owner.get(column, column) for column in columns))
+    matrix = np.zeros((len(columns), len(names)))
+    matrix[np.arange(len(columns)), [names.index(owner.get(column, column)) for column in columns]] = 1.0
+    return names, matrix
+
+_CLASSIFICATION_GROUPS = _group_matrix(SCHEMA.columns)
+_REGRESSION_GROUPS = _group_matrix(SCHEMA.regression_columns)
+
+def _contributions(model, X):
+    # (rows, [outputs,] features + 1); the last entry is the bias
+    import xgboost
+    return model.get_booster().predict(xgboost.DMatrix(X), pred_contribs=True, validate_features=False)
+
+def explain_scaled(X_scaled, classes, classification_model, regression_model):
+    """
+    Attributions for scaled rows in schema order and their predicted classes
+    Returns one dict per row:
+      class                 the predicted class
+      margin_base           the classifier's average margin for that class
+      margin_contributions  {feature: contribution to that margin}
+      emi_base              the regressor's average EMI
+      emi_contributions     {feature: contribution to the EMI}
+    Base plus contributions add up to the margin and the EMI
+    Raises ValueError for models other than XGBoost
+    """
+    if not all(hasattr(m, 'get_booster') for m in (classification_model, regression_model)):
+        raise ValueError("Only XGBoost models can be explained")
+    X = np.asarray(X_scaled, dtype=np.float32)
+    classes = np.asarray(classes)
+    model_classes = np.asarray(classification_model.classes_)
+
+    contributions = _contributions(classification_model, X)
+    if contributions.ndim == 2:
+        # Binary models explain the logit of the last class; negate it for the other
+        sign = np.where(classes == model_classes[-1], 1.0, -1.0)[:, None]
+        class_contributions = contributions * sign
+    else:
+        class_contributions = contributions[np.arange(len(X)), np.searchsorted(model_classes, classes)]
+    emi_contributions = _contributions(regression_model, SCHEMA.regression_input(X, classes))
+
+    names, matrix = _CLASSIFICATION_GROUPS
+    margin = class_contributions[:, :-1] @ matrix
+    emi_names, emi_matrix = _REGRESSION_GROUPS
+    emi = emi_contributions[:, :-1] @ emi_matrix
+    return [
+        {
+            'class': c,
+            'margin_base': float(class_contributions[i, -1]),
+            'margin_contributions': dict(zip(names, margin[i].tolist())),
+            'emi_base': float(emi_contributions[i, -1]),
+            'emi_contributions': dict(zip(emi_names, emi[i].tolist())),
+        }
+        for i, c in enumerate(classes.tolist())
+    ]
+
+def explained_with(scorer):
+    """
+    'served model' when the attributions describe the scorer that served
+    the prediction, else 'reference model' (the originals, standing in
+    for the surrogate)
+    """
+    return 'served model' if scorer in EXPLAINED_SCORERS else 'reference model'
+
+def top_contributions(contributions, n=5):
+    """
+    The n (feature, contribution) pairs of largest magnitude, largest first
+    """
+    return sorted(contributions.items(), key=lambda item: abs(item[1]), reverse=True)[:n]
+
+class ExplanationWorker:
+    """
+    Batched background explanations with a result cache
+    version: model version the cache is keyed with, as for predictions
+    """
+    def __init__(self, classification_model, regression_model, cache_size=DEFAULT_MAX_SIZE, version=None,
+                 max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS):
+        if not all(hasattr(m, 'get_booster') for m in (classification_model, regression_model)):
+            raise ValueError("Only XGBoost models can be explained")
+        self.classification_model = classification_model
+        self.regression_model = regression_model
+        self.cache = PredictionCache(cache_size, version=version)
+        self.batcher = MicroBatcher(self._explain_batch, max_batch_size, max_wait_ms)
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def _explain_batch(self, items):
+        rows, classes = zip(*items)
+        return explain_scaled(np.vstack(rows), np.array(classes), self.classification_model, self.regression_model)
+
+    def get(self, record):
+        """
+        Cached explanation of a raw applicant dict, or None
+        """
+        return self.cache.get(record)
+
+    def submit(self, record, X_row, predicted_class):
+        """
+        Explain one applicant in the background
+        X_row: its scaled feature row; predicted_class: the class served
+        Returns a Future resolving to the explanation dict; requests for
+        an applicant already queued share one Future
+        """
+        cached = self.cache.get(record)
+        if cached is not None:
+            future = Future()
+            future.set_result(cached)
+            return future
+        version = self.cache.version
+        key = record_key(record, version)
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None:
+                return future
+            future = self.batcher.submit((np.asarray(X_row, dtype=np.float32).reshape(1, -1), predicted_class))
+            self._pending[key] = future
+        # Outside the lock: the callback runs at once if the future is already done
+        future.add_done_callback(lambda done: self._finish(key, record, version, done))
+        return future
+
+    def _finish(self, key, record, version, future):
+        with self._lock:
+            self._pending.pop(key, None)
+        if future.exception() is None:
+            self.cache.put(record, future.result(), version)
+
+    def stats(self):
+        return {'batcher': self.batcher.stats(), 'cache': self.cache.stats(), 'pending': len(self._pending)}
+
+    def close(self):
+        self.batcher.close()
@@ -0,0 +1,181 @@
+"""
+Pandas-free inference for single applicants
+
+The regular path builds a DataFrame, copies it in engineer_features,
+reindexes it by column name and scales it through the sklearn scaler.
+FastPredictor instead computes the engineered features of a raw input
+dict as plain Python numbers, writes them straight into a preallocated
+row in model feature order, applies the scaler's mean/scale in place and
+hands the float32 row to the XGBoost boosters with inplace_predict.
+
+The arithmetic is the same, operation for operation, as the pandas path
+(float64 features and scaling, float32 only at the booster boundary,
+which is the conversion XGBoost performs itself), so outputs are
+identical. This is checked once when a FastPredictor is built.
+"""
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+
+from utils.feature_engineering import engineer_features
+from utils.feature_graph import FEATURE_GRAPH
+from utils.feature_schema import SCHEMA
+from utils.instrumentation import stage, timed
+from utils.scoring import check_records, result_dicts, score_features
+
+logger = logging.getLogger(__name__)
+
+# Data Input page defaults, used for the parity check
+TEMPLATE_RECORD = {
+    'age': 30, 'gender': 1, 'marital_status': 1, 'education': 'Post Graduate',
+    'monthly_salary': 50000, 'employment_type': 'Private', 'years_of_employment': 5,
+    'company_type': 'MNC', 'house_type': 'Rented', 'monthly_rent': 10000,
+    'credit_score': 700, 'bank_balance': 100000, 'emergency_fund': 50000
+}
+
+def derive_record(record):
+    """
+    Engineered features for one raw applicant dict as plain Python numbers
+    Same formulas and operation order as engineer_features (feature_graph)
+    """
+    return FEATURE_GRAPH.evaluate(record)
+
+def iteration_range(booster):
+    """
+    Trees the sklearn wrapper predicts with, from the public Booster API:
+    up to the best iteration when early stopping recorded one, else all
+    ((0, 0) to inplace_predict)
+    """
+    best = booster.attr('best_iteration')
+    return (0, int(best) + 1) if best is not None else (0, 0)
+
+class FastPredictor:
+    """
+    Single-row inference without pandas for XGBoost models and a
+    StandardScaler; use build_fast_predictor() to get one only when the
+    loaded models support it
+    """
+    def __init__(self, classification_model, regression_model, scaler):
+        self.feature_order = SCHEMA.columns
+        n_features = SCHEMA.n_features
+        if getattr(scaler, 'with_mean', True):
+            self.mean = np.array(scaler.mean_, dtype=np.float64)
+        else:
+            self.mean = np.zeros(n_features)
+        if getattr(scaler, 'with_std', True):
+            self.scale = np.array(scaler.scale_, dtype=np.float64)
+        else:
+            self.scale = np.ones(n_features)
+        if self.mean.shape != (n_features,) or self.scale.shape != (n_features,):
+            raise ValueError("Scaler does not match the model feature count")
+
+        self.classes = np.asarray(classification_model.classes_)
+        self._classifier = classification_model.get_booster()
+        self._regressor = regression_model.get_booster()
+        self._classifier_range = iteration_range(self._classifier)
+        self._regressor_range = iteration_range(self._regressor)
+        self._classifier_missing = classification_model.missing
+        self._regressor_missing = regression_model.missing
+        self._local = threading.local()
+
+    def _buffers(self):
+        # Per-thread preallocated float64 scratch and float32 model row
+        local = self._local
+        if not hasattr(local, 'row'):
+            local.scratch = np.empty(len(self.feature_order), dtype=np.float64)
+            local.row = np.empty((1, len(self.feature_order)), dtype=np.float32)
+        return local.scratch, local.row
+
+    def _fill(self, record, scratch, out):
+        features = derive_record(record)
+        for i, name in enumerate(self.feature_order):
+            scratch[i] = features[name]
+        np.subtract(scratch, self.mean, out=scratch)
+        np.divide(scratch, self.scale, out=scratch)
+        out[:] = scratch
+
+    @timed('fast_scaled_rows')
+    def scaled_row(self, record):
+        """
+        Scaled (1, n_features) float32 row for one raw applicant dict
+        The returned array is reused by the next call on the same thread
+        """
+        scratch, row = self._buffers()
+        self._fill(record, scratch, row[0])
+        return row
+
+    @timed('fast_scaled_rows')
+    def scaled_rows(self, records):
+        """
+        Scaled (n, n_features) float32 matrix for raw applicant dicts
+        """
+        scratch, _ = self._buffers()
+        X = np.empty((len(records), len(self.feature_order)), dtype=np.float32)
+        for record, out in zip(records, X):
+            self._fill(record, scratch, out)
+        return X
+
+    def predict_scaled(self, X):
+        """
+        Same contract as scoring.predict_scaled, calling the boosters directly
+        """
+        with stage('predict_classification'):
+            proba = self._classifier.inplace_predict(
+                X, iteration_range=self._classifier_range, missing=self._classifier_missing,
+                validate_features=False,
+            )
+            if proba.ndim == 1:
+                # binary:logistic returns P(class 1) only
+                proba = np.column_stack([1 - proba, proba])
+            classes = self.classes[proba.argmax(axis=1)]
+        with stage('predict_regression'):
+            emi = self._regressor.inplace_predict(
+                SCHEMA.regression_input(X, classes), iteration_range=self._regressor_range,
+                missing=self._regressor_missing, validate_features=False,
+            )
+        return classes, proba, emi
+
+    def predict_one(self, record):
+        """
+        Returns (class, probabilities, emi) for one raw applicant dict
+        """
+        classes, proba, emi = self.predict_scaled(self.scaled_row(record))
+        return classes[0], proba[0], emi[0]
+
+    def score_records(self, records, predict_fn=None, monitor=None):
+        """
+        Same output as scoring.score_records, without pandas
+        predict_fn: replaces predict_scaled, e.g. SurrogatePredictor.predict_scaled
+        monitor: a drift.DriftMonitor the scored rows are observed by
+        """
+        check_records(records)
+        X = self.scaled_rows(records)
+        classes, proba, emi = (predict_fn or self.predict_scaled)(X)
+        if monitor is not None:
+            monitor.observe(X, classes, proba[:, 1], emi)
+        return result_dicts(classes, proba, emi)
+
+def build_fast_predictor(classification_model, regression_model, scaler):
+    """
+    FastPredictor for the loaded models, or None when they are not
+    XGBoost models with a StandardScaler or fail the parity check against
+    the pandas path
+    """
+    boosters = all(hasattr(m, 'get_booster') for m in (classification_model, regression_model))
+    if not boosters or not hasattr(scaler, 'mean_') or not hasattr(scaler, 'scale_'):
+        return None
+    try:
+        fast = FastPredictor(classification_model, regression_model, scaler)
+        expected = score_features(engineer_features(pd.DataFrame([TEMPLATE_RECORD])),
+                                  classification_model, regression_model, scaler).iloc[0]
+        cls, proba, emi = fast.predict_one(TEMPLATE_RECORD)
+    except Exception:
+        logger.exception("Fast inference path unavailable")
+        return None
+    if cls != expected['eligibility_class'] or proba[1] != expected['approval_probability'] \
+            or emi != expected['predicted_emi']:
+        logger.warning("Fast inference path disabled: outputs differ from the pandas path")
+        return None
+    return fast
@@ -0,0 +1,215 @@
+"""
+Dependency graph of the engineered features: their one definition
+
+Every derived feature is a node listing the features it reads, e.g.
+housing_burden_ratio reads monthly_rent and the salary divisor, and
+savings_capacity reads monthly_salary and total_monthly_expenses. Each
+formula is written once, in DERIVED_FEATURES, and works on plain Python
+numbers (one applicant) and on NumPy arrays (whole columns) alike:
+  - FEATURE_GRAPH.evaluate() computes one applicant's features; it is
+    fast_path.derive_record
+  - FEATURE_GRAPH.evaluate_columns() computes whole columns; it is what
+    feature_engineering.engineer_features appends
+A formula change made here reaches every path.
+
+FEATURE_GRAPH.affected() maps a set of changed raw inputs to every
+derived node downstream of them, in evaluation order. IncrementalFeatures
+keeps one applicant's features and scaled row. When inputs change it
+recomputes only the affected features and rescales only their entries.
+A changed monthly_rent touches 7 of the 43 model inputs; a changed
+company_type touches only its 4 one-hot columns.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+from utils.feature_schema import RAW_INPUT_COLUMNS, SCHEMA
+
+# Salary used as a divisor, with a zero salary dividing as 1
+_DIVISOR = '_income_divisor'
+
+def _nonzero(value):
+    if isinstance(value, np.ndarray):
+        return np.where(value == 0, 1, value)
+    return value if value != 0 else 1
+
+def _indicator(value, category):
+    # One-hot entry: 1 where value is category
+    if isinstance(value, np.ndarray):
+        return (value == category).astype(np.int64)
+    return 1 if value == category else 0
+
+# (name, dependencies, formula over the feature dict), in evaluation order
+# A formula that is a number is a default for a field not collected
+DERIVED_FEATURES = [
+    ('school_fees', ('monthly_salary',), lambda f: f['monthly_salary'] * 0.05),
+    ('college_fees', ('monthly_salary',), lambda f: f['monthly_salary'] * 0.03),
+    ('travel_expenses', ('monthly_salary',), lambda f: f['monthly_salary'] * 0.02),
+    ('groceries_utilities', ('monthly_salary',), lambda f: f['monthly_salary'] * 0.15),
+    ('other_monthly_expenses', ('monthly_salary',), lambda f: f['monthly_salary'] * 0.08),
+    ('family_size', (), 4),
+    ('dependents', (), 2),
+    ('existing_loans', (), 0),
+    ('current_emi_amount', (), 0),
+    ('requested_amount', ('monthly_salary',), lambda f: f['monthly_salary'] * 12),
+    ('requested_tenure', (), 24),
+    ('total_monthly_expenses',
+     ('monthly_rent', 'school_fees', 'college_fees', 'travel_expenses', 'groceries_utilities',
+      'other_monthly_expenses'),
+     lambda f: (f['monthly_rent'] + f['school_fees'] + f['college_fees'] + f['travel_expenses'] +
+                f['groceries_utilities'] + f['other_monthly_expenses'])),
+    ('savings_capacity', ('monthly_salary', 'total_monthly_expenses'),
+     lambda f: f['monthly_salary'] - f['total_monthly_expenses']),
+    ('max_monthly_emi', ('savings_capacity',), lambda f: f['savings_capacity'] * 0.4),
+    (_DIVISOR, ('monthly_salary',), lambda f: _nonzero(f['monthly_salary'])),
+    ('debt_to_income_ratio', ('current_emi_amount', _DIVISOR), lambda f: f['current_emi_amount'] / f[_DIVISOR]),
+    ('financial_stability', ('bank_balance', _DIVISOR), lambda f: f['bank_balance'] / f[_DIVISOR]),
+    ('per_capita_income', ('monthly_salary', 'family_size'), lambda f: f['monthly_salary'] / f['family_size']),
+    ('employment_stability', ('years_of_employment',), lambda f: f['years_of_employment'] / 10),
+    ('housing_burden_ratio', ('monthly_rent', _DIVISOR), lambda f: f['monthly_rent'] / f[_DIVISOR]),
+    ('loan_to_income_ratio', ('requested_amount', _DIVISOR), lambda f: f['requested_amount'] / (f[_DIVISOR] * 12)),
+    ('expance_to_income_ratio', ('total_monthly_expenses', _DIVISOR),
+     lambda f: f['total_monthly_expenses'] / f[_DIVISOR]),
+    ('affordability_ratio', ('max_monthly_emi', _DIVISOR), lambda f: f['max_monthly_emi'] / f[_DIVISOR]),
+    ('emi_scenario', (), 1),
+] + [
+    (column, (field,), lambda f, field=field, category=category: _indicator(f[field], category))
+    for field, mapping in SCHEMA.one_hot.items()
+    for category, column in mapping.items()
+]
+
+class FeatureGraph:
+    """
+    Compiled feature dependency graph; build once and share
+    """
+    def __init__(self, derived):
+        self.nodes = [name for name, _, _ in derived]
+        self.formulas = {name: formula for name, _, formula in derived}
+        self.dependencies = {name: deps for name, deps, _ in derived}
+        self.dependents = {name: [] for name in list(RAW_INPUT_COLUMNS) + self.nodes}
+        for name, deps, _ in derived:
+            for dep in deps:
+                self.dependents[dep].append(name)
+        self._order = {name: i for i, name in enumerate(self.nodes)}
+        # Scalar evaluation: every formula as a callable, in order
+        self._scalar = {
+            name: formula if callable(formula) else (lambda f, value=formula: value)
+            for name, formula in self.formulas.items()
+        }
+
+    def evaluate(self, record):
+        """
+        Every feature (raw and derived) of one raw applicant dict, as
+        plain Python numbers
+        """
+        features = {name: record[name] for name in RAW_INPUT_COLUMNS}
+        for name, compute in self._scalar.items():
+            features[name] = compute(features)
+        return features
+
+    def evaluate_columns(self, columns):
+        """
+        Derived features of every row at once, as a dict of NumPy arrays
+        in evaluation order, without the private intermediate nodes
+        columns: DataFrame or dict of equal-length arrays of the raw inputs
+        """
+        features = {name: np.asarray(columns[name]) for name in RAW_INPUT_COLUMNS if name in columns}
+        n = len(next(iter(features.values())))
+        out = {}
+        for name in self.nodes:
+            formula = self.formulas[name]
+            value = formula(features) if callable(formula) else np.full(n, formula, dtype=np.int64)
+            features[name] = value
+            if not name.startswith('_'):
+                out[name] = value
+        return out
+
+    @lru_cache(maxsize=None)
+    def affected(self, fields):
+        """
+        Derived nodes downstream of the frozenset of changed raw fields,
+        in evaluation order
+        """
+        seen = set()
+        pending = list(fields)
+        while pending:
+            for dependent in self.dependents[pending.pop()]:
+                if dependent not in seen:
+                    seen.add(dependent)
+                    pending.append(dependent)
+        return tuple(sorted(seen, key=self._order.__getitem__))
+
+    def update(self, features, changes):
+        """
+        Apply changed inputs to a features dict from evaluate() in place
+        Derived features can be overridden too; their dependents follow
+        Returns the names of every feature that was set or recomputed
+        """
+        features.update(changes)
+        recomputed = self.affected(frozenset(changes))
+        for name in recomputed:
+            features[name] = self._scalar[name](features)
+        return tuple(changes) + recomputed
+
+FEATURE_GRAPH = FeatureGraph(DERIVED_FEATURES)
+
+# Columns of engineer_features output, in its order
+ENGINEERED_COLUMNS = tuple(RAW_INPUT_COLUMNS) + tuple(name for name in FEATURE_GRAPH.nodes if name != _DIVISOR)
+
+class IncrementalFeatures:
+    """
+    One applicant's engineered features and scaled model row, updated
+    incrementally as raw inputs change
+    """
+    def __init__(self, record):
+        self.features = FEATURE_GRAPH.evaluate(record)
+        self._row = np.empty((1, SCHEMA.n_features), dtype=np.float32)
+        self._scaled_with = None
+        self._stats = None
+        self._stale = set(SCHEMA.columns)
+
+    def record(self):
+        """
+        The current raw inputs as a dict
+        """
+        return {name: self.features[name] for name in RAW_INPUT_COLUMNS}
+
+    def update(self, record):
+        """
+        Bring the features up to date with a full or partial raw record
+        Returns the names of the model columns whose values changed
+        """
+        changes = {name: value for name, value in record.items()
+                   if name in RAW_INPUT_COLUMNS and self.features[name] != value}
+        if not changes:
+            return ()
+        columns = tuple(name for name in FEATURE_GRAPH.update(self.features, changes) if name in SCHEMA.index)
+        self._stale.update(columns)
+        return columns
+
+    def scaled_row(self, mean, scale):
+        """
+        Scaled (1, n_features) float32 row; only entries changed since the
+        last call are rescaled
+        mean, scale: the scaler's statistics, e.g. FastPredictor.mean/scale
+        """
+        if self._scaled_with != (id(mean), id(scale)):
+            # Python floats: same IEEE arithmetic as NumPy, without scalar overhead
+            self._stats = (mean.tolist(), scale.tolist())
+            self._scaled_with = (id(mean), id(scale))
+            self._stale = set(SCHEMA.columns)
+        means, scales = self._stats
+        row = self._row[0]
+        for name in self._stale:
+            i = SCHEMA.index[name]
+            row[i] = (self.features[name] - means[i]) / scales[i]
+        self._stale.clear()
+        return self._row.copy()
+
+    def frame(self):
+        """
+        One-row DataFrame with the columns of engineer_features, in its order
+        """
+        # pandas is only needed here; the Data Input page paints without it
+        import pandas as pd
+        return pd.DataFrame([{name: self.features[name] for name in ENGINEERED_COLUMNS}])
@@ -0,0 +1,166 @@
+"""
+Feature schema shared by training-time and serving-time code
+
+SCHEMA is compiled once at import time and holds
+  - the engineered feature matrix column order (the order the scaler and
+    the classification model were fitted on) and each column's index
+  - the one-hot category maps, as column names and as matrix slots
+  - per-model column masks and index arrays
+
+The regression model was fitted on the same columns except that the
+max_monthly_emi slot holds emi_eligibility, the classification label.
+Its input is therefore laid out from the scaled classification matrix by
+index-array slicing, with the predicted eligibility written into that
+slot, instead of reindexing a DataFrame by column label a second time.
+"""
+import numpy as np
+
+# The 13 raw fields collected on the Data Input page
+RAW_INPUT_COLUMNS = (
+    'age', 'gender', 'marital_status', 'education', 'monthly_salary',
+    'employment_type', 'years_of_employment', 'company_type', 'house_type',
+    'monthly_rent', 'credit_score', 'bank_balance', 'emergency_fund'
+)
+
+# Bounds and choices of the Data Input page widgets; None is unbounded.
+# utils.validation holds batch and API input to the same domains.
+NUMERIC_DOMAINS = {
+    'age': (18, 100),
+    'monthly_salary': (0, None),
+    'years_of_employment': (0, 50),
+    'monthly_rent': (0, None),
+    'credit_score': (300, 900),
+    'bank_balance': (0, None),
+    'emergency_fund': (0, None),
+}
+CATEGORY_DOMAINS = {
+    'gender': [0, 1],
+    'marital_status': [0, 1],
+    'education': ["Graduate", "High School", "Post Graduate", "Professional"],
+    'employment_type': ["Government", "Private", "Self-Employed"],
+    'company_type': ["Large", "Mid-Size", "MNC", "Small", "Startup"],
+    'house_type': ["Own", "Rented", "Other"],
+}
+# Numeric fields that only take whole numbers; money fields may hold paise
+INTEGER_FIELDS = ('age', 'years_of_employment', 'credit_score')
+
+# Category value -> one-hot column name. The first category of each field
+# (Graduate, Government, Large, Other) is the dropped baseline and maps to
+# all zeros, as do unknown values.
+ONE_HOT_COLUMNS = {
+    'education': {
+        'High School': 'education_high school',
+        'Post Graduate': 'education_post graduate',
+        'Professional': 'education_professional',
+    },
+    'employment_type': {
+        'Private': 'employment_type_private',
+        'Self-Employed': 'employment_type_self-employed',
+    },
+    'company_type': {
+        'Mid-Size': 'company_type_mid-size',
+        'MNC': 'company_type_mnc',
+        'Small': 'company_type_small',
+        'Startup': 'company_type_startup',
+    },
+    'house_type': {
+        'Own': 'house_type_own',
+        'Rented': 'house_type_rented',
+    },
+}
+
+# Engineered feature matrix, in the order the scaler and the
+# classification model expect
+FEATURE_COLUMNS = (
+    'age', 'gender', 'marital_status', 'monthly_salary',
+    'years_of_employment', 'monthly_rent', 'family_size', 'dependents',
+    'school_fees', 'college_fees', 'travel_expenses', 'groceries_utilities',
+    'other_monthly_expenses', 'existing_loans', 'current_emi_amount',
+    'credit_score', 'bank_balance', 'emergency_fund', 'emi_scenario',
+    'requested_amount', 'requested_tenure', 'max_monthly_emi',
+    'debt_to_income_ratio', 'total_monthly_expenses', 'savings_capacity',
+    'financial_stability', 'per_capita_income', 'employment_stability',
+    'housing_burden_ratio', 'loan_to_income_ratio',
+    'expance_to_income_ratio', 'affordability_ratio',
+    'education_high school', 'education_post graduate',
+    'education_professional', 'employment_type_private',
+    'employment_type_self-employed', 'company_type_mid-size',
+    'company_type_mnc', 'company_type_small', 'company_type_startup',
+    'house_type_own', 'house_type_rented'
+)
+
+# Regression target, present in the matrix but not a regression input
+REGRESSION_TARGET = 'max_monthly_emi'
+# Classification label the regression model takes as an input
+ELIGIBILITY_COLUMN = 'emi_eligibility'
+
+REGRESSION_COLUMNS = tuple(
+    ELIGIBILITY_COLUMN if name == REGRESSION_TARGET else name for name in FEATURE_COLUMNS
+)
+
+class SchemaError(ValueError):
+    """Raised when loaded models do not match the feature schema"""
+
+class FeatureSchema:
+    """
+    Compiled column layout; build once and share
+    """
+    def __init__(self, columns, one_hot, regression_columns, eligibility_column):
+        self.columns = tuple(columns)
+        self.n_features = len(self.columns)
+        self.index = {name: i for i, name in enumerate(self.columns)}
+
+        self.one_hot = one_hot
+        self.one_hot_slots = {
+            field: {category: self.index[column] for category, column in mapping.items()}
+            for field, mapping in one_hot.items()
+        }
+
+        self.classification_columns = self.columns
+        self.classification_index = np.arange(self.n_features)
+        self.classification_mask = np.ones(self.n_features, dtype=bool)
+
+        self.regression_columns = tuple(regression_columns)
+        self.eligibility_column = eligibility_column
+        self.regression_mask = np.array([name in self.regression_columns for name in self.columns])
+        # Matrix column feeding each regression input; the eligibility slot
+        # reads column 0 and is overwritten with the predicted class
+        self.regression_index = np.array([self.index.get(name, 0) for name in self.regression_columns])
+        self.eligibility_slot = self.regression_columns.index(eligibility_column)
+
+    def regression_input(self, X, eligibility):
+        """
+        Regression model input from the scaled classification matrix X and
+        the predicted eligibility class of every row
+        """
+        X_regression = X[:, self.regression_index]
+        X_regression[:, self.eligibility_slot] = eligibility
+        return X_regression
+
+    def validate(self, classification_model, regression_model, scaler=None):
+        """
+        Check the loaded models and scaler against the schema
+        Raises SchemaError listing every mismatch
+        """
+        problems = []
+        for name, obj, expected in (
+            ('classification model', classification_model, self.classification_columns),
+            ('regression model', regression_model, self.regression_columns),
+            ('scaler', scaler, self.columns),
+        ):
+            if obj is None:
+                continue
+            n_features = getattr(obj, 'n_features_in_', None)
+            if n_features is not None and n_features != len(expected):
+                problems.append(f"{name} expects {n_features} features, schema has {len(expected)}")
+            names = getattr(obj, 'feature_names_in_', None)
+            if names is not None and tuple(str(n) for n in names) != expected:
+                diff = [
+                    f"{i}: {str(got)!r} != {want!r}"
+                    for i, (got, want) in enumerate(zip(names, expected)) if str(got) != want
+                ]
+                problems.append(f"{name} feature names differ from schema ({'; '.join(diff[:5]) or 'length'})")
+        if problems:
+            raise SchemaError("; ".join(problems))
+
+SCHEMA = FeatureSchema(FEATURE_COLUMNS, ONE_HOT_COLUMNS, REGRESSION_COLUMNS, ELIGIBILITY_COLUMN)
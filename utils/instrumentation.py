@@ -0,0 +1,332 @@
+"""
+Per-stage timing for the prediction pipeline
+
+Wrap a stage in `with stage('engineer_features'):`, or decorate a
+function with @timed('engineer_features'). While instrumentation is
+enabled, each run records the stage's wall time into a process-wide
+registry of histograms. With track_allocations it also records the peak
+bytes the stage allocated. REGISTRY.to_dict() gives a JSON dump and
+REGISTRY.to_prometheus() the Prometheus text exposition format.
+
+Instrumentation is off unless enable() is called or EMI_INSTRUMENT=1 is
+set in the environment. While it is off, stage() returns one shared
+no-op context manager. The disabled cost is then one global lookup per
+stage.
+
+SamplingProfiler is the per-request profiler hook. A background thread
+snapshots the Python stacks of the other threads every few milliseconds
+and counts them as collapsed stacks, which flame graph tools read.
+Requests may only start one (?profile=1) when EMI_PROFILE=1 is set:
+each adds a sampling thread for the length of the request.
+"""
+import functools
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from bisect import bisect_left
+from collections import Counter
+from contextlib import nullcontext
+
+# Upper bounds of the histogram buckets; a final +Inf bucket is implied
+SECONDS_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+BYTES_BUCKETS = tuple(1024 * 4 ** i for i in range(11))
+
+_enabled = os.environ.get('EMI_INSTRUMENT', '') not in ('', '0')
+_track_allocations = False
+_started_tracemalloc = False
+_NOOP = nullcontext()
+PROFILE_ENV = 'EMI_PROFILE'
+_local = threading.local()
+
+class StageHistogram:
+    """
+    Counts of observed values in fixed buckets, plus their sum and maximum
+    """
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """
+        Upper bound of the bucket holding the q-th quantile
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def cumulative(self):
+        # (le, cumulative count) pairs, as Prometheus reports them
+        total = 0
+        pairs = []
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else 0.0,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'max': self.max,
+        }
+
+class StageRegistry:
+    """
+    Thread-safe wall time and allocation histograms by stage name
+    """
+    def __init__(self):
+        self._seconds = {}
+        self._allocated = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds, allocated=None):
+        with self._lock:
+            histogram = self._seconds.get(name)
+            if histogram is None:
+                histogram = self._seconds[name] = StageHistogram(SECONDS_BUCKETS)
+            histogram.observe(seconds)
+            if allocated is not None:
+                histogram = self._allocated.get(name)
+                if histogram is None:
+                    histogram = self._allocated[name] = StageHistogram(BYTES_BUCKETS)
+                histogram.observe(allocated)
+
+    def reset(self):
+        with self._lock:
+            self._seconds.clear()
+            self._allocated.clear()
+
+    def to_dict(self):
+        """
+        {stage: {'seconds': {...}, 'allocated_bytes': {...} or None}}
+        """
+        with self._lock:
+            return {
+                name: {
+                    'seconds': histogram.to_dict(),
+                    'allocated_bytes': self._allocated[name].to_dict() if name in self._allocated else None,
+                }
+                for name, histogram in sorted(self._seconds.items())
+            }
+
+    def to_prometheus(self, prefix='emi'):
+        """
+        Prometheus text exposition format (version 0.0.4)
+        """
+        lines = []
+        with self._lock:
+            for metric, histograms, help_text in (
+                (f'{prefix}_stage_seconds', self._seconds, "Wall time per prediction pipeline stage"),
+                (f'{prefix}_stage_allocated_bytes', self._allocated, "Peak bytes allocated per stage"),
+            ):
+                if not histograms:
+                    continue
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} histogram")
+                for name, histogram in sorted(histograms.items()):
+                    label = f'stage="{_escape_label(name)}"'
+                    for bound, total in histogram.cumulative():
+                        le = '+Inf' if bound == float('inf') else repr(float(bound))
+                        lines.append(f'{metric}_bucket{{{label},le="{le}"}} {total}')
+                    lines.append(f"{metric}_sum{{{label}}} {histogram.sum!r}")
+                    lines.append(f"{metric}_count{{{label}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+def _escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+REGISTRY = StageRegistry()
+
+def enable(track_allocations=False):
+    """
+    Start recording stages
+    track_allocations: also record each stage's peak allocation through
+    tracemalloc, which slows everything traced down considerably
+    """
+    global _enabled, _track_allocations, _started_tracemalloc
+    _track_allocations = track_allocations
+    if track_allocations and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _started_tracemalloc = True
+    _enabled = True
+
+def disable():
+    global _enabled, _track_allocations, _started_tracemalloc
+    _enabled = False
+    _track_allocations = False
+    if _started_tracemalloc:
+        tracemalloc.stop()
+        _started_tracemalloc = False
+
+def is_enabled():
+    return _enabled
+
+def profiling_allowed():
+    """
+    Whether requests may start a SamplingProfiler (EMI_PROFILE=1)
+    """
+    return os.environ.get(PROFILE_ENV, '') not in ('', '0')
+
+class _Stage:
+    __slots__ = ('name', 'start', 'base', 'peak')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        if _track_allocations and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            stack = getattr(_local, 'stages', None)
+            if stack is None:
+                stack = _local.stages = []
+            if stack:
+                # The enclosing stage keeps the peak seen so far
+                stack[-1].peak = max(stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+            self.base = self.peak = current
+            stack.append(self)
+        else:
+            self.base = None
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        allocated = None
+        if self.base is not None:
+            peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            allocated = peak - self.base
+            stack = _local.stages
+            stack.pop()
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, peak)
+        REGISTRY.observe(self.name, elapsed, allocated)
+        return False
+
+def stage(name):
+    """
+    Context manager timing one pipeline stage; a no-op while disabled
+    """
+    if not _enabled:
+        return _NOOP
+    return _Stage(name)
+
+def timed(name):
+    """
+    Decorator timing every call of a function as stage name
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with _Stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# Innermost frames of threads that are parked waiting for work
+IDLE_FRAMES = {
+    ('threading.py', 'wait'),
+    ('threading.py', '_wait_for_tstate_lock'),
+    ('selectors.py', 'select'),
+    ('thread.py', '_worker'),
+    ('queue.py', 'get'),
+}
+
+class SamplingProfiler:
+    """
+    Statistical profiler over the Python stacks of the running threads
+    Use as a context manager around the code to profile; counts() and
+    top() then hold the sampled stacks, outermost frame first
+    threads: thread idents to sample; every thread but the sampler when None
+    """
+    def __init__(self, interval_ms=1.0, threads=None, include_idle=False):
+        self.interval = interval_ms / 1000
+        self.threads = set(threads) if threads is not None else None
+        self.include_idle = include_idle
+        self.samples = 0
+        self._stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for ident, frame in sys._current_frames().items():
+                if ident == own or (self.threads is not None and ident not in self.threads):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((os.path.basename(code.co_filename), code.co_name, frame.f_lineno))
+                    frame = frame.f_back
+                if not self.include_idle and stack and stack[0][:2] in IDLE_FRAMES:
+                    continue
+                self._stacks[';'.join(f"{func} ({filename}:{line})" for filename, func, line in reversed(stack))] += 1
+
+    def counts(self):
+        """
+        {collapsed stack: samples}; frames joined by ';', outermost first
+        """
+        return dict(self._stacks)
+
+    def collapsed(self):
+        """
+        Collapsed stack text, one 'stack count' line per distinct stack
+        """
+        return "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+
+    def top(self, n=20):
+        """
+        The n innermost functions seen most often, with their sample counts
+        """
+        leaves = Counter()
+        for stack, count in self._stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        return leaves.most_common(n)
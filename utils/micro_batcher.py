@@ -0,0 +1,172 @@
+"""
+Dynamic micro-batching in front of the models
+
+Concurrent callers each submit one item; a background thread collects
+items for up to max_wait_ms or max_batch_size, whichever comes first,
+runs a single vectorized batch call and hands every caller its own
+result. Queue depth and batch size histograms are kept for tuning the
+latency/throughput trade-off.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from utils.scoring import predict_scaled
+
+DEFAULT_MAX_BATCH_SIZE = 64
+DEFAULT_MAX_WAIT_MS = 2.0
+
+class Histogram:
+    """
+    Counts of observed values in power-of-two buckets (1, 2, 4, ...)
+    """
+    def __init__(self, max_value):
+        self.bounds = [0]
+        while self.bounds[-1] < max_value:
+            self.bounds.append(max(1, self.bounds[-1] * 2))
+        self.counts = [0] * len(self.bounds)
+        self.total = 0
+        self.count = 0
+
+    def observe(self, value):
+        index = next((i for i, bound in enumerate(self.bounds) if value <= bound), len(self.bounds) - 1)
+        self.counts[index] += 1
+        self.total += value
+        self.count += 1
+
+    def to_dict(self):
+        return {
+            'buckets': {f"<={bound}": count for bound, count in zip(self.bounds, self.counts)},
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.0,
+        }
+
+class MicroBatcher:
+    """
+    Collects single items from many threads into batched calls
+    batch_fn: takes a list of items and returns a list of results of the
+    same length and order
+    """
+    def __init__(self, batch_fn, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        # Makes the closed check and the enqueue one step against close()
+        self._submit_lock = threading.Lock()
+        self.batch_sizes = Histogram(max_batch_size)
+        self.queue_depths = Histogram(max_batch_size * 16)
+        self.batches = 0
+        self.items = 0
+        self.failures = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        """
+        Queue one item; returns a Future resolving to its result
+        """
+        future = Future()
+        with self._submit_lock:
+            if self._closed:
+                raise RuntimeError("MicroBatcher is closed")
+            self._queue.put((item, future))
+        return future
+
+    def __call__(self, item, timeout=None):
+        return self.submit(item).result(timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'batches': self.batches,
+                'items': self.items,
+                'failures': self.failures,
+                'queue_depth': self._queue.qsize(),
+                'batch_size': self.batch_sizes.to_dict(),
+                'queue_depth_at_dispatch': self.queue_depths.to_dict(),
+            }
+
+    def close(self):
+        with self._submit_lock:
+            if self._closed:
+                return
+            self._closed = True
+            # Nothing can be queued behind the sentinel
+            self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                entry = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:
+                # Closing: finish this batch, then let _run see the sentinel
+                self._queue.put(None)
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = self._collect(first)
+            with self._lock:
+                self.batches += 1
+                self.items += len(batch)
+                self.batch_sizes.observe(len(batch))
+                self.queue_depths.observe(self._queue.qsize())
+            self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        items = [item for item, _ in batch]
+        try:
+            results = self.batch_fn(items)
+        except Exception as e:
+            if len(batch) == 1:
+                with self._lock:
+                    self.failures += 1
+                batch[0][1].set_exception(e)
+            else:
+                # One bad item must not fail its neighbours: retry individually
+                for entry in batch:
+                    self._dispatch([entry])
+            return
+        if len(results) != len(batch):
+            # A result short would leave its caller waiting forever
+            error = RuntimeError(f"batch_fn returned {len(results)} results for {len(batch)} items")
+            with self._lock:
+                self.failures += len(batch)
+            for _, future in batch:
+                future.set_exception(error)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+def model_batcher(classification_model, regression_model, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                  max_wait_ms=DEFAULT_MAX_WAIT_MS, predict_fn=None):
+    """
+    MicroBatcher over the models themselves
+    Items are scaled feature rows; each result is (class, probabilities, emi)
+    predict_fn: replaces scoring.predict_scaled, e.g. FastPredictor.predict_scaled
+    """
+    def predict_batch(rows):
+        X = np.vstack(rows)
+        if predict_fn is not None:
+            classes, proba, emi = predict_fn(X)
+        else:
+            classes, proba, emi = predict_scaled(X, classification_model, regression_model)
+        return list(zip(classes, proba, emi))
+    return MicroBatcher(predict_batch, max_batch_size, max_wait_ms)
@@ -0,0 +1,343 @@
+"""
+Versioned on-disk model bundle
+
+Usage: python -m utils.model_bundle export [--version V]
+       python -m utils.model_bundle verify
+
+The one-time export converts the three pickles into a bundle directory
+models/<version>/ holding
+  classification.ubj, regression.ubj  native XGBoost boosters
+  scaler_mean.npy, scaler_scale.npy, scaler_var.npy  memory-mappable arrays
+  trees_*.npy  both models compiled by utils.tree_ensemble, memory-mappable
+  manifest.json  version, file checksums, model metadata and the
+                 tree compiler version
+models/CURRENT names the active version and is swapped atomically, so a
+new bundle can be exported next to a running one.
+
+load_bundle() verifies every checksum, memory-maps the scaler arrays and
+logs per-file load timings instead of writing to the UI. Checksums only
+show the files are unchanged since the export. The compiled trees are
+derived from the boosters by code that may have changed since: they are
+refused when the manifest names another tree_ensemble.COMPILER_VERSION,
+and load_bundle_trees() and verify also check them against the boosters.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+from utils.tree_ensemble import COMPILER_VERSION, TreePredictor, compile_models
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = 'manifest.json'
+CURRENT_FILE = 'CURRENT'
+# 2: compiled trees take their bias from base_score; format 1 bundles are re-exported
+BUNDLE_FORMAT = 2
+SCALER_ARRAYS = ('mean', 'scale', 'var')
+TREES_PREFIX = 'trees'
+
+class BundleError(Exception):
+    """Raised when a bundle is missing, incomplete or fails verification"""
+
+def bundle_root(model_dir):
+    return os.path.join(model_dir, 'models')
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def current_version(model_dir):
+    """
+    Version named by models/CURRENT, or None if no bundle was exported
+    """
+    try:
+        with open(os.path.join(bundle_root(model_dir), CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def set_current_version(model_dir, version):
+    """
+    Point models/CURRENT at version with an atomic rename
+    """
+    root = bundle_root(model_dir)
+    tmp = os.path.join(root, f".{CURRENT_FILE}.{os.getpid()}")
+    with open(tmp, 'w') as f:
+        f.write(version + '\n')
+    os.replace(tmp, os.path.join(root, CURRENT_FILE))
+
+def _source_hashes(model_dir):
+    from utils.model_files import CLASSIFICATION_MODEL_FILE, REGRESSION_MODEL_FILE, SCALER_FILE
+    return {
+        name: file_sha256(os.path.join(model_dir, name))
+        for name in (CLASSIFICATION_MODEL_FILE, REGRESSION_MODEL_FILE, SCALER_FILE)
+    }
+
+def pickle_version(model_dir, source_hashes=None):
+    """
+    Short content hash of the three source pickles; the default bundle
+    version, and the model version when serving straight from the pickles
+    """
+    source_hashes = source_hashes or _source_hashes(model_dir)
+    return hashlib.sha256(''.join(source_hashes.values()).encode()).hexdigest()[:12]
+
+def _export_model(model, directory, name):
+    if hasattr(model, 'get_booster'):
+        filename = f"{name}.ubj"
+        model.save_model(os.path.join(directory, filename))
+        kind = 'xgboost'
+    else:
+        # Not a booster: keep the estimator pickled inside the bundle
+        import joblib
+        filename = f"{name}.joblib"
+        joblib.dump(model, os.path.join(directory, filename))
+        kind = 'joblib'
+    return {
+        'kind': kind,
+        'class': f"{type(model).__module__}.{type(model).__name__}",
+        'file': filename,
+        'n_features_in': int(getattr(model, 'n_features_in_', 0)),
+        'feature_names': [str(n) for n in getattr(model, 'feature_names_in_', [])],
+    }
+
+def _export_scaler(scaler, directory):
+    if not (hasattr(scaler, 'mean_') and hasattr(scaler, 'scale_')):
+        raise BundleError(f"Only StandardScaler-like scalers can be exported, got {type(scaler)}")
+    files = {}
+    for name in SCALER_ARRAYS:
+        values = getattr(scaler, f"{name}_", None)
+        if values is None:
+            continue
+        files[name] = f"scaler_{name}.npy"
+        np.save(os.path.join(directory, files[name]), np.ascontiguousarray(values, dtype=np.float64))
+    return {
+        'files': files,
+        'n_samples_seen': int(np.max(getattr(scaler, 'n_samples_seen_', 0))),
+        'feature_names': [str(n) for n in getattr(scaler, 'feature_names_in_', [])],
+    }
+
+def write_models(models, directory):
+    """
+    Write (classification_model, regression_model, scaler) into directory
+    in the bundle's formats
+    Returns their manifest entries, for read_models()
+    """
+    classification_model, regression_model, scaler = models
+    return {
+        'classification': _export_model(classification_model, directory, 'classification'),
+        'regression': _export_model(regression_model, directory, 'regression'),
+        'scaler': _export_scaler(scaler, directory),
+    }
+
+def export_bundle(model_dir, models=None, version=None):
+    """
+    Write the models and scaler as a new bundle version and make it current
+    models: (classification_model, regression_model, scaler); read from the
+    pickles in model_dir when omitted
+    version: defaults to a short hash of the source pickles
+    Returns the bundle directory
+    """
+    from utils.model_files import load_pickles
+    source_hashes = _source_hashes(model_dir)
+    if models is None:
+        models = load_pickles(model_dir)
+    if version is None:
+        version = pickle_version(model_dir, source_hashes)
+
+    root = bundle_root(model_dir)
+    directory = os.path.join(root, version)
+    staging = os.path.join(root, f".{version}.tmp")
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    try:
+        trees = {'prefix': TREES_PREFIX, 'compiler': COMPILER_VERSION,
+                 'files': compile_models(*models[:2]).save(staging, TREES_PREFIX)}
+    except ValueError as e:
+        logger.warning("Models not compiled to flat trees: %s", e)
+        trees = None
+    manifest = {
+        'format': BUNDLE_FORMAT,
+        'version': version,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'sources': source_hashes,
+        **write_models(models, staging),
+        'trees': trees,
+    }
+    manifest['checksums'] = {
+        name: file_sha256(os.path.join(staging, name))
+        for name in sorted(os.listdir(staging))
+    }
+    with open(os.path.join(staging, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(staging, directory)
+    set_current_version(model_dir, version)
+    logger.info("Exported model bundle %s to %s", version, directory)
+    return directory
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise BundleError(f"Cannot read manifest in {directory}: {e}")
+    if manifest.get('format') != BUNDLE_FORMAT:
+        raise BundleError(f"Unsupported bundle format {manifest.get('format')!r} in {directory}; "
+                          "re-export it with python -m utils.model_bundle export")
+    return manifest
+
+def verify_bundle(directory, manifest=None):
+    """
+    Check every bundle file against the manifest checksums
+    Raises BundleError on the first missing or modified file
+    """
+    manifest = manifest or read_manifest(directory)
+    for name, expected in manifest['checksums'].items():
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            raise BundleError(f"Bundle file missing: {path}")
+        if file_sha256(path) != expected:
+            raise BundleError(f"Checksum mismatch for {path}")
+    return manifest
+
+def _load_model(directory, spec):
+    path = os.path.join(directory, spec['file'])
+    if spec['kind'] == 'joblib':
+        import joblib
+        return joblib.load(path)
+    import xgboost
+    cls = xgboost.XGBClassifier if spec['class'].endswith('Classifier') else xgboost.XGBRegressor
+    model = cls()
+    model.load_model(path)
+    return model
+
+def _load_scaler(directory, spec):
+    from sklearn.preprocessing import StandardScaler
+    arrays = {
+        name: np.load(os.path.join(directory, filename), mmap_mode='r')
+        for name, filename in spec['files'].items()
+    }
+    scaler = StandardScaler()
+    scaler.mean_ = arrays['mean']
+    scaler.scale_ = arrays['scale']
+    scaler.var_ = arrays.get('var')
+    scaler.n_features_in_ = len(arrays['mean'])
+    scaler.n_samples_seen_ = spec['n_samples_seen']
+    if spec['feature_names']:
+        scaler.feature_names_in_ = np.asarray(spec['feature_names'], dtype=object)
+    return scaler
+
+def read_models(directory, specs):
+    """
+    (classification_model, regression_model, scaler) written to directory
+    by write_models(); specs are the entries it returned
+    """
+    return (_load_model(directory, specs['classification']), _load_model(directory, specs['regression']),
+            _load_scaler(directory, specs['scaler']))
+
+def load_bundle(model_dir, version=None, verify=True):
+    """
+    Load (classification_model, regression_model, scaler, manifest) from a bundle
+    version: defaults to models/CURRENT
+    verify: check file checksums before loading
+    """
+    version = version or current_version(model_dir)
+    if version is None:
+        raise BundleError(f"No model bundle under {bundle_root(model_dir)}")
+    directory = os.path.join(bundle_root(model_dir), version)
+
+    timings = {}
+    start = time.perf_counter()
+    manifest = read_manifest(directory)
+    if verify:
+        verify_bundle(directory, manifest)
+    timings['verify'] = time.perf_counter() - start
+
+    loaded = []
+    for key, loader in (('classification', _load_model), ('regression', _load_model), ('scaler', _load_scaler)):
+        start = time.perf_counter()
+        loaded.append(loader(directory, manifest[key]))
+        timings[key] = time.perf_counter() - start
+
+    logger.info(
+        "Loaded model bundle %s in %.1f ms (%s)", version, sum(timings.values()) * 1000,
+        ', '.join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in timings.items()),
+    )
+    return (*loaded, manifest)
+
+def load_bundle_trees(model_dir, version=None, verify=True, models=None):
+    """
+    Memory-mapped TreePredictor of a bundle, or None if the bundle holds
+    no compiled trees
+    verify: check the checksums of the tree files first
+    models: (classification_model, regression_model, ...) the trees must
+    reproduce (TreePredictor.check); BundleError if they do not
+    """
+    version = version or current_version(model_dir)
+    if version is None:
+        raise BundleError(f"No model bundle under {bundle_root(model_dir)}")
+    directory = os.path.join(bundle_root(model_dir), version)
+    manifest = read_manifest(directory)
+    spec = manifest.get('trees')
+    if not spec:
+        return None
+    if spec.get('compiler') != COMPILER_VERSION:
+        raise BundleError(f"Compiled trees in {directory} are from tree compiler {spec.get('compiler')}, "
+                          f"not {COMPILER_VERSION}; re-export the bundle")
+    if verify:
+        for name in spec['files']:
+            if file_sha256(os.path.join(directory, name)) != manifest['checksums'].get(name):
+                raise BundleError(f"Checksum mismatch for {os.path.join(directory, name)}")
+    try:
+        trees = TreePredictor.load(directory, spec['prefix'])
+    except (OSError, ValueError) as e:
+        raise BundleError(f"Cannot load compiled trees from {directory}: {e}")
+    if models is not None:
+        try:
+            trees.check(*models[:2])
+        except ValueError as e:
+            raise BundleError(f"Compiled trees in {directory} do not match the models: {e}")
+    return trees
+
+def main(argv=None):
+    from utils.model_files import MODEL_DIR
+    parser = argparse.ArgumentParser(description="Export or verify the versioned model bundle")
+    parser.add_argument('command', choices=['export', 'verify'])
+    parser.add_argument('--model-dir', default=MODEL_DIR)
+    parser.add_argument('--version', help="bundle version (export default: hash of the pickles)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    try:
+        if args.command == 'export':
+            export_bundle(args.model_dir, version=args.version)
+        else:
+            version = args.version or current_version(args.model_dir)
+            if version is None:
+                raise BundleError("No model bundle to verify")
+            directory = os.path.join(bundle_root(args.model_dir), version)
+            verify_bundle(directory)
+            # Files intact; the derived trees must still reproduce the boosters
+            *models, manifest = load_bundle(args.model_dir, version, verify=False)
+            if manifest.get('trees'):
+                load_bundle_trees(args.model_dir, version, verify=False, models=models)
+            logger.info("Model bundle %s verified", version)
+    except BundleError as e:
+        logger.error("%s", e)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
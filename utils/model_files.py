@@ -0,0 +1,127 @@
+"""
+Loading of the model files, without Streamlit
+
+The CLIs (batch_score, parallel_score, model_bundle, distill, calibration,
+drift) and the scoring service load the models through this module, so
+they never import Streamlit. utils.model_loader wraps it in the
+st.cache_resource loaders of the app.
+"""
+import logging
+import os
+import pickle
+import time
+
+import numpy as np
+
+from utils.feature_schema import SCHEMA
+from utils.instrumentation import timed
+from utils.model_bundle import BundleError, current_version, load_bundle, load_bundle_trees, pickle_version
+from utils.tree_ensemble import compile_models
+
+logger = logging.getLogger(__name__)
+
+# Model files live at the repository root, next to app.py
+MODEL_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLASSIFICATION_MODEL_FILE = 'EMI_classification_Best_Model.pkl'
+REGRESSION_MODEL_FILE = 'EMI_regression_Best_Model.pkl'
+SCALER_FILE = 'scaler.pkl'
+# Which models serve predictions: the originals through their libraries,
+# the originals compiled to flat arrays (utils.tree_ensemble) for small
+# batches, or the distilled surrogate (utils.distill)
+SCORERS = ('teacher', 'flat', 'surrogate')
+SCORER_ENV = 'EMI_SCORER'
+
+def _read_pickle(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+def _read_numpy(path):
+    return np.load(path, allow_pickle=True)
+
+def _load_pickle(path, allow_numpy=False):
+    # joblib also reads plain pickles; the other readers cover files it rejects
+    import joblib
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Model file not found: {path}")
+    readers = [joblib.load, _read_pickle] + ([_read_numpy] if allow_numpy else [])
+    errors = []
+    for reader in readers:
+        try:
+            obj = reader(path)
+        except Exception as e:
+            errors.append(f"{reader.__name__}: {e}")
+            continue
+        if isinstance(obj, str):
+            raise ValueError(f"{path} loaded as a string - file may be corrupted")
+        return obj
+    raise ValueError(f"Could not load {path} ({'; '.join(errors)})")
+
+def load_pickles(model_dir=MODEL_DIR):
+    """
+    Load (classification_model, regression_model, scaler) from the original pickles
+    """
+    loaded = []
+    for filename, allow_numpy in ((CLASSIFICATION_MODEL_FILE, False), (REGRESSION_MODEL_FILE, False),
+                                  (SCALER_FILE, True)):
+        start = time.perf_counter()
+        loaded.append(_load_pickle(os.path.join(model_dir, filename), allow_numpy))
+        logger.info("Loaded %s (%s) in %.1f ms", filename, type(loaded[-1]).__name__,
+                    (time.perf_counter() - start) * 1000)
+    return tuple(loaded)
+
+@timed('model_load')
+def load_versioned_models(model_dir=MODEL_DIR):
+    """
+    Like load_model_files, also returning the version of what was loaded:
+    the bundle version, or the content hash of the pickles
+    """
+    models = None
+    if current_version(model_dir) is not None:
+        try:
+            *models, manifest = load_bundle(model_dir)
+            models, version = tuple(models), manifest['version']
+        except BundleError as e:
+            logger.warning("Model bundle unusable, falling back to pickles: %s", e)
+            models = None
+    if models is None:
+        models, version = load_pickles(model_dir), pickle_version(model_dir)
+    # Startup check: the models must agree with the compiled feature schema
+    SCHEMA.validate(*models)
+    return models, version
+
+def default_scorer():
+    scorer = os.environ.get(SCORER_ENV, 'teacher')
+    if scorer not in SCORERS:
+        raise ValueError(f"{SCORER_ENV} must be one of {', '.join(SCORERS)}, not {scorer!r}")
+    return scorer
+
+def load_compiled_trees(models, version=None, model_dir=MODEL_DIR):
+    """
+    TreePredictor for the loaded models: memory-mapped from the current
+    bundle when it is this version and holds compiled trees that match
+    the models, otherwise compiled now; None if the models cannot be
+    compiled
+    """
+    if version is not None and version == current_version(model_dir):
+        try:
+            trees = load_bundle_trees(model_dir, version, models=models)
+        except BundleError as e:
+            logger.warning("Compiled trees in the bundle unusable: %s", e)
+            trees = None
+        if trees is not None:
+            return trees
+    try:
+        return compile_models(*models[:2])
+    except ValueError as e:
+        logger.warning("Models not compiled to flat trees: %s", e)
+        return None
+
+def load_model_files(model_dir=MODEL_DIR):
+    """
+    Load classification model, regression model and scaler without any
+    Streamlit output, for headless batch and service use
+    Uses the verified model bundle when one has been exported (see
+    utils.model_bundle) and the original pickles otherwise
+    Raises if any file is missing or unreadable
+    """
+    return load_versioned_models(model_dir)[0]
@@ -1,71 +1,328 @@
-import pickle
-import streamlit as st
-import joblib
-import numpy as np
+"""
+Streamlit loaders of the models and the per-process helpers around them
 
-@st.cache_resource
-def load_models():
+Each loader runs once per process and model version (st.cache_resource).
+Importing this module is cheap: Streamlit and the utils behind each
+loader are imported by the first call, so pages and the background
+warm-up pay only for what they use. Headless code loads the models
+through utils.model_files.
+
+With EMI_MODEL_STORE set, every Streamlit process on the host serves the
+version published to that shared model store (utils.model_store) instead
+of the files. load_models() asks the store on every run (ModelStore.get,
+at most every refresh_seconds), so a newly published version is served
+without a restart: the first run that sees it drops the cached
+predictions and the objects built for the previous version (fast path,
+scorer, batcher, decision policy, drift monitor, explainer) under a lock.
+Those loaders are keyed by version, so a run that started on the
+previous version finishes with its objects; their background threads
+are closed RETIRE_SECONDS later.
+"""
+import functools
+import logging
+import os
+import threading
+
+from utils.model_files import MODEL_DIR, default_scorer, load_compiled_trees, load_versioned_models
+
+logger = logging.getLogger(__name__)
+
+# Prediction audit log path; unset (or 'off') logs nothing
+AUDIT_LOG_ENV = 'EMI_AUDIT_LOG'
+# Drift report path; unset (or 'off') disables drift monitoring
+DRIFT_REPORT_ENV = 'EMI_DRIFT_REPORT'
+# Seconds the workers of a replaced model version keep running for runs still using them
+RETIRE_SECONDS = 60.0
+
+# Serialises switching to a newly published model version
+_swap_lock = threading.Lock()
+# (version, object with close()) built by the per-version loaders
+_version_workers = []
+_version_workers_lock = threading.Lock()
+
+def _cache_resource(fn):
+    """
+    st.cache_resource applied on the first call, so Streamlit is not
+    imported with this module
+    """
+    cached = None
+    lock = threading.Lock()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        nonlocal cached
+        if cached is None:
+            with lock:
+                if cached is None:
+                    import streamlit as st
+                    cached = st.cache_resource(fn)
+        return cached(*args, **kwargs)
+
+    def clear():
+        if cached is not None:
+            cached.clear()
+    wrapper.clear = clear
+    return wrapper
+
+def _report_load_error(e):
+    import streamlit as st
+    logger.error("Error loading models", exc_info=e)
+    st.error(f"Error loading models: {e}")
+    return (None, None, None), None
+
+@_cache_resource
+def _load_file_models():
+    # The files are loaded once per process
     try:
-        # Load classification model
-        classification_model = None
-        try:
-            classification_model = joblib.load('EMI_classification_Best_Model.pkl')
-            st.info(f"Classification model loaded with joblib - Type: {type(classification_model)}")
-        except:
-            try:
-                with open('EMI_classification_Best_Model.pkl', 'rb') as f:
-                    classification_model = pickle.load(f)
-                st.info(f"Classification model loaded with pickle - Type: {type(classification_model)}")
-            except Exception as e:
-                st.error(f"Failed to load classification model: {e}")
-        
-        # Load regression model
-        regression_model = None
-        try:
-            regression_model = joblib.load('EMI_regression_Best_Model.pkl')
-            st.info(f"Regression model loaded with joblib - Type: {type(regression_model)}")
-        except:
-            try:
-                with open('EMI_regression_Best_Model.pkl', 'rb') as f:
-                    regression_model = pickle.load(f)
-                st.info(f"Regression model loaded with pickle - Type: {type(regression_model)}")
-            except Exception as e:
-                st.error(f"Failed to load regression model: {e}")
-        
-        # Load scaler
-        scaler = None
-        try:
-            scaler = joblib.load('scaler.pkl')
-            st.info(f"Scaler loaded with joblib - Type: {type(scaler)}")
-        except:
-            try:
-                with open('scaler.pkl', 'rb') as f:
-                    scaler = pickle.load(f)
-                st.info(f"Scaler loaded with pickle - Type: {type(scaler)}")
-            except:
-                try:
-                    scaler = np.load('scaler.pkl', allow_pickle=True)
-                    st.info(f"Scaler loaded with numpy - Type: {type(scaler)}")
-                except Exception as e:
-                    st.error(f"Failed to load scaler: {e}")
-        
-        # Check if models and scaler are actually objects not strings
-        if isinstance(classification_model, str):
-            st.error("Classification model loaded as string - file may be corrupted")
-            classification_model = None
-        
-        if isinstance(regression_model, str):
-            st.error("Regression model loaded as string - file may be corrupted")
-            regression_model = None
-            
-        if isinstance(scaler, str):
-            st.error("Scaler loaded as string - file may be corrupted")
-            scaler = None
-        
-        return classification_model, regression_model, scaler
+        models, version = load_versioned_models()
+    except Exception as e:
+        return _report_load_error(e)
+    # Fresh models: drop every prediction made with the previous ones
+    load_prediction_cache().invalidate(version)
+    return models, version
+
+@_cache_resource
+def load_model_store():
+    """
+    ModelStore attached to EMI_MODEL_STORE; None when unset
+    """
+    from utils.model_store import STORE_ENV, ModelStore
+    root = os.environ.get(STORE_ENV)
+    return ModelStore(root) if root else None
+
+def _models_in_use():
+    """
+    (models, version) answering predictions now; ((None, None, None),
+    None) when they cannot be loaded
+    """
+    store = load_model_store()
+    if store is None:
+        return _load_file_models()
+    try:
+        shared = store.get()
     except Exception as e:
-        st.error(f"Error loading models: {e}")
-        st.error(f"Error type: {type(e).__name__}")
-        import traceback
-        st.error(traceback.format_exc())
-        return None, None, None
\ No newline at end of file
+        return _report_load_error(e)
+    _use_version(shared.version)
+    return shared.models, shared.version
+
+def _use_version(version):
+    """
+    Make version the one in use: on a change, drop the cached predictions
+    and the per-version objects of the previous version
+    """
+    cache = load_prediction_cache()
+    if cache.version == version:
+        return
+    with _swap_lock:
+        if cache.version == version:
+            return
+        previous = cache.version
+        cache.invalidate(version)
+        for loader in _VERSIONED_LOADERS:
+            loader.clear()
+        with _version_workers_lock:
+            retired = [worker for v, worker in _version_workers if v != version]
+            _version_workers[:] = [(v, worker) for v, worker in _version_workers if v == version]
+    if previous is not None:
+        logger.info("Serving model version %s, replacing %s", version, previous)
+    if retired:
+        timer = threading.Timer(RETIRE_SECONDS, _close_all, [retired])
+        timer.daemon = True
+        timer.start()
+
+def _track(version, worker):
+    # Closed once version is replaced
+    if worker is not None:
+        with _version_workers_lock:
+            _version_workers.append((version, worker))
+    return worker
+
+def _close_all(workers):
+    for worker in workers:
+        try:
+            worker.close()
+        except Exception:
+            logger.exception("Closing %s of a replaced model version failed", type(worker).__name__)
+
+def load_models():
+    """
+    The models answering predictions: loaded from the files once per
+    process, or the version published to EMI_MODEL_STORE
+    Failures are reported in the UI and returned as (None, None, None)
+    """
+    return _models_in_use()[0]
+
+@_cache_resource
+def load_prediction_cache():
+    """
+    Process-wide prediction cache for the Prediction page
+    """
+    from utils.prediction_cache import PredictionCache
+    return PredictionCache()
+
+def load_fast_predictor():
+    """
+    Pandas-free FastPredictor for the loaded models, or None if unsupported
+    """
+    models, version = _models_in_use()
+    return _fast_predictor(version, models)
+
+@_cache_resource
+def _fast_predictor(version, _models):
+    from utils.fast_path import build_fast_predictor
+    if any(m is None for m in _models):
+        return None
+    return build_fast_predictor(*_models)
+
+def load_scorer_predict_fn():
+    """
+    Replacement for the fast path's predict_scaled chosen by EMI_SCORER:
+    compiled trees for small batches ('flat') or the distilled surrogate
+    when one passed its guardrails ('surrogate'); None for the originals
+    """
+    models, version = _models_in_use()
+    return _scorer_predict_fn(version, models)
+
+@_cache_resource
+def _scorer_predict_fn(version, _models):
+    from utils.distill import load_surrogate
+    from utils.tree_ensemble import small_batch_predict_fn
+    scorer = default_scorer()
+    fast = _fast_predictor(version, _models)
+    if scorer == 'teacher' or fast is None:
+        return None
+    if scorer == 'surrogate':
+        surrogate = load_surrogate(MODEL_DIR, version)
+        return surrogate.predict_scaled if surrogate is not None else None
+    store = load_model_store()
+    shared = store.models if store is not None else None
+    if shared is not None and shared.version == version:
+        trees = shared.trees
+    else:
+        trees = load_compiled_trees(_models, version)
+    return small_batch_predict_fn(trees, fast.predict_scaled) if trees is not None else None
+
+def served_scorer():
+    """
+    Scorer answering predictions: EMI_SCORER, or 'teacher' when the
+    selected one is unavailable
+    """
+    return default_scorer() if load_scorer_predict_fn() is not None else 'teacher'
+
+def served_model_version():
+    """
+    Version of the models answering predictions, suffixed with the scorer
+    when it is not the originals
+    """
+    version = _models_in_use()[1]
+    scorer = served_scorer()
+    return version if scorer == 'teacher' else f"{version}:{scorer}"
+
+def _predict_fn(version, models):
+    predict_fn = _scorer_predict_fn(version, models)
+    if predict_fn is not None:
+        return predict_fn
+    fast = _fast_predictor(version, models)
+    return fast.predict_scaled if fast is not None else None
+
+def load_predict_fn():
+    """
+    Replacement for scoring.predict_scaled on scaled rows: the selected
+    scorer, else the fast path, else None
+    """
+    models, version = _models_in_use()
+    return _predict_fn(version, models)
+
+def load_prediction_batcher():
+    """
+    Micro-batcher over the loaded models, shared by every session in this
+    process so concurrent predictions run as one vectorized call
+    """
+    models, version = _models_in_use()
+    return _prediction_batcher(version, models)
+
+@_cache_resource
+def _prediction_batcher(version, _models):
+    from utils.micro_batcher import model_batcher
+    classification_model, regression_model, _ = _models
+    batcher = model_batcher(classification_model, regression_model, predict_fn=_predict_fn(version, _models))
+    return _track(version, batcher)
+
+def load_decision_policy():
+    """
+    Calibration and risk bands for the loaded models (utils.calibration)
+    """
+    return _decision_policy(_models_in_use()[1])
+
+@_cache_resource
+def _decision_policy(version):
+    from utils.calibration import load_policy
+    return load_policy(MODEL_DIR, version)
+
+@_cache_resource
+def load_audit_log():
+    """
+    Process-wide prediction audit log at EMI_AUDIT_LOG, keeping
+    EMI_AUDIT_RETENTION_DAYS of it (utils.audit_log); None when unset,
+    since it stores applicants' personal data, or when it cannot be opened
+    """
+    import sqlite3
+    from utils.audit_log import AuditLog
+    path = os.environ.get(AUDIT_LOG_ENV)
+    if not path or path == 'off':
+        return None
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        return AuditLog(path)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        logger.warning("Prediction audit log disabled: %s", e)
+        return None
+
+def load_drift_monitor():
+    """
+    Process-wide DriftMonitor of the loaded models (utils.drift), exporting
+    its report to EMI_DRIFT_REPORT; None when that is unset or without the
+    fast path
+    """
+    path = os.environ.get(DRIFT_REPORT_ENV)
+    if not path or path == 'off':
+        return None
+    models, version = _models_in_use()
+    return _drift_monitor(version, models, path)
+
+@_cache_resource
+def _drift_monitor(version, _models, path):
+    from utils.drift import build_monitor
+    fast = _fast_predictor(version, _models)
+    if fast is None:
+        return None
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    except OSError as e:
+        logger.warning("Drift monitoring disabled: %s", e)
+        return None
+    return _track(version, build_monitor(fast, MODEL_DIR, version, path))
+
+def load_explainer():
+    """
+    Background ExplanationWorker over the loaded models, shared by every
+    session in this process; None when the models cannot be explained
+    """
+    models, version = _models_in_use()
+    return _explainer(version, models)
+
+@_cache_resource
+def _explainer(version, _models):
+    from utils.explain import ExplanationWorker
+    classification_model, regression_model, _ = _models
+    if classification_model is None or regression_model is None:
+        return None
+    try:
+        return _track(version, ExplanationWorker(classification_model, regression_model, version=version))
+    except ValueError as e:
+        logger.warning("Explanations disabled: %s", e)
+        return None
+
+# Built per model version; cleared when a newly published version is served
+_VERSIONED_LOADERS = (_fast_predictor, _scorer_predict_fn, _prediction_batcher, _decision_policy,
+                      _drift_monitor, _explainer)
@@ -0,0 +1,410 @@
+"""
+Shared-memory model store for multi-process deployments
+
+Usage: python -m utils.model_store publish [--root DIR] [--model-dir DIR] [--keep N]
+       python -m utils.model_store status [--root DIR]
+
+st.cache_resource and the service's startup load deduplicate models
+within one process only, so every Streamlit or scoring process on a host
+reads its own pickles, possibly of different versions. The store keeps
+one published copy per host. One loader process publishes the models
+under the store root, in the formats of utils.model_bundle: the native
+XGBoost boosters, the scaler statistics as .npy files, and both ensembles
+compiled to flat arrays by utils.tree_ensemble. The root defaults to
+/dev/shm, so the files live in shared memory. Other processes attach with
+ModelStore: Streamlit (EMI_MODEL_STORE), the scoring service
+(--model-store) and the parallel_score workers.
+
+Attached processes serve exactly what the original models do, but they
+do not share one zero-copy model: XGBoost only predicts from boosters
+loaded into its own memory, so every process holds a private copy of
+them, and that copy is what the default 'teacher' scorer runs. Only the
+scaler statistics and the compiled trees are memory-mapped and read from
+the same physical pages, saving about 6 MB per process
+(benchmarks/bench_model_store.py). What the store does give is one
+published version per host, swapped without restarts. With the 'flat'
+scorer the compiled trees answer batches of up to SMALL_BATCH_ROWS rows,
+as everywhere else. store.json records the tree compiler version: publish()
+rewrites a version compiled by an older one, and attaching processes
+compile their own trees when the published ones are stale or fail
+TreePredictor.check().
+
+The root is created mode 0o700, and processes refuse to publish to or
+attach to a root that is not a directory owned by their user and closed
+to others: the files are loaded as models, so nobody else may write them.
+
+<root>/CURRENT names the published version and is replaced by an atomic
+rename. Attached processes look at it at most every refresh_seconds and
+switch to a newly published version between calls, without a restart.
+Processes still using an old version keep their mapping; publish()
+leaves the last `keep` versions on disk.
+
+memory_report() reads /proc/self/smaps to show how much of a process's
+RSS is store pages shared with other processes.
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import shutil
+import stat
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.fast_path import derive_record
+from utils.feature_engineering import prepare_features_for_prediction
+from utils.feature_schema import SCHEMA
+from utils.model_bundle import BundleError, read_models, write_models
+from utils.scoring import SCORE_COLUMNS, check_records, predict_scaled, result_dicts
+from utils.tree_ensemble import COMPILER_VERSION, TreePredictor, compile_models, small_batch_predict_fn
+
+logger = logging.getLogger(__name__)
+
+STORE_ENV = 'EMI_MODEL_STORE'
+CURRENT_FILE = 'CURRENT'
+INFO_FILE = 'store.json'
+TREES_PREFIX = 'trees'
+DEFAULT_KEEP = 2
+DEFAULT_REFRESH_SECONDS = 1.0
+# Scorers a store can serve: the originals, or compiled trees for small batches
+STORE_SCORERS = ('teacher', 'flat')
+_MAPPING_HEADER = re.compile(r'^[0-9a-f]+-[0-9a-f]+ ')
+
+class StoreError(Exception):
+    """Raised when the store has no usable published models"""
+
+def default_root():
+    """
+    EMI_MODEL_STORE, else a per-user directory in /dev/shm, else in the
+    temp directory
+    """
+    if os.environ.get(STORE_ENV):
+        return os.environ[STORE_ENV]
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(base, f'emi-models-{os.getuid()}')
+
+def check_root(root, create=False):
+    """
+    Raise StoreError unless root is a directory (not a symlink) owned by
+    this user and inaccessible to others
+    create: create it first, mode 0o700, if missing
+    """
+    if create:
+        try:
+            os.makedirs(root, mode=0o700, exist_ok=True)
+        except OSError as e:
+            raise StoreError(f"Cannot create model store {root}: {e}")
+    try:
+        info = os.lstat(root)
+    except FileNotFoundError:
+        raise StoreError(f"No models published in {root}")
+    if not stat.S_ISDIR(info.st_mode):
+        raise StoreError(f"Model store {root} is not a directory")
+    if info.st_uid != os.getuid():
+        raise StoreError(f"Model store {root} is owned by uid {info.st_uid}, not by this user ({os.getuid()})")
+    if info.st_mode & 0o077:
+        raise StoreError(f"Model store {root} is open to other users (mode {info.st_mode & 0o777:o}); "
+                         "chmod 700 it")
+
+def published_version(root):
+    """
+    Version named by <root>/CURRENT, or None if nothing was published
+    """
+    try:
+        with open(os.path.join(root, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def _set_published_version(root, version):
+    tmp = os.path.join(root, f".{CURRENT_FILE}.{os.getpid()}")
+    with open(tmp, 'w') as f:
+        f.write(version + '\n')
+    os.replace(tmp, os.path.join(root, CURRENT_FILE))
+
+def _prune(root, keep):
+    versions = []
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if not name.startswith('.') and os.path.isfile(os.path.join(path, INFO_FILE)):
+            versions.append((os.path.getmtime(path), name))
+    current = published_version(root)
+    for _, name in sorted(versions, reverse=True)[keep:]:
+        if name != current:
+            # Processes that still map these files keep their pages until they swap
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+            logger.info("Pruned model store version %s", name)
+
+def _published_compiler(directory):
+    try:
+        with open(os.path.join(directory, INFO_FILE)) as f:
+            return json.load(f).get('compiler')
+    except (OSError, ValueError):
+        return None
+
+def publish(models, version, root=None, keep=DEFAULT_KEEP):
+    """
+    Publish (classification_model, regression_model, scaler) as version
+    and make it current; attached processes switch to it on their next
+    refresh
+    Returns the version directory
+    Raises StoreError when the models cannot be exported or compiled to
+    flat arrays, or the root is not safe to publish to (check_root)
+    """
+    root = root or default_root()
+    check_root(root, create=True)
+    directory = os.path.join(root, version)
+    # Versions are content hashes: a published one only needs rewriting for a newer tree compiler
+    if _published_compiler(directory) != COMPILER_VERSION:
+        try:
+            trees = compile_models(*models[:2])
+        except ValueError as e:
+            raise StoreError(f"Models cannot be published: {e}")
+
+        staging = os.path.join(root, f".{version}.{os.getpid()}.tmp")
+        shutil.rmtree(staging, ignore_errors=True)
+        trees.save(staging, TREES_PREFIX)
+        try:
+            specs = write_models(models, staging)
+        except BundleError as e:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise StoreError(f"Models cannot be published: {e}")
+        files = sorted(os.listdir(staging))
+        info = {
+            'version': version,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'publisher_pid': os.getpid(),
+            'compiler': COMPILER_VERSION,
+            'models': specs,
+            'files': files,
+            'bytes': sum(os.path.getsize(os.path.join(staging, name)) for name in files),
+        }
+        with open(os.path.join(staging, INFO_FILE), 'w') as f:
+            json.dump(info, f, indent=2)
+        if os.path.isdir(directory):
+            # Trees of an older compiler; processes mapping them keep their pages
+            stale = os.path.join(root, f".{version}.{os.getpid()}.stale")
+            os.replace(directory, stale)
+            shutil.rmtree(stale, ignore_errors=True)
+        os.replace(staging, directory)
+
+    _set_published_version(root, version)
+    _prune(root, keep)
+    logger.info("Published model version %s to %s", version, directory)
+    return directory
+
+class SharedModels:
+    """
+    One published version of the store
+    models: (classification_model, regression_model, scaler) loaded from
+    it; the scaler arrays and the compiled trees are memory-mapped
+    scorer: 'teacher' (the boosters) or 'flat' (compiled trees for batches
+    of up to SMALL_BATCH_ROWS rows)
+    threads: inference threads of the boosters; theirs by default
+    """
+    def __init__(self, directory, scorer='teacher', threads=None):
+        if scorer not in STORE_SCORERS:
+            raise ValueError(f"A model store serves {' or '.join(STORE_SCORERS)} models, not {scorer!r}")
+        with open(os.path.join(directory, INFO_FILE)) as f:
+            self.info = json.load(f)
+        self.version = self.info['version']
+        self.directory = directory
+        self.scorer = scorer
+        self.models = read_models(directory, self.info['models'])
+        if threads is not None:
+            for model in self.models[:2]:
+                if 'n_jobs' in getattr(model, 'get_params', dict)():
+                    model.set_params(n_jobs=threads)
+        self.trees = TreePredictor.load(directory, TREES_PREFIX, mmap=True)
+        try:
+            if self.info.get('compiler') != COMPILER_VERSION:
+                raise ValueError(f"tree compiler {self.info.get('compiler')}, not {COMPILER_VERSION}")
+            self.trees.check(*self.models[:2])
+        except ValueError as e:
+            # Published by older code: the version hash covers the models, not the compiler
+            logger.warning("Compiled trees of version %s are stale, compiling them in this process: %s",
+                           self.version, e)
+            self.trees = compile_models(*self.models[:2])
+        self.mean = self.models[2].mean_
+        self.scale = self.models[2].scale_
+        self.classes = np.asarray(self.models[0].classes_)
+        self._predict = self._teacher_predict
+        if scorer == 'flat':
+            self._predict = small_batch_predict_fn(self.trees, self._teacher_predict)
+
+    def _teacher_predict(self, X):
+        return predict_scaled(X, *self.models[:2])
+
+    def predict_scaled(self, X):
+        """
+        Same contract as scoring.predict_scaled
+        """
+        return self._predict(X)
+
+    def scaled_rows(self, records):
+        """
+        Scaled (n, n_features) float32 matrix for raw applicant dicts
+        """
+        X = np.array([[features[name] for name in SCHEMA.columns] for features in map(derive_record, records)],
+                     dtype=np.float64).reshape(len(records), SCHEMA.n_features)
+        return ((X - self.mean) / self.scale).astype(np.float32)
+
+    def score_records(self, records, monitor=None):
+        """
+        Same output as scoring.score_records
+        """
+        check_records(records)
+        X = self.scaled_rows(records)
+        classes, proba, emi = self.predict_scaled(X)
+        if monitor is not None:
+            monitor.observe(X, classes, proba[:, 1], emi)
+        return result_dicts(classes, proba, emi)
+
+    def score_features(self, df, monitor=None):
+        """
+        Same output as scoring.score_features for engineered applicant rows
+        """
+        X = (prepare_features_for_prediction(df).to_numpy(dtype=np.float64) - self.mean) / self.scale
+        classes, proba, emi = self.predict_scaled(X)
+        if monitor is not None:
+            monitor.observe(X, classes, proba[:, 1], emi)
+        return pd.DataFrame(dict(zip(SCORE_COLUMNS, (classes, proba[:, 1], emi))), index=df.index)
+
+class ModelStore:
+    """
+    Attachment to the published models of a store root, switching to a
+    newly published version at most every refresh_seconds
+    scorer, threads: as for SharedModels
+    Thread-safe; the models in use are replaced, never modified
+    """
+    def __init__(self, root=None, refresh_seconds=DEFAULT_REFRESH_SECONDS, scorer='teacher', threads=None):
+        if scorer not in STORE_SCORERS:
+            raise ValueError(f"A model store serves {' or '.join(STORE_SCORERS)} models, not {scorer!r}")
+        self.root = root or default_root()
+        self.refresh_seconds = refresh_seconds
+        self.scorer = scorer
+        self.threads = threads
+        self.models = None
+        self.swaps = 0
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """
+        Attach to the published version if it is not the one in use
+        Returns True when the models changed
+        Raises StoreError if nothing usable is published and no version
+        is attached yet, and whenever the root is unsafe (check_root)
+        """
+        with self._lock:
+            self._checked = time.monotonic()
+            check_root(self.root)
+            version = published_version(self.root)
+            if version is None or (self.models is not None and self.models.version == version):
+                if self.models is None:
+                    raise StoreError(f"No models published in {self.root}")
+                return False
+            try:
+                models = SharedModels(os.path.join(self.root, version), self.scorer, self.threads)
+            except (OSError, ValueError, KeyError) as e:
+                if self.models is None:
+                    raise StoreError(f"Cannot attach to model version {version}: {e}")
+                logger.warning("Keeping model version %s, cannot attach to %s: %s", self.models.version, version, e)
+                return False
+            if self.models is not None:
+                self.swaps += 1
+                logger.info("Swapped model version %s -> %s", self.models.version, version)
+            self.models = models
+            return True
+
+    def get(self):
+        """
+        Attached models, refreshed when refresh_seconds have passed
+        """
+        if self.models is None or time.monotonic() - self._checked >= self.refresh_seconds:
+            self.refresh()
+        return self.models
+
+    def score_records(self, records, monitor=None):
+        return self.get().score_records(records, monitor)
+
+    def score_features(self, df, monitor=None):
+        return self.get().score_features(df, monitor)
+
+    def stats(self):
+        models = self.models
+        return {
+            'root': self.root,
+            'version': models.version if models else None,
+            'scorer': self.scorer,
+            'published': published_version(self.root),
+            'swaps': self.swaps,
+            'memory': memory_report(self.root),
+        }
+
+def memory_report(root=None):
+    """
+    This process's RSS and the part of it mapped from the store, from
+    /proc/self/smaps; None where that is unavailable
+    store_saved_bytes is store RSS minus its proportional share (PSS):
+    memory this process would hold privately with its own copy
+    """
+    root = os.path.realpath(root or default_root())
+    fields = {'Rss': 0, 'Pss': 0, 'Shared_Clean': 0, 'Shared_Dirty': 0}
+    in_store = False
+    try:
+        with open('/proc/self/smaps') as f:
+            for line in f:
+                if _MAPPING_HEADER.match(line):
+                    # Address range, perms, offset, device, inode, path
+                    parts = line.split(None, 5)
+                    in_store = len(parts) == 6 and parts[5].strip().startswith(root + os.sep)
+                elif in_store:
+                    key, _, value = line.partition(':')
+                    if key in fields:
+                        fields[key] += int(value.split()[0]) * 1024
+        with open('/proc/self/status') as f:
+            rss = next(int(line.split()[1]) * 1024 for line in f if line.startswith('VmRSS:'))
+    except (OSError, StopIteration, ValueError):
+        return None
+    return {
+        'rss_bytes': rss,
+        'store_rss_bytes': fields['Rss'],
+        'store_pss_bytes': fields['Pss'],
+        'store_shared_bytes': fields['Shared_Clean'] + fields['Shared_Dirty'],
+        'store_saved_bytes': fields['Rss'] - fields['Pss'],
+    }
+
+def main(argv=None):
+    from utils.model_files import MODEL_DIR, load_versioned_models
+
+    parser = argparse.ArgumentParser(description="Publish models to the shared model store")
+    parser.add_argument('command', choices=['publish', 'status'])
+    parser.add_argument('--root', default=default_root(), help=f"store directory (default {default_root()})")
+    parser.add_argument('--model-dir', default=MODEL_DIR)
+    parser.add_argument('--keep', type=int, default=DEFAULT_KEEP,
+                        help=f"published versions kept on disk (default {DEFAULT_KEEP})")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    try:
+        if args.command == 'publish':
+            models, version = load_versioned_models(args.model_dir)
+            publish(models, version, args.root, args.keep)
+        else:
+            store = ModelStore(args.root)
+            store.refresh()
+            print(json.dumps(dict(store.stats(), info=store.models.info), indent=2))
+    except StoreError as e:
+        logger.error("%s", e)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
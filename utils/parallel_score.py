@@ -0,0 +1,135 @@
+"""
+Process-pool scoring for large applicant tables
+
+Each worker process loads the pickled models once in its initializer and
+then scores whole shards; results are concatenated back in input order.
+With model_store the workers attach to the shared model store of
+utils.model_store instead: every worker scores with the one published
+version, and the memory-mapped parts of it are held once per host.
+Either way each worker's boosters use threads_per_worker threads.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from utils.feature_engineering import engineer_features
+from utils.model_files import MODEL_DIR, load_model_files
+from utils.model_store import ModelStore
+from utils.scoring import SCORE_COLUMNS, score_features
+
+# Models (or ModelStore) for the current worker process, set once by _init_worker
+_worker_models = None
+_worker_store = None
+
+def _cgroup_cpus():
+    # cgroup v2 CPU quota, e.g. "200000 100000" for 2 CPUs or "max 100000"
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()[:2]
+        if quota == 'max':
+            return None
+        return max(1, int(quota) // int(period))
+    except (OSError, ValueError):
+        return None
+
+def physical_cores():
+    """
+    Best-effort count of physical cores (falls back to logical CPUs),
+    capped by the CPUs this process may run on (affinity mask) and by a
+    cgroup CPU quota, so containers are not oversubscribed
+    """
+    pairs = set()
+    physical = None
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('physical id'):
+                    physical = line.split(':')[1].strip()
+                elif line.startswith('core id'):
+                    pairs.add((physical, line.split(':')[1].strip()))
+    except OSError:
+        pass
+    cores = len(pairs) or os.cpu_count() or 1
+    if hasattr(os, 'sched_getaffinity'):
+        cores = min(cores, len(os.sched_getaffinity(0)))
+    quota = _cgroup_cpus()
+    if quota is not None:
+        cores = min(cores, quota)
+    return max(1, cores)
+
+def _init_worker(model_dir, threads_per_worker, model_store=None):
+    global _worker_models, _worker_store
+    # One inference thread per process: parallelism comes from the pool
+    if model_store is not None:
+        _worker_store = ModelStore(model_store, threads=threads_per_worker)
+        _worker_store.get()
+        return
+    _worker_models = load_model_files(model_dir)
+    for model in _worker_models[:2]:
+        if 'n_jobs' in getattr(model, 'get_params', dict)():
+            model.set_params(n_jobs=threads_per_worker)
+
+def _score_shard(shard):
+    if _worker_store is not None:
+        return _worker_store.score_features(engineer_features(shard))
+    return score_features(engineer_features(shard), *_worker_models)
+
+def split_shards(df, n_shards):
+    """
+    Split df into at most n_shards contiguous, order-preserving pieces
+    """
+    n_shards = max(1, min(n_shards, len(df)))
+    bounds = np.linspace(0, len(df), n_shards + 1).astype(int)
+    return [df.iloc[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+class ParallelScorer:
+    """
+    Pool of scoring processes with the models preloaded in every worker
+    Use as a context manager so the pool is shut down afterwards
+    model_store: root of a shared model store the workers attach to
+    instead of loading the models
+    """
+    def __init__(self, workers=None, model_dir=MODEL_DIR, threads_per_worker=1, model_store=None):
+        self.workers = workers or physical_cores()
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(model_dir, threads_per_worker, model_store),
+        )
+
+    def score(self, df, shards_per_worker=4):
+        """
+        Score raw applicant rows across the pool
+        Returns eligibility_class, approval_probability and predicted_emi
+        aligned to the index of df
+        """
+        if len(df) == 0:
+            return pd.DataFrame(columns=SCORE_COLUMNS, index=df.index)
+        shards = split_shards(df, self.workers * shards_per_worker)
+        # map() yields results in submission order, so the merge is ordered
+        return pd.concat(self._pool.map(_score_shard, shards))
+
+    def submit(self, df):
+        """
+        Score raw applicant rows as a single shard on one worker
+        Returns a Future resolving to the scores for df
+        """
+        return self._pool.submit(_score_shard, df)
+
+    def close(self):
+        self._pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def score_parallel(df, workers=None, model_dir=MODEL_DIR):
+    """
+    One-shot helper: start a pool, score df and shut the pool down
+    """
+    with ParallelScorer(workers, model_dir) as scorer:
+        return scorer.score(df)
@@ -0,0 +1,142 @@
+"""
+LRU/TTL cache of predictions keyed on canonicalized applicant inputs
+
+Keys are a SHA-256 of the 13 raw Data Input fields (canonicalized so
+30, 30.0 and numpy.int64(30) hash alike) plus the model version, so a
+prediction is only ever reused for the exact models that produced it.
+invalidate() is called whenever models are (re)loaded and drops every
+entry made with the previous ones. Callers pass the version that scored
+a result to put(): a result scored before an invalidate() but stored
+after it is dropped rather than filed under the new version.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from numbers import Number
+
+from utils.feature_schema import RAW_INPUT_COLUMNS
+
+DEFAULT_MAX_SIZE = 4096
+DEFAULT_TTL_SECONDS = 3600.0
+
+def _canonical_value(value):
+    if hasattr(value, 'item'):
+        # numpy scalar -> Python scalar
+        value = value.item()
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, Number):
+        value = float(value)
+        return int(value) if value.is_integer() else value
+    return value
+
+def canonical_record(record):
+    """
+    The raw input fields of record as a canonical list of (name, value) pairs
+    """
+    return [(name, _canonical_value(record[name])) for name in RAW_INPUT_COLUMNS]
+
+def record_key(record, version):
+    """
+    Stable hash of a raw applicant record and the model version
+    """
+    payload = json.dumps([version, canonical_record(record)], separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+class PredictionCache:
+    """
+    Thread-safe bounded LRU cache whose entries also expire after ttl_seconds
+    """
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, ttl_seconds=DEFAULT_TTL_SECONDS, version=None):
+        self.max_size = max_size
+        self.ttl = ttl_seconds
+        self.version = version
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale_puts = 0
+
+    def get(self, record, version=None):
+        """
+        Cached result for record, or None
+        version: model version the caller scores with, by default the
+        cache's; any other version than the cache's misses
+        """
+        version = self.version if version is None else version
+        key = record_key(record, version)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key) if version == self.version else None
+            if entry is not None and entry[0] <= now:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, record, result, version=None):
+        """
+        Store result for record
+        version: model version that scored result, by default the
+        cache's; results of any other version are dropped
+        """
+        version = self.version if version is None else version
+        key = record_key(record, version)
+        with self._lock:
+            if version != self.version:
+                # Scored by models invalidated since
+                self.stale_puts += 1
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, record, compute, version=None):
+        """
+        Cached result for record, calling compute(record) and storing it on a miss
+        version: as for get() and put()
+        """
+        version = self.version if version is None else version
+        result = self.get(record, version)
+        if result is None:
+            result = compute(record)
+            self.put(record, result, version)
+        return result
+
+    def invalidate(self, version=None):
+        """
+        Drop every entry, e.g. after the models were reloaded
+        version: model version new entries are keyed with
+        """
+        with self._lock:
+            self._entries.clear()
+            self.version = version
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'version': self.version,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'stale_puts': self.stale_puts,
+            }
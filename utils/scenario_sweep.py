@@ -0,0 +1,107 @@
+"""
+What-if affordability sweep for one applicant
+
+engineer_features fixes requested_amount at 12 months' salary,
+requested_tenure at 24 and emi_scenario at 1. sweep() instead scores a
+full grid of requested amounts x tenures x EMI scenarios: the applicant's
+engineered row is computed once, tiled into one feature matrix with the
+swept columns (and the features the dependency graph derives from them,
+e.g. loan_to_income_ratio) overwritten by broadcasting, scaled in one pass and scored in a single
+batched call to each model.
+"""
+import numpy as np
+import pandas as pd
+
+from utils.fast_path import derive_record
+from utils.feature_graph import FEATURE_GRAPH
+from utils.feature_schema import SCHEMA
+from utils.scoring import predict_scaled, scale_matrix
+
+# Multiples of the default request (12 months' salary)
+DEFAULT_AMOUNT_MULTIPLIERS = np.linspace(0.25, 3.0, 50)
+DEFAULT_TENURES = np.arange(6, 73, 6)
+DEFAULT_SCENARIOS = np.arange(1, 6)
+
+class SweepResult:
+    """
+    Scores over the grid; every array has shape
+    (len(amounts), len(tenures), len(scenarios))
+    """
+    def __init__(self, amounts, tenures, scenarios, eligibility_class, approval_probability, predicted_emi):
+        self.amounts = amounts
+        self.tenures = tenures
+        self.scenarios = scenarios
+        self.eligibility_class = eligibility_class
+        self.approval_probability = approval_probability
+        self.predicted_emi = predicted_emi
+
+    def to_frame(self, scenario=None):
+        """
+        Long-format DataFrame (one row per grid point) for charting
+        scenario: keep only this EMI scenario
+        """
+        a, t, s = np.meshgrid(self.amounts, self.tenures, self.scenarios, indexing='ij')
+        df = pd.DataFrame({
+            'requested_amount': a.ravel(),
+            'requested_tenure': t.ravel(),
+            'emi_scenario': s.ravel(),
+            'eligibility_class': self.eligibility_class.ravel(),
+            'approval_probability': self.approval_probability.ravel(),
+            'predicted_emi': self.predicted_emi.ravel(),
+        })
+        if scenario is not None:
+            df = df[df['emi_scenario'] == scenario]
+        return df
+
+def default_amounts(record):
+    base = record['monthly_salary'] * 12 or 12
+    return base * DEFAULT_AMOUNT_MULTIPLIERS
+
+def sweep_features(record, amounts, tenures, scenarios):
+    """
+    Unscaled (len(amounts) * len(tenures) * len(scenarios), n_features)
+    feature matrix for one raw applicant dict, amounts varying slowest
+    """
+    amounts = np.asarray(amounts, dtype=np.float64)
+    tenures = np.asarray(tenures, dtype=np.float64)
+    scenarios = np.asarray(scenarios, dtype=np.float64)
+    features = derive_record(record)
+    base = np.array([features[name] for name in SCHEMA.columns], dtype=np.float64)
+
+    X = np.tile(base, (len(amounts) * len(tenures) * len(scenarios), 1))
+    grid = X.reshape(len(amounts), len(tenures), len(scenarios), SCHEMA.n_features)
+    swept = {
+        'requested_amount': amounts[:, None, None],
+        'requested_tenure': tenures[None, :, None],
+        'emi_scenario': scenarios[None, None, :],
+    }
+    # The graph recomputes what depends on the swept features, as grids
+    for name in FEATURE_GRAPH.update(features, swept):
+        if name in SCHEMA.index:
+            grid[..., SCHEMA.index[name]] = features[name]
+    return X
+
+def sweep(record, classification_model, regression_model, scaler, amounts=None, tenures=None,
+          scenarios=None, predict_fn=None):
+    """
+    Score one applicant over a grid of loan amounts x tenures x EMI scenarios
+    predict_fn: replaces scoring.predict_scaled, e.g. FastPredictor.predict_scaled
+    Returns a SweepResult
+    """
+    amounts = default_amounts(record) if amounts is None else np.asarray(amounts)
+    tenures = DEFAULT_TENURES if tenures is None else np.asarray(tenures)
+    scenarios = DEFAULT_SCENARIOS if scenarios is None else np.asarray(scenarios)
+
+    X_scaled = scale_matrix(sweep_features(record, amounts, tenures, scenarios), scaler)
+    if predict_fn is not None:
+        classes, proba, emi = predict_fn(X_scaled)
+    else:
+        classes, proba, emi = predict_scaled(X_scaled, classification_model, regression_model)
+
+    shape = (len(amounts), len(tenures), len(scenarios))
+    return SweepResult(
+        amounts, tenures, scenarios,
+        np.asarray(classes).reshape(shape),
+        proba[:, 1].reshape(shape),
+        np.asarray(emi).reshape(shape),
+    )
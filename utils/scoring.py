@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+from utils.feature_engineering import engineer_features, prepare_features_for_prediction
+from utils.feature_schema import RAW_INPUT_COLUMNS, SCHEMA
+from utils.instrumentation import stage, timed
+
+SCORE_COLUMNS = ['eligibility_class', 'approval_probability', 'predicted_emi']
+
+@timed('scale')
+def scale_features(X, scaler):
+    """
+    Apply the scaler to a prepared feature frame
+    Supports the same scaler formats as the Prediction page: objects with
+    transform, a (2, n_features) mean/std array and a {'mean', 'std'} dict
+    """
+    if hasattr(scaler, 'transform'):
+        return scaler.transform(X)
+    X_array = X.values if hasattr(X, 'values') else np.asarray(X)
+    if isinstance(scaler, np.ndarray) and scaler.shape[0] == 2:
+        return (X_array - scaler[0]) / scaler[1]
+    if isinstance(scaler, dict):
+        return (X_array - scaler['mean']) / scaler['std']
+    raise ValueError(f"Unknown scaler type: {type(scaler)}")
+
+@timed('scale')
+def scale_matrix(X, scaler):
+    """
+    Apply the scaler to a float matrix already in schema column order
+    StandardScaler statistics are applied directly, with the same
+    operations as its transform; other scalers go through scale_features
+    """
+    if hasattr(scaler, 'mean_') and hasattr(scaler, 'scale_'):
+        X = np.array(X, dtype=np.float64)
+        if getattr(scaler, 'with_mean', True):
+            X -= scaler.mean_
+        if getattr(scaler, 'with_std', True):
+            X /= scaler.scale_
+        return X
+    return scale_features(pd.DataFrame(X, columns=SCHEMA.columns), scaler)
+
+def predict_scaled(X_scaled, classification_model, regression_model):
+    """
+    Run both models on an already scaled feature matrix in schema order
+    The regression input is sliced from it, with the predicted class in
+    the emi_eligibility slot
+    Returns (classes, probabilities, emi) arrays with one entry per row
+    """
+    X_scaled = np.asarray(X_scaled)
+    with stage('predict_classification'):
+        proba = classification_model.predict_proba(X_scaled)
+        # predict() is argmax over predict_proba; derive it instead of a second pass
+        classes = np.asarray(classification_model.classes_)[proba.argmax(axis=1)]
+    with stage('predict_regression'):
+        emi = regression_model.predict(SCHEMA.regression_input(X_scaled, classes))
+    return classes, proba, emi
+
+def score_features(df, classification_model, regression_model, scaler, monitor=None):
+    """
+    Score engineered applicant rows
+    Returns a DataFrame with eligibility_class, approval_probability and
+    predicted_emi aligned to the index of df
+    monitor: a drift.DriftMonitor the scored rows are observed by
+    """
+    X_scaled = scale_features(prepare_features_for_prediction(df), scaler)
+    classes, proba, emi = predict_scaled(X_scaled, classification_model, regression_model)
+    if monitor is not None:
+        monitor.observe(X_scaled, classes, proba[:, 1], emi)
+    return pd.DataFrame({
+        'eligibility_class': classes,
+        'approval_probability': proba[:, 1],
+        'predicted_emi': emi,
+    }, index=df.index)
+
+def check_records(records):
+    """
+    Raise ValueError naming the first raw applicant dict with missing fields
+    """
+    for i, record in enumerate(records):
+        missing = [name for name in RAW_INPUT_COLUMNS if name not in record]
+        if missing:
+            raise ValueError(f"Record {i} is missing fields: {', '.join(missing)}")
+
+def result_dicts(classes, proba, emi):
+    """
+    One plain-Python result dict per row, ready for JSON, from the
+    (classes, probabilities, emi) of predict_scaled
+    """
+    return [
+        {'eligibility_class': int(c), 'approval_probability': float(p), 'predicted_emi': float(e)}
+        for c, p, e in zip(np.asarray(classes).tolist(), np.asarray(proba)[:, 1].tolist(), np.asarray(emi).tolist())
+    ]
+
+def scale_records(records, scaler):
+    """
+    Scaled feature matrix of raw applicant dicts, through engineer_features
+    Raises ValueError if a record is missing a field
+    """
+    check_records(records)
+    df = pd.DataFrame.from_records(records, columns=RAW_INPUT_COLUMNS)
+    return scale_features(prepare_features_for_prediction(engineer_features(df)), scaler)
+
+def score_records(records, classification_model, regression_model, scaler, monitor=None):
+    """
+    Score a list of raw applicant dicts holding the 13 Data Input fields
+    Returns one plain-Python result dict per record, ready for JSON
+    Raises ValueError if a record is missing a field
+    """
+    X_scaled = scale_records(records, scaler)
+    classes, proba, emi = predict_scaled(X_scaled, classification_model, regression_model)
+    if monitor is not None:
+        monitor.observe(X_scaled, classes, proba[:, 1], emi)
+    return result_dicts(classes, proba, emi)
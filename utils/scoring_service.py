@@ -0,0 +1,520 @@
+"""
+Asyncio HTTP scoring service
+
+Usage: python -m utils.scoring_service [--host HOST] [--port PORT] [--workers N]
+                                       [--max-batch-size N] [--batch-window-ms MS]
+                                       [--cache-size N] [--scorer teacher|flat|surrogate]
+                                       [--model-store [ROOT]] [--audit-log PATH] [--risk-bands LOW,HIGH]
+                                       [--drift-report PATH] [--drift-interval S]
+                                       [--instrument] [--track-allocations] [--allow-profile]
+
+Endpoints (JSON in, JSON out):
+  POST /score        one applicant object with the 13 Data Input fields
+  POST /score/batch  {"applicants": [...]} or a bare list of applicants
+  GET  /health       liveness check
+  GET  /stats        micro-batcher, prediction cache and per-stage timing counters
+  GET  /metrics      per-stage timing histograms in Prometheus text format
+  GET  /drift        drift report of everything scored since startup
+
+Applicants are validated first (utils.validation): /score answers 400
+naming the bad fields, /score/batch returns {"error", "error_code",
+"error_fields"} in place of the results of the invalid ones. Every result
+carries calibrated_probability and risk_band (utils.calibration).
+?explain=1 adds per-feature attributions from the original models
+(utils.explain) under "explanation" or "explanations"; ?profile=1 adds
+the hottest stack frames under "profile" and answers 403 unless
+--allow-profile (or EMI_PROFILE=1) is given.
+
+The models are loaded once at startup, or with --model-store read from
+the shared model store (utils.model_store), whose newly published
+versions are served without a restart. Scoring runs off the event loop:
+concurrent /score requests are micro-batched and answered from a
+PredictionCache when repeated. --audit-log records every applicant the
+models score (utils.audit_log) and --drift-report exports the drift of
+the scored traffic (utils.drift); cached answers are neither logged nor
+observed again.
+Only the standard library is used for the HTTP layer.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from http import HTTPStatus
+
+from utils import instrumentation
+from utils.audit_log import DEFAULT_RETENTION_DAYS, RETENTION_ENV, AuditLog
+from utils.calibration import RiskBands, default_risk_bands, load_policy
+from utils.distill import load_surrogate
+from utils.drift import DEFAULT_REPORT_INTERVAL, build_monitor
+from utils.explain import ExplanationWorker, explained_with
+from utils.fast_path import build_fast_predictor
+from utils.micro_batcher import DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_WAIT_MS, MicroBatcher
+from utils.model_files import MODEL_DIR, SCORERS, default_scorer, load_compiled_trees, load_versioned_models
+from utils.model_store import STORE_SCORERS, ModelStore, default_root
+from utils.prediction_cache import DEFAULT_MAX_SIZE, PredictionCache
+from utils.scoring import check_records, predict_scaled, result_dicts, scale_records
+from utils.tree_ensemble import small_batch_predict_fn
+from utils.validation import validate_records
+
+MAX_BODY_BYTES = 10 * 1024 * 1024
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+class ScoringService:
+    """
+    HTTP front end over the scoring pipeline
+    models: (classification_model, regression_model, scaler); loaded from
+    the repository root when omitted
+    batch_window_ms: how long /score requests wait to be batched together;
+    0 scores each request on its own
+    cache_size: /score results kept in the prediction cache; 0 disables it
+    scorer: 'teacher', 'flat' or 'surrogate'; the others need the fast
+    path (and the surrogate a model version) and fall back to 'teacher'
+    store: a ModelStore to score with instead of models; its scorer
+    replaces scorer
+    audit: an AuditLog every scored applicant is recorded to
+    bands: RiskBands of the results; EMI_RISK_BANDS or 40% / 60% by default
+    drift_report: JSON file the drift report is exported to every
+    drift_interval seconds; the scored traffic is monitored regardless
+    allow_profile: whether ?profile=1 may profile a request; EMI_PROFILE
+    by default
+    """
+    def __init__(self, models=None, workers=4, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                 batch_window_ms=DEFAULT_MAX_WAIT_MS, cache_size=DEFAULT_MAX_SIZE, version=None,
+                 scorer='teacher', store=None, audit=None, bands=None, drift_report=None,
+                 drift_interval=DEFAULT_REPORT_INTERVAL, allow_profile=None):
+        self.store = store
+        self.allow_profile = instrumentation.profiling_allowed() if allow_profile is None else allow_profile
+        self.audit = audit
+        self.bands = bands or default_risk_bands()
+        self.drift_report = drift_report
+        self.drift_interval = drift_interval
+        # Serialises switching to a newly published store version
+        self._swap_lock = threading.Lock()
+        if store is not None:
+            self.models = self.fast = self.predict_fn = None
+            self.scorer = store.scorer
+            shared = store.get()
+            version = shared.version
+        else:
+            if models is None:
+                models, version = load_versioned_models()
+            self.models = models
+            self.fast = build_fast_predictor(*self.models)
+            self.predict_fn = self._scorer_predict_fn(scorer, version)
+            self.scorer = scorer if self.predict_fn is not None else 'teacher'
+        # Results of other scorers must not be mistaken for the originals'
+        self.version = version if self.scorer == 'teacher' else f"{version}:{self.scorer}"
+        # Fitted on the originals' probabilities, which every scorer reproduces
+        self.policy = load_policy(MODEL_DIR, version, self.bands)
+        self.monitor = self._build_monitor(shared if store is not None else self.fast, version)
+        self.cache = PredictionCache(cache_size, version=self.version) if cache_size > 0 else None
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.explainer = None
+        self.batcher = None
+        if batch_window_ms > 0:
+            self.batcher = MicroBatcher(self._score_micro_batch, max_batch_size, batch_window_ms)
+        self.server = None
+
+    async def start(self, host='127.0.0.1', port=8000):
+        self.server = await asyncio.start_server(self._handle_connection, host, port)
+        return self.server
+
+    async def serve_forever(self, host='127.0.0.1', port=8000):
+        server = await self.start(host, port)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+        if self.batcher is not None:
+            self.batcher.close()
+        if self.explainer is not None:
+            self.explainer.close()
+        self.executor.shutdown(wait=False)
+        if self.audit is not None:
+            self.audit.close()
+        if self.monitor is not None:
+            self.monitor.close()
+
+    def model_version(self):
+        """
+        Version of the models answering now, suffixed with the scorer when
+        it is not the originals
+        """
+        if self.store is not None:
+            return self._shared_version(self.store.get())
+        return self.version
+
+    def _shared_version(self, models):
+        return models.version if self.scorer == 'teacher' else f"{models.version}:{self.scorer}"
+
+    def _scorer_predict_fn(self, scorer, version):
+        if scorer == 'teacher' or self.fast is None:
+            return None
+        if scorer == 'surrogate':
+            surrogate = load_surrogate(MODEL_DIR, version) if version is not None else None
+            return surrogate.predict_scaled if surrogate is not None else None
+        trees = load_compiled_trees(self.models, version)
+        return small_batch_predict_fn(trees, self.fast.predict_scaled) if trees is not None else None
+
+    def _build_monitor(self, source, version):
+        # Needs the scaler statistics as arrays, which only the fast path and the store hold
+        if source is None:
+            return None
+        return build_monitor(source, MODEL_DIR, version, self.drift_report, self.drift_interval)
+
+    def _use_version(self, models):
+        """
+        (decision policy, drift monitor) of the store version models,
+        replacing those of the previous version, and the cached results,
+        when it is newly published
+        """
+        with self._swap_lock:
+            if self.policy.version != models.version:
+                # Its own calibration, and drift against its own scaler and reference
+                self.policy = load_policy(MODEL_DIR, models.version, self.bands)
+                previous, self.monitor = self.monitor, self._build_monitor(models, models.version)
+                if self.cache is not None:
+                    self.cache.invalidate(self._shared_version(models))
+                if previous is not None:
+                    previous.close()
+            return self.policy, self.monitor
+
+    def _score_batch(self, records, source='/score'):
+        """
+        (model version, results) of scoring records
+        """
+        start = time.perf_counter()
+        policy, monitor, version = self.policy, self.monitor, self.version
+        if self.store is not None:
+            # One version for the whole batch, even if a new one is published meanwhile
+            models = self.store.get()
+            policy, monitor = self._use_version(models)
+            version = self._shared_version(models)
+            check_records(records)
+            X = models.scaled_rows(records)
+            classes, proba, emi = models.predict_scaled(X)
+        elif self.fast is not None:
+            check_records(records)
+            X = self.fast.scaled_rows(records)
+            classes, proba, emi = (self.predict_fn or self.fast.predict_scaled)(X)
+        else:
+            X = scale_records(records, self.models[2])
+            classes, proba, emi = predict_scaled(X, *self.models[:2])
+        if monitor is not None:
+            monitor.observe(X, classes, proba[:, 1], emi)
+        # One vectorized pass over the whole batch
+        results = policy.decide_records(result_dicts(classes, proba, emi))
+        if self.audit is not None:
+            # Only what the models scored: cache hits never get here
+            self.audit.record(records, results, X, version, (time.perf_counter() - start) * 1000, source=source)
+        return version, results
+
+    def _score_micro_batch(self, records):
+        # Each /score request learns the version that scored it, for the prediction cache
+        version, results = self._score_batch(records)
+        return [(version, result) for result in results]
+
+    async def score(self, records):
+        loop = asyncio.get_running_loop()
+        _, results = await loop.run_in_executor(self.executor, self._score_batch, records, '/score/batch')
+        return results
+
+    async def score_one(self, record):
+        """
+        Result for one applicant, from the prediction cache when it holds it
+        """
+        check_records([record])
+        if self.cache is not None:
+            # Misses while a newly published version has not scored yet; scoring invalidates the rest
+            cached = self.cache.get(record, self.model_version())
+            if cached is not None:
+                return cached
+        if self.batcher is None:
+            loop = asyncio.get_running_loop()
+            version, results = await loop.run_in_executor(self.executor, self._score_batch, [record])
+            result = results[0]
+        else:
+            version, result = await asyncio.wrap_future(self.batcher.submit(record))
+        if self.cache is not None:
+            # Dropped when a newer version was published while this one scored
+            self.cache.put(record, result, version)
+        return result
+
+    async def explain(self, records, results):
+        """
+        Attributions for scored records, batched on the explanation worker,
+        each saying whether it describes the served model (explained_with)
+        """
+        loop = asyncio.get_running_loop()
+        if self.store is not None:
+            models = self.store.get()
+            X = await loop.run_in_executor(self.executor, models.scaled_rows, records)
+            models, version = models.models, models.version
+        else:
+            # The fast path's scaling when it is built, else the pandas one
+            scale = self.fast.scaled_rows if self.fast is not None else partial(scale_records, scaler=self.models[2])
+            X = await loop.run_in_executor(self.executor, scale, records)
+            models, version = self.models, self.version
+        with self._swap_lock:
+            retired = None
+            if self.explainer is not None and self.explainer.cache.version != version:
+                # A newly published store version: explain with its models from now on
+                retired, self.explainer = self.explainer, None
+            if self.explainer is None:
+                try:
+                    self.explainer = ExplanationWorker(*models[:2], version=version)
+                except ValueError as e:
+                    raise HTTPError(HTTPStatus.BAD_REQUEST, f"Explanations unavailable: {e}")
+            # Submitted under the lock, so a retired worker gets nothing after it is replaced
+            futures = [self.explainer.submit(record, row, result['eligibility_class'])
+                       for record, row, result in zip(records, X, results)]
+        if retired is not None:
+            # Finishes what was already queued on it
+            loop.run_in_executor(self.executor, retired.close)
+        explanations = await asyncio.gather(*(asyncio.wrap_future(future) for future in futures))
+        # Copies: the worker caches the explanations it returns
+        return [dict(explanation, explained_with=explained_with(self.scorer)) for explanation in explanations]
+
+    async def dispatch(self, method, path, body):
+        """
+        Route one request; returns (status, JSON-serialisable payload)
+        """
+        path, _, query = path.partition('?')
+        path = path.rstrip('/') or '/'
+        if path == '/health':
+            if method != 'GET':
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "Use GET")
+            return HTTPStatus.OK, {'status': 'ok'}
+        if path == '/stats':
+            if method != 'GET':
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "Use GET")
+            return HTTPStatus.OK, {
+                'scorer': self.scorer,
+                'decision_policy': self.policy.describe(),
+                'batcher': self.batcher.stats() if self.batcher else None,
+                'cache': self.cache.stats() if self.cache else None,
+                'stages': instrumentation.REGISTRY.to_dict(),
+                'model_store': self.store.stats() if self.store else None,
+                'audit_log': self.audit.stats() if self.audit else None,
+                'explainer': self.explainer.stats() if self.explainer else None,
+                'drift': self.monitor.stats() if self.monitor else None,
+            }
+        if path == '/drift':
+            if method != 'GET':
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "Use GET")
+            if self.monitor is None:
+                raise HTTPError(HTTPStatus.NOT_FOUND, "Drift monitoring needs the fast path or a model store")
+            loop = asyncio.get_running_loop()
+            return HTTPStatus.OK, await loop.run_in_executor(self.executor, self.monitor.report)
+        if path == '/metrics':
+            if method != 'GET':
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "Use GET")
+            return HTTPStatus.OK, instrumentation.REGISTRY.to_prometheus()
+        if path not in ('/score', '/score/batch'):
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"Unknown path: {path}")
+        if method != 'POST':
+            raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "Use POST")
+
+        try:
+            payload = json.loads(body)
+        except ValueError as e:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"Invalid JSON: {e}")
+
+        if path == '/score':
+            if not isinstance(payload, dict):
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "Expected a JSON object")
+            records = [payload]
+        else:
+            records = payload.get('applicants') if isinstance(payload, dict) else payload
+            if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "Expected a list of applicant objects")
+            if not records:
+                return HTTPStatus.OK, {'results': []}
+
+        params = query.split('&')
+        profiler = None
+        if 'profile=1' in params:
+            if not self.allow_profile:
+                raise HTTPError(HTTPStatus.FORBIDDEN, "Profiling is disabled; start with --allow-profile")
+            profiler = instrumentation.SamplingProfiler().start()
+        start = time.perf_counter()
+        try:
+            validation = validate_records(records)
+            if path == '/score' and validation.n_rejected:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, f"Invalid applicant: {validation.messages()[0]}")
+            # Only the valid applicants, coerced, go on to be scored
+            records = validation.valid_records()
+            if path == '/score':
+                results = [await self.score_one(records[0])]
+            else:
+                results = await self.score(records) if records else []
+        except (ValueError, TypeError, KeyError) as e:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, str(e))
+        finally:
+            if profiler is not None:
+                profiler.stop()
+        elapsed = time.perf_counter() - start
+        if instrumentation.is_enabled():
+            # Timed by hand: a stage() block would span awaits of other requests
+            instrumentation.REGISTRY.observe(f"http{path.replace('/', '_')}", elapsed)
+        explanations = None
+        if 'explain=1' in params and records:
+            # Outside the timed and audited scoring latency
+            explanations = await self.explain(records, results)
+        if path == '/score':
+            response = results[0]
+            if explanations is not None:
+                response = dict(response, explanation=explanations[0])
+        else:
+            response = {'results': _merge_rejects(validation, results)}
+            if explanations is not None:
+                response['explanations'] = _merge_rejects(validation, explanations)
+        if profiler is not None:
+            response = dict(response, profile={
+                'samples': profiler.samples,
+                'top': [{'frame': frame, 'samples': count} for frame, count in profiler.top()],
+            })
+        return HTTPStatus.OK, response
+
+    async def _read_request(self, reader):
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        try:
+            method, path, version = request_line.decode('latin-1').split()
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Malformed request line")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request body too large")
+        body = await reader.readexactly(length) if length else b''
+        keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+        return method, path, body, keep_alive
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                keep_alive = False
+                try:
+                    request = await self._read_request(reader)
+                    if request is None:
+                        break
+                    method, path, body, keep_alive = request
+                    status, payload = await self.dispatch(method, path, body)
+                except HTTPError as e:
+                    status, payload = e.status, {'error': e.message}
+                except Exception as e:
+                    status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': f"{type(e).__name__}: {e}"}
+                _write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+def _merge_rejects(validation, values):
+    # values hold one entry per valid applicant; rejected ones get their errors
+    valid = iter(values)
+    messages = iter(validation.messages())
+    return [
+        next(valid) if ok else {'error': next(messages), 'error_code': code, 'error_fields': fields}
+        for ok, code, fields in zip(validation.valid.tolist(), validation.error_code.tolist(),
+                                    validation.error_fields.tolist())
+    ]
+
+def _write_response(writer, status, payload, keep_alive):
+    # Strings are plain text (the /metrics exposition), everything else JSON
+    if isinstance(payload, str):
+        body, content_type = payload.encode(), 'text/plain; version=0.0.4'
+    else:
+        body, content_type = json.dumps(payload).encode(), 'application/json'
+    head = (
+        f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    writer.write(head.encode('latin-1') + body)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve EMI predictions over HTTP")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=4, help="inference threads (default 4)")
+    parser.add_argument('--max-batch-size', type=int, default=DEFAULT_MAX_BATCH_SIZE,
+                        help=f"largest micro-batch of /score requests (default {DEFAULT_MAX_BATCH_SIZE})")
+    parser.add_argument('--batch-window-ms', type=float, default=DEFAULT_MAX_WAIT_MS,
+                        help=f"micro-batching window, 0 disables it (default {DEFAULT_MAX_WAIT_MS})")
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_MAX_SIZE,
+                        help=f"cached /score results, 0 disables caching (default {DEFAULT_MAX_SIZE})")
+    parser.add_argument('--scorer', choices=SCORERS, default=default_scorer(),
+                        help="models to serve (default teacher, or EMI_SCORER)")
+    parser.add_argument('--model-store', nargs='?', const=default_root(), metavar='ROOT',
+                        help=f"score with the models published to a shared model store (default {default_root()}) "
+                             "instead of loading them; --scorer teacher or flat")
+    parser.add_argument('--audit-log', metavar='PATH', help="SQLite prediction audit log to append to")
+    parser.add_argument('--audit-retention-days', type=float, metavar='DAYS',
+                        help=f"days of audit log kept (default {DEFAULT_RETENTION_DAYS}, or {RETENTION_ENV})")
+    parser.add_argument('--risk-bands', type=RiskBands.parse, metavar='LOW,HIGH',
+                        help="approval probabilities below LOW are Rejected, above HIGH Approved "
+                             "(default 0.4,0.6, or EMI_RISK_BANDS)")
+    parser.add_argument('--drift-report', metavar='PATH', help="JSON file to export the drift report to")
+    parser.add_argument('--drift-interval', type=float, default=DEFAULT_REPORT_INTERVAL, metavar='S',
+                        help=f"seconds between drift report exports (default {DEFAULT_REPORT_INTERVAL:g})")
+    parser.add_argument('--instrument', action='store_true',
+                        help="record per-stage timings for /stats and /metrics (also EMI_INSTRUMENT=1)")
+    parser.add_argument('--track-allocations', action='store_true',
+                        help="with --instrument, also record per-stage allocations (slow)")
+    parser.add_argument('--allow-profile', action='store_true', default=None,
+                        help="let requests sample their stacks with ?profile=1 (also EMI_PROFILE=1)")
+    args = parser.parse_args(argv)
+    if args.model_store and args.scorer not in STORE_SCORERS:
+        parser.error(f"--model-store serves the {' or '.join(STORE_SCORERS)} scorer, not {args.scorer}")
+
+    if args.instrument or args.track_allocations:
+        instrumentation.enable(track_allocations=args.track_allocations)
+
+    store = ModelStore(args.model_store, scorer=args.scorer) if args.model_store else None
+    service = ScoringService(workers=args.workers, max_batch_size=args.max_batch_size,
+                             batch_window_ms=args.batch_window_ms, cache_size=args.cache_size,
+                             scorer=args.scorer, store=store,
+                             audit=AuditLog(args.audit_log, retention_days=args.audit_retention_days)
+                             if args.audit_log else None, bands=args.risk_bands,
+                             drift_report=args.drift_report, drift_interval=args.drift_interval,
+                             allow_profile=args.allow_profile)
+    print(f"Serving {service.scorer} models on http://{args.host}:{args.port}", file=sys.stderr)
+    try:
+        asyncio.run(service.serve_forever(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
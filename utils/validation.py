@@ -0,0 +1,205 @@
+"""
+Vectorized validation and coercion of raw applicant input
+
+Only the Data Input page's widgets bound what the models see. Batch files
+and API requests go straight into engineer_features, which maps unknown
+categories to the all-zero baseline one-hot and divides by a patched
+salary. validate_frame() holds such input to the page's domains
+(feature_schema.NUMERIC_DOMAINS, CATEGORY_DOMAINS and INTEGER_FIELDS)
+one whole column at a time:
+  - numeric fields are coerced with pd.to_numeric and checked for
+    missing, non-numeric, fractional and out-of-range values with NumPy
+    masks
+  - categorical fields are factorized; only the distinct values are
+    matched against the choices (ignoring case and surrounding spaces),
+    and the result is broadcast back through the codes
+No Python runs per row, not even to word the messages of rejected rows.
+
+Every field of every row gets one of the error codes below. A row's
+error_code ORs them, and error_fields has one bit per RAW_INPUT_COLUMNS
+position. Valid rows come back coerced to canonical values and dtypes,
+so they can be scored while the rejected ones are reported.
+"""
+import numpy as np
+import pandas as pd
+
+from utils.feature_schema import CATEGORY_DOMAINS, INTEGER_FIELDS, NUMERIC_DOMAINS, RAW_INPUT_COLUMNS
+
+# Per-field error codes
+MISSING = 1
+NOT_A_NUMBER = 2
+NOT_AN_INTEGER = 4
+OUT_OF_RANGE = 8
+UNKNOWN_CATEGORY = 16
+ERROR_NAMES = {
+    MISSING: 'missing',
+    NOT_A_NUMBER: 'not a number',
+    NOT_AN_INTEGER: 'not a whole number',
+    OUT_OF_RANGE: 'out of range',
+    UNKNOWN_CATEGORY: 'unknown category',
+}
+REJECT_COLUMNS = ['error_code', 'error_fields', 'error']
+
+_FIELD_BITS = 1 << np.arange(len(RAW_INPUT_COLUMNS), dtype=np.int64)
+
+def _normalize(value):
+    return str(value).strip().casefold()
+
+def _check_number(values, low, high, integer, choices=None):
+    """
+    (coerced array, error codes) of one numeric column
+    """
+    n = len(values)
+    if pd.api.types.is_integer_dtype(values.dtype) and not values.hasnans:
+        # Already clean whole numbers: only the range can be wrong
+        numbers = values.to_numpy(dtype=np.int64)
+        codes = np.zeros(n, dtype=np.uint8)
+    else:
+        missing = values.isna().to_numpy()
+        numbers = pd.to_numeric(values, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+        codes = np.where(missing, MISSING, np.where(np.isfinite(numbers), 0, NOT_A_NUMBER)).astype(np.uint8)
+        if integer or choices is not None:
+            codes[(codes == 0) & (numbers != np.trunc(numbers))] = NOT_AN_INTEGER
+    if choices is not None:
+        codes[(codes == 0) & ~np.isin(numbers, choices)] = UNKNOWN_CATEGORY
+    else:
+        outside = np.zeros(n, dtype=bool)
+        if low is not None:
+            outside |= numbers < low
+        if high is not None:
+            outside |= numbers > high
+        codes[(codes == 0) & outside] = OUT_OF_RANGE
+    if numbers.dtype.kind == 'f':
+        # Rejected entries hold a placeholder so the column stays numeric
+        numbers = np.where(codes == 0, numbers, low or 0)
+        if integer or choices is not None:
+            numbers = numbers.astype(np.int64)
+    return numbers, codes
+
+def _check_category(values, choices):
+    """
+    (canonical object array, error codes) of one categorical column
+    """
+    # Hashing the column once; only its distinct values are looked at in Python
+    try:
+        positions, uniques = pd.factorize(values, use_na_sentinel=True)
+    except TypeError:
+        # Unhashable entries (JSON lists or objects) can only be unknown categories
+        positions, uniques = pd.factorize(values.astype(str).where(values.notna()), use_na_sentinel=True)
+    canonical = {_normalize(choice): i for i, choice in enumerate(choices)}
+    # The extra last entry is what the NA sentinel (-1) indexes
+    lookup = np.array([canonical.get(_normalize(value), -1) for value in uniques] + [-1], dtype=np.int64)
+    index = lookup[positions]
+    codes = np.where(positions < 0, MISSING, np.where(index < 0, UNKNOWN_CATEGORY, 0)).astype(np.uint8)
+    return np.asarray(choices, dtype=object)[np.maximum(index, 0)], codes
+
+class ValidationResult:
+    """
+    Outcome of validating n applicant rows
+    columns: the coerced raw input columns, placeholders where rejected
+    field_errors: (n, len(RAW_INPUT_COLUMNS)) uint8 error codes
+    """
+    def __init__(self, source, columns, field_errors):
+        self.source = source
+        self.index = source.index
+        self.columns = columns
+        self.field_errors = field_errors
+        self.error_code = np.bitwise_or.reduce(field_errors, axis=1) if len(field_errors) \
+            else np.zeros(0, dtype=np.uint8)
+        self.error_fields = (field_errors != 0) @ _FIELD_BITS
+        self.valid = self.error_code == 0
+        self.n_valid = int(self.valid.sum())
+        self.n_rejected = len(self.valid) - self.n_valid
+
+    def valid_frame(self):
+        """
+        Coerced raw input columns of the valid rows, keeping their index
+        """
+        return pd.DataFrame({name: values[self.valid] for name, values in self.columns.items()},
+                            index=self.index[self.valid])
+
+    def valid_records(self):
+        """
+        Coerced valid rows as dicts of plain Python values
+        """
+        columns = {name: values[self.valid].tolist() for name, values in self.columns.items()}
+        return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+    def messages(self, positions=None):
+        """
+        Human-readable reasons the rows at positions (default: every
+        rejected row) were rejected, as an object array; '' for valid rows
+        Worded per field and error code, not per row
+        """
+        positions = np.flatnonzero(~self.valid) if positions is None else np.asarray(positions)
+        errors = self.field_errors[positions]
+        out = np.full(len(positions), '', dtype=object)
+        for j in np.flatnonzero(errors.any(axis=0)):
+            name = RAW_INPUT_COLUMNS[j]
+            for code in np.unique(errors[:, j]).tolist():
+                if code == 0:
+                    continue
+                rows = np.flatnonzero(errors[:, j] == code)
+                reason = f"{name}: {ERROR_NAMES[code]}"
+                if code != MISSING:
+                    if code == UNKNOWN_CATEGORY:
+                        expected = f", expected one of {', '.join(map(str, CATEGORY_DOMAINS[name]))})"
+                    elif code == OUT_OF_RANGE:
+                        low, high = NUMERIC_DOMAINS[name]
+                        expected = f", expected {low} to {'any' if high is None else high})"
+                    else:
+                        expected = ")"
+                    values = self.source[name].iloc[positions[rows]].astype(str).to_numpy(dtype=object)
+                    reason = f"{reason} (" + values + expected
+                out[rows] = np.where(out[rows] == '', reason, out[rows] + '; ' + reason)
+        return out
+
+    def rejects_frame(self):
+        """
+        The rejected source rows with REJECT_COLUMNS appended
+        """
+        positions = np.flatnonzero(~self.valid)
+        return self.source.iloc[positions].assign(
+            error_code=self.error_code[positions],
+            error_fields=self.error_fields[positions],
+            error=self.messages(positions),
+        )
+
+    def summary(self):
+        """
+        {field: {error name: rows}} over the rejected rows
+        """
+        summary = {}
+        for j, name in enumerate(RAW_INPUT_COLUMNS):
+            counts = np.bincount(self.field_errors[:, j], minlength=UNKNOWN_CATEGORY + 1)
+            errors = {ERROR_NAMES[code]: int(counts[code]) for code in ERROR_NAMES if counts[code]}
+            if errors:
+                summary[name] = errors
+        return summary
+
+def validate_frame(df):
+    """
+    Validate and coerce the raw input columns of a DataFrame
+    Other columns are ignored; absent input columns are missing in every row
+    """
+    n = len(df)
+    columns = {}
+    field_errors = np.zeros((n, len(RAW_INPUT_COLUMNS)), dtype=np.uint8)
+    for j, name in enumerate(RAW_INPUT_COLUMNS):
+        choices = CATEGORY_DOMAINS.get(name)
+        if name not in df.columns:
+            values = pd.Series(np.full(n, np.nan), index=df.index)
+        else:
+            values = df[name]
+        if choices is not None and isinstance(choices[0], str):
+            columns[name], field_errors[:, j] = _check_category(values, choices)
+        else:
+            low, high = NUMERIC_DOMAINS.get(name, (None, None))
+            columns[name], field_errors[:, j] = _check_number(values, low, high, name in INTEGER_FIELDS, choices)
+    return ValidationResult(df, columns, field_errors)
+
+def validate_records(records):
+    """
+    validate_frame for a list of raw applicant dicts
+    """
+    return validate_frame(pd.DataFrame.from_records(records, columns=list(RAW_INPUT_COLUMNS)))
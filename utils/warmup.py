@@ -0,0 +1,111 @@
+"""
+Background warm-up of the heavy imports and the models
+
+The landing, About and Data Input pages only need streamlit (and numpy).
+pandas, altair, scikit-learn, XGBoost and the models are first imported
+and loaded by the Prediction page. That keeps the first paint of every
+other page fast (fast start), but left alone it makes the first
+prediction pay for all of them.
+
+The landing page (app.py) calls start_warmup() as its last statement,
+after it has been painted. It imports the heavy modules, loads the models
+through the cached loaders and runs one prediction on a daemon thread.
+The first visit to the Prediction page then usually finds everything
+ready, and otherwise waits on the loaders' cache instead of loading
+twice. It runs once per process. EMI_WARMUP=off disables it, so nothing
+heavy is loaded before the Prediction page asks.
+
+The cached loaders are Streamlit calls, so the thread carries the script
+run context of the session that started it (add_script_run_ctx), as
+Streamlit requires of threads it did not create.
+"""
+import importlib
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ENV = 'EMI_WARMUP'
+WARMUP_MODES = ('background', 'off')
+# In dependency order, so each import's time is its own
+WARMUP_MODULES = ('pandas', 'altair', 'sklearn.preprocessing', 'xgboost', 'utils.model_loader')
+
+_lock = threading.Lock()
+_thread = None
+_timings = {}
+_error = None
+
+def warmup_mode():
+    mode = os.environ.get(WARMUP_ENV, 'background')
+    if mode not in WARMUP_MODES:
+        raise ValueError(f"{WARMUP_ENV} must be one of {', '.join(WARMUP_MODES)}, not {mode!r}")
+    return mode
+
+def _timed(name, fn):
+    start = time.perf_counter()
+    fn()
+    _timings[name] = time.perf_counter() - start
+
+def _warm():
+    global _error
+    try:
+        for name in WARMUP_MODULES:
+            _timed(f"import {name}", lambda: importlib.import_module(name))
+        from utils.fast_path import TEMPLATE_RECORD
+        from utils.model_loader import (load_decision_policy, load_drift_monitor, load_fast_predictor, load_models,
+                                        load_prediction_batcher)
+        _timed('load_models', load_models)
+        _timed('load_fast_predictor', load_fast_predictor)
+        _timed('load_prediction_batcher', load_prediction_batcher)
+        _timed('load_decision_policy', load_decision_policy)
+        _timed('load_drift_monitor', load_drift_monitor)
+        fast = load_fast_predictor()
+        if fast is not None:
+            # The first call into the boosters allocates their prediction buffers
+            _timed('first_prediction', lambda: fast.predict_one(TEMPLATE_RECORD))
+    except Exception as e:
+        # The Prediction page loads and reports the same failure itself
+        _error = e
+        logger.warning("Warm-up failed: %s", e)
+        return
+    logger.info("Warm-up done in %.2f s (%s)", sum(_timings.values()),
+                ', '.join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in _timings.items()))
+
+def _attach_script_context(thread):
+    # Outside a Streamlit script run (e.g. tests) there is no context to attach
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+    ctx = get_script_run_ctx(suppress_warning=True)
+    if ctx is not None:
+        add_script_run_ctx(thread, ctx)
+
+def start_warmup():
+    """
+    Start the background warm-up unless it already ran in this process or
+    EMI_WARMUP=off; returns the warm-up thread or None
+    Call it from a Streamlit script, whose run context the thread inherits
+    """
+    global _thread
+    if warmup_mode() == 'off':
+        return None
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_warm, name='warmup', daemon=True)
+            _attach_script_context(_thread)
+            _thread.start()
+    return _thread
+
+def warmup_status():
+    """
+    'off', 'idle', 'running', 'done' or 'failed', with per-step seconds
+    """
+    if warmup_mode() == 'off':
+        state = 'off'
+    elif _thread is None:
+        state = 'idle'
+    elif _thread.is_alive():
+        state = 'running'
+    else:
+        state = 'failed' if _error is not None else 'done'
+    return {'state': state, 'timings': dict(_timings)}